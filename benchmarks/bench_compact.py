@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from dp import AreaOfStudy
+from dp.audit import audit, ResultMsg
+from dp.compact import compact_result, expand_result
+from dp.data import course_from_str, Student
+
+
+def make_result():
+    requirements = {
+        f"Req {i}": {
+            "result": {
+                "from": "courses",
+                "where": {"subject": {"$eq": f"DEPT{i}"}},
+                "assert": {"count(courses)": {"$gte": 2}},
+            },
+        }
+        for i in range(6)
+    }
+
+    spec = {
+        "name": "Benchmark",
+        "type": "major",
+        "code": "140",
+        "degree": "B.A.",
+        "result": {"all": [{"requirement": name} for name in requirements]},
+        "requirements": requirements,
+    }
+
+    courses = [course_from_str(f"DEPT{i} {n}") for i in range(6) for n in (121, 232)]
+    student = Student.load(dict(courses=courses), code='140')
+    area = AreaOfStudy.load(specification=spec, c=student.constants(), student=student)
+
+    results = [msg.result for msg in audit(area=area, student=student) if isinstance(msg, ResultMsg)]
+    return json.loads(json.dumps(results[0].to_dict()))
+
+
+@pytest.fixture(scope="module")
+def result():
+    return make_result()
+
+
+@pytest.mark.benchmark(group="result-encoding")
+def test_encode__json(benchmark, result):
+    encoded = benchmark(lambda: json.dumps(result))
+    benchmark.extra_info['bytes'] = len(encoded)
+
+
+@pytest.mark.benchmark(group="result-encoding")
+def test_encode__compact(benchmark, result):
+    encoded = benchmark(lambda: json.dumps(compact_result(result)))
+    benchmark.extra_info['bytes'] = len(encoded)
+    benchmark.extra_info['ratio'] = len(encoded) / len(json.dumps(result))
+
+
+@pytest.mark.benchmark(group="result-decoding")
+def test_expand__compact(benchmark, result):
+    encoded = json.dumps(compact_result(result))
+    assert benchmark(lambda: expand_result(json.loads(encoded))) == result
@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+from dp.server.audit import ResultRow
+from dp.server.writer import ResultWriter, WriteJob, save_results
+
+# how long the stand-in database takes to answer each statement, in seconds
+ROUND_TRIP = 0.002
+BATCHES = 50
+BATCH_SIZE = 4
+
+
+class FakeConnection:
+    encoding = 'UTF8'
+
+    def cursor(self) -> 'FakeCursor':
+        return FakeCursor(self)
+
+
+class FakeCursor:
+    """Enough of a psycopg2 cursor for insert_results and the queue SQL,
+    where every statement costs one network round-trip."""
+
+    def __init__(self, connection: FakeConnection) -> None:
+        self.connection = connection
+        self.statements = 0
+
+    def __enter__(self) -> 'FakeCursor':
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        pass
+
+    def mogrify(self, template: bytes, args: object) -> bytes:
+        return repr(args).encode('utf-8')
+
+    def execute(self, query: object, params: object = None) -> None:
+        self.statements += 1
+        time.sleep(ROUND_TRIP)
+
+
+def fake_audit(n: int) -> ResultRow:
+    # stand in for a short, CPU-bound audit
+    total = 0
+    for i in range(20_000):
+        total += i * i
+
+    return ResultRow(student_id=str(n), area_code='140', catalog='2019-20', run=1, input_data='{}', iterations=total)
+
+
+def audit_batches(save) -> None:
+    for batch in range(BATCHES):
+        rows = [fake_audit(batch * BATCH_SIZE + i) for i in range(BATCH_SIZE)]
+        save(WriteJob(rows=rows, queue_ids=list(range(BATCH_SIZE)), leased_by=1))
+
+
+def write_inline() -> None:
+    curs = FakeConnection().cursor()
+    audit_batches(lambda job: save_results(curs, [job]))
+
+
+def write_behind() -> None:
+    writer = ResultWriter(connect=FakeConnection).start()
+    audit_batches(writer.submit)
+    writer.close()
+    assert writer.rows_written == BATCHES * BATCH_SIZE
+
+
+@pytest.mark.benchmark(group="result-writer")
+def test_result_writer__inline(benchmark):
+    benchmark.pedantic(write_inline, rounds=3, iterations=1)
+
+
+@pytest.mark.benchmark(group="result-writer")
+def test_result_writer__write_behind(benchmark):
+    benchmark.pedantic(write_behind, rounds=3, iterations=1)
@@ -0,0 +1,61 @@
+import subprocess
+import json
+import sys
+import os
+
+import pytest
+
+from tests.test_checkpoint import specification, rows
+
+# The cumulative import time of each entry point (in microseconds, as reported
+# by `python -X importtime`) must stay under this budget. Override it with
+# DP_STARTUP_BUDGET_US on slower machines.
+STARTUP_BUDGET_US = int(os.getenv('DP_STARTUP_BUDGET_US', '300000'))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_time(module: str) -> int:
+    """Returns the cumulative time taken to import `module` in a fresh
+    interpreter, in microseconds."""
+
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True,
+    )
+
+    for line in reversed(proc.stderr.splitlines()):
+        _self, cumulative, name = line.split('|')
+        if name.strip() == module:
+            return int(cumulative)
+
+    raise ValueError(f'{module} not found in the -X importtime output')
+
+
+def fastest_import_time(module: str, *, runs: int = 5) -> int:
+    # take the fastest run, to keep scheduler noise out of the budget check
+    return min(import_time(module) for _ in range(runs))
+
+
+@pytest.mark.benchmark(group="startup")
+@pytest.mark.parametrize("module", ["dp.__main__", "dp.bin.batch", "dp.testbed.__main__"])
+def test_startup__import_time(benchmark, module):
+    elapsed = benchmark.pedantic(fastest_import_time, args=(module,), rounds=1, iterations=1)
+    assert elapsed < STARTUP_BUDGET_US, f'importing {module} took {elapsed:,}µs (budget: {STARTUP_BUDGET_US:,}µs)'
+
+
+@pytest.mark.benchmark(group="startup")
+def test_startup__estimate(benchmark, tmp_path):
+    student_file = tmp_path / 'student.json'
+    student_file.write_text(json.dumps({"stnum": "1", "courses": rows}))
+
+    # JSON is also YAML, so the specification is written as it is
+    area_file = tmp_path / 'area.yaml'
+    area_file.write_text(json.dumps(specification))
+
+    command = [sys.executable, '-m', 'dp', '--estimate', '--quiet', '--student', str(student_file), '--area', str(area_file)]
+
+    def run() -> None:
+        subprocess.run(command, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+
+    benchmark.pedantic(run, rounds=5, iterations=1)
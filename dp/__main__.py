@@ -6,22 +6,20 @@ import logging
 import json
 import sys
 import os
-import dotenv
 from collections import defaultdict
 
 from dp.run import run, load_students, load_areas
 from dp.ms import pretty_ms
-from dp.stringify import summarize
-from dp.stringify_csv import to_csv
-from dp.audit import EstimateMsg, ResultMsg, NoAuditsCompletedMsg, ProgressMsg, Arguments
-
-dotenv.load_dotenv(verbose=False)
+from dp.audit import EstimateMsg, ResultMsg, NoAuditsCompletedMsg, ProgressMsg, CheckpointMsg, Arguments
 
 logger = logging.getLogger(__name__)
 logformat = "%(asctime)s %(name)s %(levelname)s %(message)s"
 
 
 def main() -> int:  # noqa: C901
+    import dotenv
+    dotenv.load_dotenv(verbose=False)
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--area", dest="area_file")
     parser.add_argument("--student", dest="student_file")
@@ -30,7 +28,10 @@ def main() -> int:  # noqa: C901
     parser.add_argument("--csv", action='store_true')
     parser.add_argument("--print-all", action='store_true')
     parser.add_argument("--stop-after", action='store', type=int)
-    parser.add_argument("--progress-every", action='store', type=int, default=1_000)
+    parser.add_argument("--progress-every", action='store', type=int, help="report progress every N iterations, instead of every --progress-interval seconds")
+    parser.add_argument("--progress-interval", action='store', type=float, default=1.0, help="report progress every N seconds")
+    parser.add_argument("--checkpoint-dir", action='store', help="save the audit's place in this directory, and resume an interrupted audit of the same inputs from it")
+    parser.add_argument("--checkpoint-interval", action='store', type=float, default=60.0, help="save the audit's place every N seconds")
     parser.add_argument("--estimate", action='store_true')
     parser.add_argument("--transcript", action='store_true')
     parser.add_argument("--gpa", action='store_true')
@@ -56,9 +57,12 @@ def main() -> int:  # noqa: C901
         gpa_only=cli_args.gpa,
         print_all=cli_args.print_all,
         progress_every=cli_args.progress_every,
+        progress_interval=cli_args.progress_interval,
         stop_after=cli_args.stop_after,
         transcript_only=cli_args.transcript,
         estimate_only=cli_args.estimate,
+        checkpoint_dir=cli_args.checkpoint_dir,
+        checkpoint_interval=cli_args.checkpoint_interval if cli_args.checkpoint_dir else None,
     )
 
     if has_tracemalloc:
@@ -85,6 +89,9 @@ def main() -> int:  # noqa: C901
             if not cli_args.quiet:
                 print(f"{msg.estimate:,} estimated solution{'s' if msg.estimate != 1 else ''}", file=sys.stderr)
 
+        elif isinstance(msg, CheckpointMsg):
+            pass
+
         elif isinstance(msg, ProgressMsg):
             if (cli_args.tracemalloc_init and first_progress_message) or cli_args.tracemalloc_each:
                 snapshot = tracemalloc.take_snapshot()
@@ -147,11 +154,14 @@ def result_str(
     dict_result = msg.result.to_dict()
 
     if as_csv:
+        from dp.stringify_csv import to_csv
         return to_csv(dict_result, transcript=msg.transcript)
 
     if as_json:
         return json.dumps(dict_result)
 
+    from dp.stringify import summarize
+
     dict_result = json.loads(json.dumps(dict_result))
 
     return "\n" + "".join(summarize(
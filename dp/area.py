@@ -1,14 +1,15 @@
 import attr
 from typing import Dict, List, Set, FrozenSet, Tuple, Optional, Sequence, Iterator, Iterable, Any, TYPE_CHECKING
+import functools
 import logging
 import decimal
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 from .base import Solution, Result, Rule, Base, Summable
-from .constants import Constants
+from .constants import Constants, KnownConstants
 from .context import RequirementContext
 from .data import CourseInstance, AreaPointer, AreaType, Student
-from .exception import RuleException, InsertionException
+from .exception import RuleException, InsertionException, CourseOverrideException
 from .limit import LimitSet
 from .load_rule import load_rule
 from .result.count import CountResult
@@ -67,63 +68,65 @@ class AreaOfStudy(Base):
         exceptions: Sequence[RuleException] = tuple(),
         all_emphases: bool = False,
         emphasis_validity_check: bool = False,
+        check_emphases: bool = True,
     ) -> 'AreaOfStudy':
-        this_code = specification.get('code', '<null>')
-        pointers = {p.code: p for p in student.areas}
-        this_pointer = pointers.get(this_code, None)
-
-        emphases = specification.get('emphases', {})
-
-        # this block just does validity checking on the emphases; we don't
-        # actually use the result of loading these here.
-        for e in emphases.values():
-            r = AreaOfStudy.load(specification=e, c=c, student=student, emphasis_validity_check=True)
-            r.validate()
-
-        declared_emphasis_codes = set(str(a.code) for a in student.areas if a.kind is AreaType.Emphasis)
+        # callers that have already checked this specification's emphases
+        # (like the server's area cache) can skip re-checking them here
+        if check_emphases:
+            validate_emphases(specification, c=c, student=student)
 
         ctx = RequirementContext(
             areas=student.areas,
             exceptions=list(exceptions),
         ).with_transcript(student.courses)
 
-        result = load_rule(
-            data=specification["result"],
+        result, limit, multicountable = load_area_rules(
+            specification,
             c=c,
-            children=specification.get("requirements", {}),
-            emphases=[
-                v for k, v in emphases.items()
-                if str(k) in declared_emphasis_codes or all_emphases
-            ],
-            path=["$"],
             ctx=ctx,
+            emphasis_codes=selected_emphasis_codes(specification, student=student, all_emphases=all_emphases),
         )
-        assert result, TypeError(f'expected load_rule to process {specification["result"]}')
+
+        return AreaOfStudy.from_rules(
+            specification,
+            result=result,
+            limit=limit,
+            multicountable=multicountable,
+            student=student,
+            ctx=ctx,
+            emphasis_validity_check=emphasis_validity_check,
+        )
+
+    @staticmethod
+    def from_rules(
+        specification: Dict,
+        *,
+        result: Rule,
+        limit: LimitSet,
+        multicountable: Dict[str, List[Tuple[str, ...]]],
+        student: Student,
+        ctx: RequirementContext,
+        emphasis_validity_check: bool = False,
+    ) -> 'AreaOfStudy':
+        """Applies the per-student finishing steps to a loaded rule tree."""
+
+        this_code = specification.get('code', '<null>')
+        pointers = {p.code: p for p in student.areas}
+        this_pointer = pointers.get(this_code, None)
 
         # Automatically exclude any "required" courses
         excluded_clbids: FrozenSet[str] = frozenset()
         if not emphasis_validity_check:
             required_courses = result.get_required_courses(ctx=ctx)
             excluded_clbids = frozenset(c.clbid for c in required_courses)
-            result = result.exclude_required_courses(required_courses)
+
+            # with nothing to exclude, this would only copy the tree
+            if excluded_clbids:
+                result = result.exclude_required_courses(required_courses)
 
             excluded_idents = sorted(set(f"{crs.identity_}:{crs.clbid}" for crs in required_courses))
             logger.debug('excluding %s', excluded_idents)
 
-        limit = LimitSet.load(data=specification.get("limit", None), c=c)
-
-        multicountable_rules: Dict[str, List[Tuple[str, ...]]] = {
-            course: [
-                tuple(f"%{segment}" for segment in path)
-                for path in paths
-            ]
-            for course, paths in specification.get("multicountable", {}).items()
-        }
-
-        allowed_keys = {'name', 'type', 'major', 'degree', 'code', 'emphases', 'result', 'requirements', 'limit', 'multicountable'}
-        given_keys = set(specification.keys())
-        assert given_keys.difference(allowed_keys) == set(), f"expected set {given_keys.difference(allowed_keys)} to be empty (at ['$'])"
-
         dept = this_pointer.dept if this_pointer else None
         degree = specification.get('degree', None)
 
@@ -133,19 +136,62 @@ class AreaOfStudy(Base):
             degree=degree,
             dept=dept,
             result=result,
-            multicountable=multicountable_rules,
+            multicountable=multicountable,
             limit=limit,
             path=('$',),
             code=this_code,
             excluded_clbids=excluded_clbids,
-            common_rules=tuple(prepare_common_rules(
+            common_rules=prepare_common_rules(
                 other_areas=student.areas,
                 dept_code=dept,
                 degree=degree,
                 area_code=this_code,
-            ))
+            ),
         )
 
+    def relevant_clbids(self, *, student: Student, exceptions: Sequence[RuleException] = tuple()) -> FrozenSet[str]:
+        """Returns the clbids of every course that could affect an audit of
+        this area: those matched by any rule, limit, or (for majors) common
+        requirement, and those named by the area's exceptions.
+
+        Courses outside this set are never claimed or counted, so removing
+        them from the transcript doesn't change the audit's result. Degree
+        audits compute a GPA over the whole transcript, so for them, every
+        course is relevant."""
+
+        if self.kind == 'degree':
+            return frozenset(c.clbid for c in student.courses_with_failed)
+
+        forced_clbids = set(e.clbid for e in exceptions if isinstance(e, InsertionException) and e.forced is True)
+
+        ctx = RequirementContext(
+            areas=student.areas,
+            music_performances=student.music_performances,
+            music_attendances=student.music_recital_slips,
+            music_proficiencies=student.music_proficiencies,
+            exceptions=list(exceptions),
+            multicountable=self.multicountable,
+        ).with_transcript(
+            student.courses,
+            full=student.courses,
+            forced={c.clbid: c for c in student.courses if c.clbid in forced_clbids},
+            including_failed=student.courses_with_failed,
+        )
+
+        matches: List[Any] = list(self.result.all_matches(ctx=ctx))
+
+        for limit in self.limit.limits:
+            matches.extend(c for c in student.courses if limit.where.apply(c))
+
+        if self.kind == 'major':
+            for rule in self.common_rules:
+                matches.extend(rule.all_matches(ctx=ctx))
+
+        clbids = set(c.clbid for c in matches if isinstance(c, CourseInstance))
+        clbids.update(e.clbid for e in exceptions if isinstance(e, (InsertionException, CourseOverrideException)))
+
+        return frozenset(clbids)
+
     def validate(self) -> None:
         ctx = RequirementContext()
 
@@ -166,6 +212,10 @@ class AreaOfStudy(Base):
             multicountable=self.multicountable,
         )
 
+        # shared by every solution, so that the common major requirements
+        # are only audited once per distinct set of claimed courses
+        common_requirements = CommonRequirementsCache()
+
         for limited_transcript in self.limit.limited_transcripts(courses=student.courses):
             logger.debug("%s evaluating area.result with limited transcript", limited_transcript)
 
@@ -183,7 +233,7 @@ class AreaOfStudy(Base):
                 # generating a full list of all solutions and then iterating
                 # over that will accidentally share state.
 
-                yield AreaSolution.from_area(solution=sol, area=self, ctx=ctx)
+                yield AreaSolution.from_area(solution=sol, area=self, ctx=ctx, common_requirements=common_requirements)
 
                 # We need to clear the list of claims at the end of the loop,
                 # or else we accidentally clear the independently-solved claims
@@ -219,13 +269,33 @@ class AreaOfStudy(Base):
         return acc
 
 
+@attr.s(slots=True, kw_only=True, auto_attribs=True)
+class CommonRequirementsCache:
+    """Memoizes the common major requirements across the solutions of an area.
+
+    The C-or-better and S/U rules only look at the claimed courses, and the
+    outside-the-major rule looks at the whole transcript, which doesn't change
+    between solutions."""
+
+    max_size: int = 4096
+    by_claimed: Dict[FrozenSet[str], Tuple[Result, Result]] = attr.Factory(dict)
+    outside_the_major: Optional[Tuple[Optional[Result]]] = None
+
+
 @attr.s(cache_hash=True, slots=True, kw_only=True, frozen=True, auto_attribs=True)
 class AreaSolution(AreaOfStudy):
     solution: Solution
     context: RequirementContext
+    common_requirements: CommonRequirementsCache = attr.ib(factory=CommonRequirementsCache, eq=False, repr=False)
 
     @staticmethod
-    def from_area(*, area: AreaOfStudy, solution: Solution, ctx: RequirementContext) -> 'AreaSolution':
+    def from_area(
+        *,
+        area: AreaOfStudy,
+        solution: Solution,
+        ctx: RequirementContext,
+        common_requirements: Optional[CommonRequirementsCache] = None,
+    ) -> 'AreaSolution':
         return AreaSolution(
             name=area.name,
             kind=area.kind,
@@ -240,6 +310,7 @@ class AreaSolution(AreaOfStudy):
             context=ctx,
             common_rules=area.common_rules,
             excluded_clbids=area.excluded_clbids,
+            common_requirements=common_requirements or CommonRequirementsCache(),
         )
 
     def audit(self) -> 'AreaResult':
@@ -260,20 +331,40 @@ class AreaSolution(AreaOfStudy):
         # unclaimed = list(set(self.context.transcript()) - claimed)
         # unclaimed_context = RequirementContext().with_transcript(unclaimed)
         fresh_context = self.context.with_empty_claims()
-        whole_context = fresh_context.with_transcript(fresh_context.transcript_with_excluded())
-        claimed_context = fresh_context.with_transcript(claimed)
+        cache = self.common_requirements
+
+        claimed_key = frozenset(c.clbid for c in claimed)
+        claimed_results = cache.by_claimed.get(claimed_key, None)
+        if claimed_results is None:
+            # in a fixed order, so that the memoized result doesn't depend on
+            # which solution happened to claim these courses first; force-inserted
+            # courses may be claimed without being in the (limited) transcript
+            claimed_context = fresh_context.with_transcript(sorted(claimed, key=lambda c: c.sort_order()))
 
-        c_or_better = find_best_solution(rule=self.common_rules[0], ctx=claimed_context)
-        assert c_or_better is not None, TypeError('no solutions found for c_or_better rule')
+            c_or_better = find_best_solution(rule=self.common_rules[0], ctx=claimed_context)
+            assert c_or_better is not None, TypeError('no solutions found for c_or_better rule')
 
-        s_u_credits = find_best_solution(rule=self.common_rules[1], ctx=claimed_context)
-        assert s_u_credits is not None, TypeError('no solutions found for s_u_credits rule')
+            s_u_credits = find_best_solution(rule=self.common_rules[1], ctx=claimed_context)
+            assert s_u_credits is not None, TypeError('no solutions found for s_u_credits rule')
 
-        try:
-            outside_the_major = find_best_solution(rule=self.common_rules[2], ctx=whole_context)
-            assert outside_the_major is not None, TypeError('no solutions found for outside_the_major rule')
-        except IndexError:
-            outside_the_major = None
+            if len(cache.by_claimed) >= cache.max_size:
+                cache.by_claimed.clear()
+            cache.by_claimed[claimed_key] = (c_or_better, s_u_credits)
+        else:
+            c_or_better, s_u_credits = claimed_results
+
+        if cache.outside_the_major is None:
+            whole_context = fresh_context.with_transcript(fresh_context.transcript_with_excluded())
+
+            try:
+                outside_result = find_best_solution(rule=self.common_rules[2], ctx=whole_context)
+                assert outside_result is not None, TypeError('no solutions found for outside_the_major rule')
+            except IndexError:
+                outside_result = None
+
+            cache.outside_the_major = (outside_result,)
+
+        outside_the_major = cache.outside_the_major[0]
 
         items = [c_or_better, s_u_credits]
         if outside_the_major is not None:
@@ -371,12 +462,259 @@ class AreaResult(AreaOfStudy, Result):
         return self.result.was_overridden()
 
 
+@attr.s(slots=True, kw_only=True, auto_attribs=True)
+class AreaTemplate:
+    """The student-independent part of loading an area.
+
+    Most of an area's rule tree doesn't depend on the student being audited.
+    The exceptions are conditional requirements and clauses (`if:`, `$if`,
+    `$ifs`), insertions into count rules, the declared emphases, and any
+    constants (`$matriculation-year`, etc) used in the specification.
+
+    A template loads the rule tree once per combination of the constants it
+    uses and the emphases being audited, and reuses it for every student
+    that matches. Specifications with conditionals, and students with
+    insertions into count rules, are loaded from scratch as before."""
+
+    specification: Dict
+    constants: Tuple[KnownConstants, ...]
+    is_conditional: bool
+    max_variants: int = 32
+    variants: 'OrderedDict[Tuple, Tuple[Rule, LimitSet, Dict[str, List[Tuple[str, ...]]]]]' = attr.Factory(OrderedDict)
+
+    @staticmethod
+    def compile(specification: Dict, *, check_emphases: bool = True) -> 'AreaTemplate':
+        if check_emphases:
+            validate_emphases(specification, c=Constants())
+
+        constants: Set[KnownConstants] = set()
+        is_conditional = False
+
+        for key, value in walk_specification(specification):
+            if key in ('if', '$if', '$ifs'):
+                is_conditional = True
+            if isinstance(value, str) and value in KNOWN_CONSTANT_NAMES:
+                constants.add(KnownConstants(value))
+
+        return AreaTemplate(
+            specification=specification,
+            constants=tuple(sorted(constants, key=lambda k: k.value)),
+            is_conditional=is_conditional,
+        )
+
+    def specialize(
+        self,
+        *,
+        c: Constants,
+        student: Student = Student(),
+        exceptions: Sequence[RuleException] = tuple(),
+        all_emphases: bool = False,
+    ) -> 'AreaOfStudy':
+        """Produces the same AreaOfStudy as AreaOfStudy.load would, reusing
+        a previously-loaded rule tree when possible."""
+
+        inserts_into_counts = any(
+            isinstance(e, InsertionException) and e.path and e.path[-1] == '.count'
+            for e in exceptions
+        )
+
+        if self.is_conditional or inserts_into_counts:
+            return AreaOfStudy.load(
+                specification=self.specification,
+                c=c,
+                student=student,
+                exceptions=exceptions,
+                all_emphases=all_emphases,
+                check_emphases=False,
+            )
+
+        emphasis_codes = selected_emphasis_codes(self.specification, student=student, all_emphases=all_emphases)
+        key = (tuple(c.get_by_name(k.value) for k in self.constants), emphasis_codes)
+
+        loaded = self.variants.get(key, None)
+        if loaded is None:
+            loaded = load_area_rules(self.specification, c=c, ctx=RequirementContext(), emphasis_codes=emphasis_codes)
+            self.variants[key] = loaded
+            while len(self.variants) > self.max_variants:
+                self.variants.popitem(last=False)
+        else:
+            self.variants.move_to_end(key)
+
+        result, limit, multicountable = loaded
+
+        ctx = RequirementContext(
+            areas=student.areas,
+            exceptions=list(exceptions),
+        ).with_transcript(student.courses)
+
+        return AreaOfStudy.from_rules(
+            self.specification,
+            result=result,
+            limit=limit,
+            multicountable=multicountable,
+            student=student,
+            ctx=ctx,
+        )
+
+
+KNOWN_CONSTANT_NAMES = frozenset(k.value for k in KnownConstants)
+
+# templates are cached by the identity of their specification; each entry
+# holds a reference to its specification, so the id can't be reused while
+# the entry exists
+_templates: 'OrderedDict[int, AreaTemplate]' = OrderedDict()
+MAX_TEMPLATES = 256
+
+
+def area_template(specification: Dict, *, check_emphases: bool = True) -> AreaTemplate:
+    """Returns the (cached) template for an area specification.
+
+    Callers that load the same specification object repeatedly, like the
+    server's area cache, reuse the template across audits."""
+
+    template = _templates.get(id(specification), None)
+    if template is not None and template.specification is specification:
+        _templates.move_to_end(id(specification))
+        return template
+
+    template = AreaTemplate.compile(specification, check_emphases=check_emphases)
+
+    _templates[id(specification)] = template
+    while len(_templates) > MAX_TEMPLATES:
+        _templates.popitem(last=False)
+
+    return template
+
+
+def walk_specification(data: Any) -> Iterator[Tuple[Optional[str], Any]]:
+    """Yields every (key, value) pair in a specification, recursively.
+    List items are yielded with a key of None.
+
+    >>> list(walk_specification({'a': [1, {'b': 2}]}))
+    [('a', [1, {'b': 2}]), (None, 1), (None, {'b': 2}), ('b', 2)]
+    """
+
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield key, value
+            yield from walk_specification(value)
+    elif isinstance(data, list):
+        for value in data:
+            yield None, value
+            yield from walk_specification(value)
+
+
+def selected_emphasis_codes(specification: Dict, *, student: Student, all_emphases: bool = False) -> FrozenSet[str]:
+    """Finds the codes of the emphases in this area which should be audited
+    alongside it: either those the student has declared, or all of them."""
+
+    declared_emphasis_codes = set(str(a.code) for a in student.areas if a.kind is AreaType.Emphasis)
+
+    return frozenset(
+        str(k) for k in specification.get('emphases', {}).keys()
+        if str(k) in declared_emphasis_codes or all_emphases
+    )
+
+
+def load_area_rules(
+    specification: Dict,
+    *,
+    c: Constants,
+    ctx: RequirementContext,
+    emphasis_codes: FrozenSet[str],
+) -> Tuple[Rule, LimitSet, Dict[str, List[Tuple[str, ...]]]]:
+    """Loads the rule tree, limits, and multicountable rules of an area."""
+
+    emphases = specification.get('emphases', {})
+
+    result = load_rule(
+        data=specification["result"],
+        c=c,
+        children=specification.get("requirements", {}),
+        emphases=[v for k, v in emphases.items() if str(k) in emphasis_codes],
+        path=["$"],
+        ctx=ctx,
+    )
+    assert result, TypeError(f'expected load_rule to process {specification["result"]}')
+
+    limit = LimitSet.load(data=specification.get("limit", None), c=c)
+
+    multicountable_rules: Dict[str, List[Tuple[str, ...]]] = {
+        course: [
+            tuple(f"%{segment}" for segment in path)
+            for path in paths
+        ]
+        for course, paths in specification.get("multicountable", {}).items()
+    }
+
+    allowed_keys = {'name', 'type', 'major', 'degree', 'code', 'emphases', 'result', 'requirements', 'limit', 'multicountable'}
+    given_keys = set(specification.keys())
+    assert given_keys.difference(allowed_keys) == set(), f"expected set {given_keys.difference(allowed_keys)} to be empty (at ['$'])"
+
+    return result, limit, multicountable_rules
+
+
+def validate_emphases(specification: Dict, *, c: Constants, student: Student = Student()) -> None:
+    """Loads and validates each emphasis in an area specification.
+
+    We don't actually use the result of loading these; this only does
+    validity checking."""
+
+    for e in specification.get('emphases', {}).values():
+        r = AreaOfStudy.load(specification=e, c=c, student=student, emphasis_validity_check=True)
+        r.validate()
+
+
 def prepare_common_rules(
     *,
     degree: Optional[str],
     dept_code: Optional[str],
     other_areas: Tuple[AreaPointer, ...] = tuple(),
     area_code: str,
+) -> Tuple[Rule, ...]:
+    """Returns the common major requirements for this area.
+
+    They only depend on a few values, so we load each variation once and
+    share the (immutable) rules between audits."""
+
+    other_area_codes = set(p.code for p in other_areas if p.code != area_code)
+
+    studio_art_code = '140'
+    art_history_code = '135'
+    is_history_and_studio = \
+        (area_code == studio_art_code and art_history_code in other_area_codes)\
+        or (area_code == art_history_code and studio_art_code in other_area_codes)
+
+    return load_common_rules(
+        degree=degree,
+        dept_code=dept_code,
+        area_code=area_code,
+        is_history_and_studio=is_history_and_studio,
+    )
+
+
+@functools.lru_cache(maxsize=1024)
+def load_common_rules(
+    *,
+    degree: Optional[str],
+    dept_code: Optional[str],
+    area_code: str,
+    is_history_and_studio: bool,
+) -> Tuple[Rule, ...]:
+    return tuple(generate_common_rules(
+        degree=degree,
+        dept_code=dept_code,
+        area_code=area_code,
+        is_history_and_studio=is_history_and_studio,
+    ))
+
+
+def generate_common_rules(
+    *,
+    degree: Optional[str],
+    dept_code: Optional[str],
+    area_code: str,
+    is_history_and_studio: bool,
 ) -> Iterator[Rule]:
     c = Constants(matriculation_year=0)
 
@@ -459,14 +797,6 @@ def prepare_common_rules(
     yield s_u_credits
 
     if is_bm_major is False:
-        other_area_codes = set(p.code for p in other_areas if p.code != area_code)
-
-        studio_art_code = '140'
-        art_history_code = '135'
-        is_history_and_studio = \
-            (area_code == studio_art_code and art_history_code in other_area_codes)\
-            or (area_code == art_history_code and studio_art_code in other_area_codes)
-
         ba_music_code = '450'
         is_ba_music = area_code == ba_music_code
 
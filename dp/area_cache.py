@@ -0,0 +1,58 @@
+from typing import Dict, Tuple
+from collections import OrderedDict
+import logging
+import os
+
+import attr
+
+from .area import validate_emphases
+from .constants import Constants
+from .fingerprint import json_fingerprint
+from .run import load_areas
+
+logger = logging.getLogger(__name__)
+
+
+@attr.s(slots=True, kw_only=True, auto_attribs=True)
+class AreaSpecCache:
+    """A bounded LRU cache of parsed area specifications, keyed by path.
+
+    Entries are reloaded when the file's modification time changes. Each
+    specification's emphases are checked once, when the file is loaded, so
+    audits using cached specifications can skip that step."""
+
+    maxsize: int = 256
+    hits: int = 0
+    misses: int = 0
+    entries: 'OrderedDict[str, Tuple[int, Dict, str]]' = attr.Factory(OrderedDict)
+
+    def load(self, path: str) -> Dict:
+        spec, _ = self.load_with_fingerprint(path)
+        return spec
+
+    def load_with_fingerprint(self, path: str) -> Tuple[Dict, str]:
+        """Returns the specification, along with a hash of its contents."""
+
+        mtime = os.stat(path).st_mtime_ns
+
+        entry = self.entries.get(path, None)
+        if entry is not None and entry[0] == mtime:
+            self.entries.move_to_end(path)
+            self.hits += 1
+            return entry[1], entry[2]
+
+        self.misses += 1
+
+        spec = load_areas(path)[0]
+        validate_emphases(spec, c=Constants())
+
+        fingerprint = json_fingerprint(spec)
+
+        self.entries[path] = (mtime, spec, fingerprint)
+        self.entries.move_to_end(path)
+
+        while len(self.entries) > self.maxsize:
+            evicted, _ = self.entries.popitem(last=False)
+            logger.debug("evicted %s from the area cache", evicted)
+
+        return spec, fingerprint
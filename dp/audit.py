@@ -1,12 +1,14 @@
 import attr
 from typing import List, Optional, Tuple, Iterator, Union, Dict
 from decimal import Decimal
+import itertools
 import time
 
 from .constants import Constants
 from .exception import RuleException
-from .area import AreaOfStudy, AreaResult
+from .area import AreaOfStudy, AreaResult, AreaSolution
 from .data import CourseInstance, Student
+from .checkpoint import Checkpoint
 
 
 @attr.s(slots=True, kw_only=True, auto_attribs=True)
@@ -17,7 +19,25 @@ class Arguments:
 
     print_all: bool = False
     stop_after: Optional[int] = None
-    progress_every: int = 1_000
+
+    # progress is reported every `progress_interval` seconds, or, if
+    # `progress_every` is set, every `progress_every` iterations instead
+    progress_interval: float = 1.0
+    progress_every: Optional[int] = None
+
+    # a directory in which to cache loaded students between runs
+    student_cache: Optional[str] = None
+
+    # set to False when the area specification's emphases have already been
+    # checked, as by the server's area cache
+    check_emphases: bool = True
+
+    # a checkpoint is yielded every `checkpoint_interval` seconds, or every
+    # `checkpoint_every` iterations; with neither, none are. run() saves
+    # them in, and resumes from, `checkpoint_dir` (see dp.checkpoint)
+    checkpoint_interval: Optional[float] = None
+    checkpoint_every: Optional[int] = None
+    checkpoint_dir: Optional[str] = None
 
 
 @attr.s(slots=True, kw_only=True, auto_attribs=True)
@@ -39,6 +59,11 @@ class EstimateMsg:
     estimate: int
 
 
+@attr.s(slots=True, kw_only=True, auto_attribs=True)
+class CheckpointMsg:
+    checkpoint: Checkpoint
+
+
 @attr.s(slots=True, kw_only=True, auto_attribs=True)
 class ProgressMsg:
     best_rank: Union[int, Decimal]
@@ -48,6 +73,7 @@ class ProgressMsg:
 
 
 Message = Union[
+    CheckpointMsg,
     EstimateMsg,
     NoAuditsCompletedMsg,
     ProgressMsg,
@@ -55,7 +81,19 @@ Message = Union[
 ]
 
 
-def audit(*, area: AreaOfStudy, student: Student, args: Optional[Arguments] = None, exceptions: Optional[List[RuleException]] = None) -> Iterator[Message]:
+def audit(
+    *,
+    area: AreaOfStudy,
+    student: Student,
+    args: Optional[Arguments] = None,
+    exceptions: Optional[List[RuleException]] = None,
+    resume: Optional[Checkpoint] = None,
+) -> Iterator[Message]:
+    """Searches the area's solutions for the best one.
+
+    `resume` continues the search from a checkpoint yielded by an earlier
+    call with the same arguments."""
+
     if not args:
         args = Arguments()
 
@@ -64,6 +102,10 @@ def audit(*, area: AreaOfStudy, student: Student, args: Optional[Arguments] = No
 
     best_sol: Optional[AreaResult] = None
     best_rank: Union[int, Decimal] = 0
+    best_iter = 0
+
+    resumed_iters = resume.iters if resume else 0
+    resumed_ms = resume.elapsed_ms if resume else 0.0
 
     estimate = area.estimate(student=student, exceptions=exceptions or [])
     yield EstimateMsg(estimate=estimate)
@@ -71,31 +113,49 @@ def audit(*, area: AreaOfStudy, student: Student, args: Optional[Arguments] = No
     if args.estimate_only:
         return
 
-    for sol in area.solutions(student=student, exceptions=exceptions or []):
-        if total_count == 0:
-            # ignore startup time
+    progress = ProgressClock(interval=args.progress_interval, every=args.progress_every)
+
+    checkpoints = checkpoint_clock(args)
+
+    solutions = iter(area.solutions(student=student, exceptions=exceptions or []))
+
+    if resume is not None:
+        best_sol, best_rank = replay_to_checkpoint(solutions, resume)
+        total_count, best_iter = resume.iters, resume.best_iter
+
+    for sol in solutions:
+        if total_count == resumed_iters:
+            # ignore startup time, including the time spent catching up to a checkpoint
             start = time.perf_counter()
+            progress.start(start)
+            if checkpoints is not None:
+                checkpoints.start(start)
 
         total_count += 1
 
         result = sol.audit()
         result_rank = result.rank()
 
-        # if this is the first solution, store it, because it's the best so far
-        if best_sol is None:
-            best_sol, best_rank = result, result_rank
-
-        # if the current solution is better, then store it
-        if result_rank > best_rank:
-            best_sol, best_rank = result, result_rank
+        # if this is the first solution, or the current solution is better,
+        # then store it
+        if best_sol is None or result_rank > best_rank:
+            best_sol, best_rank, best_iter = result, result_rank, total_count
 
         # if the current solution is OK, then store it, and end the loop
         if result.ok():
             best_sol, best_rank = result, result_rank
             break
 
-        if total_count % args.progress_every == 0:
-            elapsed_ms = ms_since(start)
+        # the clocks time the iterations of this call, not the resumed ones
+        if checkpoints is not None and checkpoints.is_due(total_count - resumed_iters):
+            yield CheckpointMsg(checkpoint=Checkpoint(
+                iters=total_count,
+                best_iter=best_iter,
+                elapsed_ms=ms_since(start) + resumed_ms,
+            ))
+
+        if progress.is_due(total_count - resumed_iters):
+            elapsed_ms = ms_since(start) + resumed_ms
             yield ProgressMsg(
                 best_rank=best_rank,
                 iters=total_count,
@@ -104,7 +164,7 @@ def audit(*, area: AreaOfStudy, student: Student, args: Optional[Arguments] = No
             )
 
         if args.print_all:
-            elapsed_ms = ms_since(start)
+            elapsed_ms = ms_since(start) + resumed_ms
             yield ResultMsg(
                 result=result,
                 transcript=student.courses,
@@ -120,7 +180,7 @@ def audit(*, area: AreaOfStudy, student: Student, args: Optional[Arguments] = No
         yield NoAuditsCompletedMsg()
         return
 
-    elapsed_ms = ms_since(start)
+    elapsed_ms = ms_since(start) + resumed_ms
     yield ResultMsg(
         result=best_sol,
         transcript=student.courses,
@@ -130,6 +190,72 @@ def audit(*, area: AreaOfStudy, student: Student, args: Optional[Arguments] = No
     )
 
 
+def checkpoint_clock(args: Arguments) -> Optional['ProgressClock']:
+    if args.checkpoint_interval is None and args.checkpoint_every is None:
+        return None
+
+    return ProgressClock(interval=args.checkpoint_interval or 0.0, every=args.checkpoint_every)
+
+
+def replay_to_checkpoint(solutions: Iterator[AreaSolution], checkpoint: Checkpoint) -> Tuple[Optional[AreaResult], Union[int, Decimal]]:
+    """Skips past the solutions that were checked before `checkpoint`, and
+    returns the best of them, checking only that one again."""
+
+    best: Optional[AreaResult] = None
+    for i, sol in enumerate(itertools.islice(solutions, checkpoint.iters), start=1):
+        if i == checkpoint.best_iter:
+            best = sol.audit()
+
+    return best, best.rank() if best is not None else 0
+
+
+@attr.s(slots=True, kw_only=True, auto_attribs=True)
+class ProgressClock:
+    """Decides when audit() should report progress.
+
+    Reading the clock after every solution would be wasteful on areas that
+    check millions of solutions, so the clock estimates how many iterations
+    will fit before the next report is due and doesn't look at the time
+    again until then."""
+
+    interval: float = 1.0
+    every: Optional[int] = None
+
+    started_at: float = 0.0
+    next_report_at: float = 0.0
+    next_check: int = 1
+
+    def start(self, now: float) -> None:
+        self.started_at = now
+        self.next_report_at = now + self.interval
+        self.next_check = 1
+
+    def is_due(self, iteration: int, *, now: Optional[float] = None) -> bool:
+        if self.every is not None:
+            return iteration % self.every == 0
+
+        if iteration < self.next_check:
+            return False
+
+        if now is None:
+            now = time.perf_counter()
+
+        due = now >= self.next_report_at
+        if due:
+            self.next_report_at = now + self.interval
+
+        # aim for the halfway point to the next report, so that a slowdown
+        # partway through doesn't delay it by much
+        per_iteration = (now - self.started_at) / iteration
+        if per_iteration > 0:
+            remaining = max(0.0, self.next_report_at - now)
+            self.next_check = iteration + max(1, int(remaining / per_iteration / 2))
+        else:
+            self.next_check = iteration + 1
+
+        return due
+
+
 def ms_since(start: float, *, now: Optional[float] = None) -> float:
     if now is None:
         now = time.perf_counter()
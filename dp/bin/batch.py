@@ -7,7 +7,8 @@ import sys
 import os
 
 from dp.ms import pretty_ms
-from dp.run import run, load_students, load_areas
+from dp.run import run, load_students
+from dp.area_cache import AreaSpecCache
 from dp.stringify import summarize
 from dp.audit import ResultMsg, EstimateMsg, NoAuditsCompletedMsg, ProgressMsg, Arguments
 
@@ -28,6 +29,7 @@ def main() -> int:  # noqa: C901
     parser.add_argument("--no-ranks", dest='show_ranks', action='store_const', const=False)
     parser.add_argument("--table", action='store_true')
     parser.add_argument("-n", default=1, type=int)
+    parser.add_argument("--student-cache", default=os.getenv('DP_STUDENT_CACHE'), help="a directory in which to cache loaded students between runs")
 
     cli_args = parser.parse_args()
 
@@ -41,18 +43,20 @@ def main() -> int:  # noqa: C901
     if cli_args.table:
         print('stnum,catalog,area_code,gpa,rank,max', flush=True)
 
+    area_cache = AreaSpecCache()
+
     for stnum, catalog, area_code in data:
         student_file = os.path.join(cli_args.dir, f"{stnum}.json")
         area_file = os.path.join(cli_args.areas_dir, catalog, f"{area_code}.yaml")
 
-        args = Arguments(print_all=False, transcript_only=cli_args.transcript)
+        args = Arguments(print_all=False, transcript_only=cli_args.transcript, student_cache=cli_args.student_cache, check_emphases=False)
 
         if cli_args.invocation:
             print(f"python3 dp.py --student '{student_file}' --area '{area_file}'")
             continue
 
         student = load_students(student_file)[0]
-        area_spec = load_areas(area_file)[0]
+        area_spec = area_cache.load(area_file)
 
         if not cli_args.quiet and not cli_args.table:
             print(f"auditing #{student['stnum']} against {area_file}", file=sys.stderr)
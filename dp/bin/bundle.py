@@ -0,0 +1,84 @@
+"""bundle
+
+Compiles every area file in an areas directory (laid out as
+<root>/<catalog>/<code>.yaml) into a single prebuilt bundle, which
+dp.run.load_areas, the testbed, and the server read instead of the YAML.
+
+Each area is validated before it is bundled; areas that fail validation are
+left out, so that loading them still falls back to (and fails on) the YAML.
+"""
+
+from typing import Tuple, Dict, Optional
+import concurrent.futures
+import traceback
+import argparse
+import pathlib
+import yaml
+import sys
+import os
+
+from dp import AreaOfStudy, Constants
+from dp.area import validate_emphases
+from dp.bundle import write_bundle, bundle_path_for
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("areas_dir", help="the root of the areas directory")
+    parser.add_argument("-o", "--output", help="where to write the bundle (default: $DP_AREA_BUNDLE, or areas.dpb inside the areas directory)")
+    parser.add_argument("-w", dest="workers", type=int, action="store", default=os.cpu_count())
+    args = parser.parse_args()
+
+    root = pathlib.Path(args.areas_dir)
+    output = args.output or bundle_path_for(str(root))
+
+    files = sorted(str(f) for f in root.glob('*/*.yaml'))
+
+    specs: Dict[str, Tuple[str, Dict]] = {}
+    failures = 0
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        future_to_file = {executor.submit(one, f): f for f in files}
+
+        for future in concurrent.futures.as_completed(future_to_file):
+            f = future_to_file[future]
+            try:
+                spec = future.result()
+            except Exception:
+                failures += 1
+                print(f'{f} generated an exception: {traceback.format_exc()}', file=sys.stderr)
+                continue
+
+            if spec is None:
+                continue
+
+            path = pathlib.Path(f)
+            specs[f"{path.parent.name}/{path.stem}"] = (f, spec)
+
+    count = write_bundle(output, ((key, f, spec) for key, (f, spec) in sorted(specs.items())))
+    print(f'bundled {count:,} areas into {output}')
+
+    if failures:
+        print(f'skipped {failures:,} invalid areas', file=sys.stderr)
+        return 1
+
+    return 0
+
+
+def one(f: str) -> Optional[Dict]:
+    with open(f, "r", encoding="utf-8") as infile:
+        area_def = yaml.load(stream=infile, Loader=yaml.SafeLoader)
+
+    if not isinstance(area_def, dict):
+        return None
+
+    c = Constants(matriculation_year=200)
+    validate_emphases(area_def, c=c)
+    area = AreaOfStudy.load(specification=area_def, c=c, check_emphases=False)
+    area.validate()
+
+    return area_def
+
+
+if __name__ == "__main__":
+    sys.exit(main())
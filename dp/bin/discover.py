@@ -1,7 +1,8 @@
-from typing import Iterator, Set, Any, List
+from typing import Iterator, Set, Any, List, Dict
 from pathlib import Path
 from collections import namedtuple
 import argparse
+import json
 import sys
 
 import yaml
@@ -20,6 +21,7 @@ except ImportError:
 from dp import AreaOfStudy, Constants
 from dp.base import Rule
 from dp.clause import AndClause, OrClause, Clause
+from dp.dependencies import AreaDependencies, find_dependencies
 from dp.rule.assertion import AssertionRule, ConditionalAssertionRule
 from dp.rule.course import CourseRule
 from dp.rule.count import CountRule
@@ -35,11 +37,13 @@ def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('files', nargs='+')
     parser.add_argument('--insert', default=False, action='store_true')
+    parser.add_argument('--dependencies', metavar='FILE', help="also write each area's dependency index (see dp.dependencies) to FILE, as JSON")
     args = parser.parse_args()
 
     files: List[str] = args.files
     courses: Set[CourseReference] = set()
     buckets: Set[BucketReference] = set()
+    dependencies: Dict[str, AreaDependencies] = {}
 
     for filepath in files:
         if not filepath.endswith('.yaml'):
@@ -58,6 +62,9 @@ def main() -> None:
 
         area = AreaOfStudy.load(specification=area_spec, c=Constants(), all_emphases=True)
 
+        if args.dependencies:
+            dependencies[f"{catalog}/{code}"] = find_dependencies(area_spec)
+
         for course in find_courses_in_rule(area.result):
             courses.add(CourseReference(code=code, course=course))
 
@@ -68,6 +75,10 @@ def main() -> None:
         for bucket in find_buckets_in_rule(area.result):
             buckets.add(BucketReference(code=code, catalog=catalog, bucket=bucket))
 
+    if args.dependencies:
+        with open(args.dependencies, "w", encoding="utf-8") as outfile:
+            json.dump({key: deps.to_dict() for key, deps in sorted(dependencies.items())}, outfile, indent=2)
+
     if args.insert:
         insert_to_db(courses=courses, buckets=buckets)
         print('inserted')
@@ -5,12 +5,12 @@ import os
 import sys
 from typing import Dict, Iterator, Tuple, Optional
 from os.path import abspath, join
-import dotenv
-
-dotenv.load_dotenv(verbose=True)
 
 
 def cli() -> None:
+    import dotenv
+    dotenv.load_dotenv(verbose=True)
+
     parser = argparse.ArgumentParser()
     parser.add_argument('student', help="use `-` to read from stdin")
     parser.add_argument('area_code', metavar='CODE', action='store', nargs='?', default=None)
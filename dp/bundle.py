@@ -0,0 +1,181 @@
+"""Prebuilt bundles of parsed area specifications.
+
+A bundle is a single file holding every area in an areas directory, already
+parsed, so that loaders can skip YAML parsing entirely. The layout is:
+
+    magic (8 bytes) | format version (u32) | index length (u32) | index | specs
+
+The index is JSON, and maps "catalog/code" keys to the offset (from the end
+of the index) and length of each pickled specification, along with the size
+and mtime of the source file it was built from. Entries whose source file has
+since changed are ignored, and the caller falls back to parsing the YAML.
+"""
+
+from typing import Dict, Optional, Iterator, Tuple, Any
+import logging
+import struct
+import pickle
+import json
+import mmap
+import os
+
+import attr
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'DPBUNDLE'
+FORMAT_VERSION = 1
+BUNDLE_FILENAME = 'areas.dpb'
+
+HEADER = struct.Struct('<8sII')
+
+
+@attr.s(slots=True, kw_only=True, auto_attribs=True)
+class BundleEntry:
+    offset: int
+    length: int
+    mtime_ns: int
+    size: int
+
+    def is_fresh(self, source: str) -> bool:
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return False
+
+        return stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.size
+
+
+@attr.s(slots=True, kw_only=True, auto_attribs=True)
+class AreaBundle:
+    path: str
+    mtime_ns: int
+    entries: Dict[str, BundleEntry]
+    data: mmap.mmap
+    base: int
+
+    @staticmethod
+    def open(path: str) -> Optional['AreaBundle']:
+        try:
+            with open(path, 'rb') as infile:
+                data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+                mtime_ns = os.fstat(infile.fileno()).st_mtime_ns
+        except (OSError, ValueError):
+            return None
+
+        if len(data) < HEADER.size:
+            logger.warning("ignoring truncated area bundle %s", path)
+            return None
+
+        magic, version, index_length = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            logger.warning("ignoring area bundle %s with format %r/%s (expected %r/%s)", path, magic, version, MAGIC, FORMAT_VERSION)
+            return None
+
+        index = json.loads(data[HEADER.size:HEADER.size + index_length].decode('utf-8'))
+
+        return AreaBundle(
+            path=path,
+            mtime_ns=mtime_ns,
+            entries={key: BundleEntry(**entry) for key, entry in index.items()},
+            data=data,
+            base=HEADER.size + index_length,
+        )
+
+    def get(self, key: str, *, source: Optional[str] = None) -> Optional[Dict]:
+        """Returns the specification stored under `key`, or None if the
+        bundle has no such entry, or if `source` has changed since the
+        bundle was built."""
+
+        entry = self.entries.get(key, None)
+        if entry is None:
+            return None
+
+        if source is not None and not entry.is_fresh(source):
+            logger.debug("bundle entry %s is stale; ignoring it", key)
+            return None
+
+        start = self.base + entry.offset
+        spec: Dict = pickle.loads(self.data[start:start + entry.length])
+        return spec
+
+
+_open_bundles: Dict[str, Optional[AreaBundle]] = {}
+
+
+def bundle_path_for(area_root: str) -> str:
+    return os.getenv('DP_AREA_BUNDLE') or os.path.join(area_root, BUNDLE_FILENAME)
+
+
+def get_bundle(path: str) -> Optional[AreaBundle]:
+    """Opens (and keeps open) the bundle at `path`, reopening it if the file
+    has been replaced."""
+
+    try:
+        mtime_ns: Optional[int] = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+
+    bundle = _open_bundles.get(path, None)
+    if bundle is not None and bundle.mtime_ns == mtime_ns:
+        return bundle
+
+    if mtime_ns is None:
+        _open_bundles.pop(path, None)
+        return None
+
+    bundle = AreaBundle.open(path)
+    _open_bundles[path] = bundle
+    return bundle
+
+
+def load_bundled_area(filename: str) -> Optional[Dict]:
+    """Looks up an area file (as "<root>/<catalog>/<code>.yaml") in the
+    bundle for its areas directory.
+
+    Returns None if there is no bundle, or if it doesn't have a fresh copy
+    of this file."""
+
+    catalog_dir, basename = os.path.split(os.path.abspath(filename))
+    code, _ = os.path.splitext(basename)
+    area_root, catalog = os.path.split(catalog_dir)
+
+    bundle = get_bundle(bundle_path_for(area_root))
+    if bundle is None:
+        return None
+
+    return bundle.get(f"{catalog}/{code}", source=filename)
+
+
+def write_bundle(path: str, specs: Iterator[Tuple[str, str, Any]]) -> int:
+    """Writes a bundle of (key, source filename, specification) tuples to
+    `path`. Returns the number of specifications written."""
+
+    payloads = []
+    index: Dict[str, Dict[str, int]] = {}
+
+    # offsets are relative to the end of the index
+    offset = 0
+    for key, source, spec in specs:
+        stat = os.stat(source)
+        payload = pickle.dumps(spec, protocol=pickle.HIGHEST_PROTOCOL)
+        index[key] = {
+            'offset': offset,
+            'length': len(payload),
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+        }
+        offset += len(payload)
+        payloads.append(payload)
+
+    encoded = json.dumps(index, sort_keys=True).encode('utf-8')
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as outfile:
+        outfile.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(encoded)))
+        outfile.write(encoded)
+        for payload in payloads:
+            outfile.write(payload)
+    os.replace(tmp_path, path)
+
+    return len(payloads)
@@ -0,0 +1,103 @@
+"""Saving the place of a long-running audit, so that it can pick up where it
+left off after being interrupted.
+
+The solutions of an area are always generated in the same order, so a place
+in the search is just a count of the solutions that have been checked. A
+checkpoint records that count, along with which of those solutions was the
+best so far, and how long the search had been running. To resume, audit()
+generates the solutions again, skipping the checks of those before the
+checkpoint, except for the best one, which it checks again to get its result
+back. The resumed audit then finishes with the same result as one that was
+never interrupted.
+
+Checkpoints are written to files named for a hash of the student's data, the
+area specification, and the audit engine (see dp.fingerprint), so a
+checkpoint is never resumed against different inputs.
+"""
+
+from typing import Any, Dict, Optional
+import json
+import logging
+import os
+import tempfile
+
+import attr
+
+from .fingerprint import json_fingerprint, engine_version
+
+logger = logging.getLogger(__name__)
+
+
+@attr.s(cache_hash=True, slots=True, kw_only=True, frozen=True, auto_attribs=True)
+class Checkpoint:
+    # how many solutions had been checked
+    iters: int
+    # which of them (counting from 1) was the best, or 0 if none were
+    best_iter: int
+    elapsed_ms: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "iters": self.iters,
+            "best_iter": self.best_iter,
+            "elapsed_ms": self.elapsed_ms,
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> 'Checkpoint':
+        return Checkpoint(
+            iters=data['iters'],
+            best_iter=data['best_iter'],
+            elapsed_ms=data['elapsed_ms'],
+        )
+
+
+def checkpoint_key(*, student: Dict, area_spec: Dict) -> str:
+    return json_fingerprint({
+        'engine': engine_version(),
+        'area': area_spec,
+        'student': student,
+    })
+
+
+def checkpoint_path(directory: str, key: str) -> str:
+    return os.path.join(directory, key[:2], f"{key}.json")
+
+
+def load_checkpoint(directory: str, key: str) -> Optional[Checkpoint]:
+    """Returns the saved checkpoint for `key`, if there is one. Unreadable
+    checkpoint files are ignored."""
+
+    path = checkpoint_path(directory, key)
+
+    try:
+        with open(path, 'r', encoding='utf-8') as infile:
+            return Checkpoint.from_dict(json.load(infile))
+    except FileNotFoundError:
+        return None
+    except Exception as ex:
+        logger.warning("ignoring unreadable checkpoint file %s: %s", path, ex)
+        return None
+
+
+def save_checkpoint(directory: str, key: str, checkpoint: Checkpoint) -> None:
+    path = checkpoint_path(directory, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # write to a temporary file and rename it into place, so that an
+    # interruption mid-write leaves the previous checkpoint intact
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as outfile:
+            json.dump(checkpoint.to_dict(), outfile)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def discard_checkpoint(directory: str, key: str) -> None:
+    try:
+        os.unlink(checkpoint_path(directory, key))
+    except FileNotFoundError:
+        pass
@@ -320,6 +320,10 @@ class SingleClause(BaseClause, ResolvedClause):
         if self.operator not in (Operator.LessThan, Operator.LessThanOrEqualTo):
             if self.resolved_with is not None and type(self.resolved_with) in (int, Decimal):
                 if type(self.expected) in (int, Decimal):
+                    # anything at or past a positive goal is capped at 1, so
+                    # there's no need to divide
+                    if self.expected > 0 and self.resolved_with >= self.expected:
+                        return Decimal(1)
                     if self.expected != 0:
                         resolved = Decimal(self.resolved_with) / Decimal(self.expected)
                         return min(Decimal(1), resolved)
@@ -0,0 +1,251 @@
+"""A compact, lossless encoding of AreaResult.to_dict() output.
+
+The JSON form of a result repeats the same keys on every node, the full path
+from the root on every node, and each course's clbid everywhere the course
+is claimed or matched. The compact form stores each of these once:
+
+- every distinct list of dict keys is stored once, and a dict is written as
+  the index of its "shape" (its keys, and how each value is encoded)
+  followed by its values;
+- a node's path is written relative to its parent's path;
+- clbids are written as indices into a table of courses, and other strings as
+  indices into a table of strings;
+- integral numeric strings (most ranks) are written as numbers.
+
+A compact document looks like this:
+
+    {"format": "dp-compact", "version": 1,
+     "keys": [[key, ...], ...], "shapes": [[keys index, kinds], ...],
+     "courses": [clbid, ...], "strings": [str, ...], "root": <node>}
+
+where each dict value has a "kind": raw, a numeric string, a course index, or
+a string index. Lists are written as [tag, *items]; the tag says whether the
+items are raw values, course indices, string indices, or the tail of a path.
+
+expand_result() turns a compact document back into exactly the JSON that
+to_dict() produced.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+FORMAT = 'dp-compact'
+VERSION = 1
+
+# the kinds of values in a dict
+RAW = 'r'
+NUMERIC = 'n'
+COURSE = 'c'
+STRING = 's'
+
+# the tags on lists
+LIST_RAW = -1
+LIST_COURSES = -2
+LIST_PATH_TAIL = -3
+LIST_STRINGS = -4
+
+
+class Encoder:
+    def __init__(self, *, clbids: Sequence[str]) -> None:
+        self.keys: List[List[str]] = []
+        self.keys_index: Dict[Tuple[str, ...], int] = {}
+
+        self.shapes: List[Tuple[int, str]] = []
+        self.shape_index: Dict[Tuple[int, str], int] = {}
+
+        self.courses: List[str] = sorted(set(clbids))
+        self.course_index: Dict[str, int] = {clbid: i for i, clbid in enumerate(self.courses)}
+
+        self.strings: List[str] = []
+        self.string_index: Dict[str, int] = {}
+
+    def intern(self, s: str) -> int:
+        index = self.string_index.get(s, None)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(s)
+            self.string_index[s] = index
+        return index
+
+    def shape(self, keys: Tuple[str, ...], kinds: str) -> int:
+        keys_index = self.keys_index.get(keys, None)
+        if keys_index is None:
+            keys_index = len(self.keys)
+            self.keys.append(list(keys))
+            self.keys_index[keys] = keys_index
+
+        index = self.shape_index.get((keys_index, kinds), None)
+        if index is None:
+            index = len(self.shapes)
+            self.shapes.append((keys_index, kinds))
+            self.shape_index[(keys_index, kinds)] = index
+        return index
+
+    def encode(self, value: Any, *, parent_path: Optional[List[Any]] = None) -> Any:
+        if isinstance(value, dict):
+            return self.encode_dict(value, parent_path=parent_path)
+
+        if isinstance(value, list):
+            return self.encode_list(value, parent_path=parent_path)
+
+        return value
+
+    def encode_dict(self, value: Dict[str, Any], *, parent_path: Optional[List[Any]]) -> List[Any]:
+        path = value.get('path', None)
+        own_path = path if isinstance(path, list) else parent_path
+
+        kinds: List[str] = []
+        encoded: List[Any] = []
+        for key, item in value.items():
+            if isinstance(item, str):
+                if item in self.course_index:
+                    kinds.append(COURSE)
+                    encoded.append(self.course_index[item])
+                elif is_integral_string(item):
+                    kinds.append(NUMERIC)
+                    encoded.append(int(item))
+                else:
+                    kinds.append(STRING)
+                    encoded.append(self.intern(item))
+
+            elif isinstance(item, list) and key.endswith('path') and parent_path is not None and is_path_tail(item, parent_path):
+                kinds.append(RAW)
+                encoded.append([LIST_PATH_TAIL, *item[len(parent_path):]])
+
+            else:
+                kinds.append(RAW)
+                encoded.append(self.encode(item, parent_path=own_path))
+
+        return [self.shape(tuple(value.keys()), ''.join(kinds)), *encoded]
+
+    def encode_list(self, value: List[Any], *, parent_path: Optional[List[Any]]) -> List[Any]:
+        if value and all(isinstance(item, str) for item in value):
+            if all(item in self.course_index for item in value):
+                return [LIST_COURSES, *(self.course_index[item] for item in value)]
+            return [LIST_STRINGS, *(self.intern(item) for item in value)]
+
+        return [LIST_RAW, *(self.encode(item, parent_path=parent_path) for item in value)]
+
+
+class Decoder:
+    def __init__(self, *, keys: List[List[str]], shapes: List[List[Any]], courses: List[str], strings: List[str]) -> None:
+        self.shapes = [(keys[keys_index], kinds) for keys_index, kinds in shapes]
+        self.courses = courses
+        self.strings = strings
+
+    def decode(self, value: Any, *, parent_path: Optional[List[Any]] = None) -> Any:
+        if not isinstance(value, list):
+            return value
+
+        tag = value[0]
+
+        if tag >= 0:
+            return self.decode_dict(value, parent_path=parent_path)
+        elif tag == LIST_RAW:
+            return [self.decode(item, parent_path=parent_path) for item in value[1:]]
+        elif tag == LIST_COURSES:
+            return [self.courses[i] for i in value[1:]]
+        elif tag == LIST_STRINGS:
+            return [self.strings[i] for i in value[1:]]
+        elif tag == LIST_PATH_TAIL:
+            assert parent_path is not None
+            return [*parent_path, *value[1:]]
+
+        raise ValueError(f'unknown list tag {tag!r}')
+
+    def decode_dict(self, value: List[Any], *, parent_path: Optional[List[Any]]) -> Dict[str, Any]:
+        keys, kinds = self.shapes[value[0]]
+        items = value[1:]
+
+        # decode the path first, because the node's children are relative to it
+        own_path = parent_path
+        if 'path' in keys:
+            i = keys.index('path')
+            if kinds[i] == RAW and isinstance(items[i], list):
+                own_path = self.decode(items[i], parent_path=parent_path)
+
+        result: Dict[str, Any] = {}
+        for key, kind, item in zip(keys, kinds, items):
+            if kind == COURSE:
+                result[key] = self.courses[item]
+            elif kind == NUMERIC:
+                result[key] = str(item)
+            elif kind == STRING:
+                result[key] = self.strings[item]
+            elif isinstance(item, list) and item and item[0] == LIST_PATH_TAIL:
+                result[key] = self.decode(item, parent_path=parent_path)
+            else:
+                result[key] = self.decode(item, parent_path=own_path)
+
+        return result
+
+
+def compact_result(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Encodes the output of AreaResult.to_dict() in the compact form."""
+
+    encoder = Encoder(clbids=list(find_clbids(data)))
+    root = encoder.encode(data)
+
+    return {
+        "format": FORMAT,
+        "version": VERSION,
+        "keys": encoder.keys,
+        "shapes": [[keys_index, kinds] for keys_index, kinds in encoder.shapes],
+        "courses": encoder.courses,
+        "strings": encoder.strings,
+        "root": root,
+    }
+
+
+def expand_result(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Turns a compact result back into the output of AreaResult.to_dict()."""
+
+    if not is_compact(data):
+        raise ValueError('not a compact result')
+
+    if data["version"] != VERSION:
+        raise ValueError(f'unsupported compact result version {data["version"]!r}')
+
+    decoder = Decoder(keys=data["keys"], shapes=data["shapes"], courses=data["courses"], strings=data["strings"])
+    result: Dict[str, Any] = decoder.decode(data["root"])
+    return result
+
+
+def is_compact(data: Any) -> bool:
+    return isinstance(data, dict) and data.get("format", None) == FORMAT
+
+
+def find_clbids(data: Any) -> Any:
+    """Yields every value stored under a "clbid" key, anywhere in the tree."""
+
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key == 'clbid' and isinstance(value, str):
+                yield value
+            else:
+                yield from find_clbids(value)
+
+    elif isinstance(data, list):
+        for value in data:
+            yield from find_clbids(value)
+
+
+def is_integral_string(s: str) -> bool:
+    """
+    >>> is_integral_string('12')
+    True
+    >>> is_integral_string('-1')
+    True
+    >>> is_integral_string('01')
+    False
+    >>> is_integral_string('1.00')
+    False
+    """
+
+    try:
+        return str(int(s)) == s
+    except ValueError:
+        return False
+
+
+def is_path_tail(path: List[Any], parent_path: List[Any]) -> bool:
+    return len(path) >= len(parent_path) and path[:len(parent_path)] == parent_path
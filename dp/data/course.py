@@ -5,7 +5,7 @@ import logging
 
 from .clausable import Clausable
 from .course_enums import GradeCode, GradeOption, SubType, CourseType, TranscriptCode, CourseTypeSortOrder
-from ..lib import str_to_grade_points
+from ..lib import str_to_grade_points, to_hundredths
 from ..exception import CourseOverrideException, ExceptionAction, CourseCreditOverride, CourseSubjectOverride
 
 if TYPE_CHECKING:  # pragma: no cover
@@ -45,6 +45,8 @@ class CourseInstance(Clausable):
 
     identity_: str
     is_chbi_: Optional[int]
+    credit_hundredths_: Optional[int]
+    gpa_point_hundredths_: Optional[int]
 
     def __str__(self) -> str:
         return self.identity_
@@ -370,6 +372,8 @@ def load_course(
         year=year,
         identity_=course_identity,
         is_chbi_=is_chbi,
+        credit_hundredths_=to_hundredths(credits),
+        gpa_point_hundredths_=to_hundredths(gpa_points),
     )
 
 
@@ -41,11 +41,13 @@ class Student:
 
         current_term = data.get('current_term', None)
 
-        courses = [c for c in load_transcript(data.get('courses', []), current_term=current_term, overrides=overrides)]
-        courses = sorted(courses, key=lambda c: c.sort_order())
-
-        courses_with_failed = [c for c in load_transcript(data.get('courses', []), include_failed=True, current_term=current_term, overrides=overrides)]
-        courses_with_failed = sorted(courses_with_failed, key=lambda c: c.sort_order())
+        # parse each course once, then derive the passing-only view from the
+        # same instances; filtering keeps the sort order intact
+        courses_with_failed = sorted(
+            load_transcript(data.get('courses', []), include_failed=True, current_term=current_term, overrides=overrides),
+            key=lambda c: c.sort_order(),
+        )
+        courses = [c for c in courses_with_failed if c.grade_code is not GradeCode.F]
 
         music_performances = [MusicPerformance.from_dict(d) for d in data.get('performances', [])]
         music_performances = sorted(music_performances, key=lambda p: p.sort_order())
@@ -77,6 +79,14 @@ class Student:
             music_mediums=music_mediums,
         )
 
+    def for_area(self, code: str) -> 'Student':
+        """Returns this student, as seen by an audit of the `code` area.
+
+        Only the current area code differs, so the transcript's course
+        instances are shared with every other area audited from this copy."""
+
+        return attr.evolve(self, current_area_code=code)
+
     def constants(self) -> Constants:
         try:
             current_area = next(a for a in self.areas if a.code == self.current_area_code)
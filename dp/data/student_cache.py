@@ -0,0 +1,72 @@
+from typing import Dict, Optional, Sequence
+import logging
+import os
+import pickle
+import tempfile
+
+from ..exception import CourseOverrideException
+from ..fingerprint import json_fingerprint, engine_version
+from .student import Student
+
+logger = logging.getLogger(__name__)
+
+
+def load_student(
+    data: Dict,
+    *,
+    code: str = '000',
+    overrides: Sequence[CourseOverrideException] = tuple(),
+    cache_dir: Optional[str] = None,
+) -> Student:
+    """Loads a student, reusing a previously-built copy from `cache_dir` if
+    one exists for this exact input.
+
+    The cache key covers the input data, the area code, the course overrides,
+    and the engine version, so changes to any of them simply miss the cache.
+    Unreadable cache files are treated as misses."""
+
+    if not cache_dir:
+        return Student.load(data, code=code, overrides=overrides)
+
+    key = json_fingerprint({
+        'engine': engine_version(),
+        'code': code,
+        'overrides': [o.to_dict() for o in overrides],
+        'student': data,
+    })
+    path = os.path.join(cache_dir, key[:2], f"{key}.pickle")
+
+    try:
+        with open(path, 'rb') as infile:
+            cached = pickle.load(infile)
+        if isinstance(cached, Student):
+            return cached
+    except FileNotFoundError:
+        pass
+    except Exception as ex:
+        logger.warning("ignoring unreadable student cache file %s: %s", path, ex)
+
+    student = Student.load(data, code=code, overrides=overrides)
+
+    try:
+        store_student(student, path)
+    except OSError as ex:
+        logger.warning("could not write student cache file %s: %s", path, ex)
+
+    return student
+
+
+def store_student(student: Student, path: str) -> None:
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    # write to a temporary file and rename it into place, so that concurrent
+    # readers never see a partially-written file
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as outfile:
+            pickle.dump(student, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
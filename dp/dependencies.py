@@ -0,0 +1,310 @@
+"""Which changes to a student's transcript could change an area's audit.
+
+Each area gets a set of "tokens" naming the things a course must have for
+any of the area's rules or limits to match it: its course identifier, clbid,
+subject, name, or one of its attributes or gereqs. A course whose tokens
+don't overlap with the area's can't be claimed or counted by the area, so
+changing it can't change the area's audit.
+
+Some areas look at every course: degree audits (their GPA covers the whole
+transcript), areas with conditional requirements, and areas with any rule
+that matches courses on something other than those fields (like `level`
+alone). Majors also count the credits of every course outside the major, so
+for them, any change to a course's subject or credits, or to whether it's on
+the transcript at all, matters too.
+"""
+
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+import attr
+
+from .area import AreaOfStudy, AreaTemplate
+from .base import Rule
+from .clause import AndClause, OrClause, SingleClause, Clause
+from .constants import Constants
+from .data.student import load_transcript
+from .operator import Operator
+from .rule.course import CourseRule
+from .rule.count import CountRule
+from .rule.proficiency import ProficiencyRule
+from .rule.query import QueryRule
+from .rule.requirement import RequirementRule
+from .base.query import QuerySource
+
+# the clause keys that name something a course has, and the token prefix for each
+TOKEN_KEYS = {
+    'course': 'course',
+    'clbid': 'clbid',
+    'subject': 'subject',
+    'attributes': 'attribute',
+    'gereqs': 'gereq',
+    'name': 'name',
+    'ap': 'name',
+}
+
+
+@attr.s(cache_hash=True, slots=True, kw_only=True, frozen=True, auto_attribs=True)
+class AreaDependencies:
+    tokens: FrozenSet[str] = frozenset()
+    all_courses: bool = False
+    transcript_totals: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tokens": sorted(self.tokens),
+            "all_courses": self.all_courses,
+            "transcript_totals": self.transcript_totals,
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> 'AreaDependencies':
+        return AreaDependencies(
+            tokens=frozenset(data['tokens']),
+            all_courses=data['all_courses'],
+            transcript_totals=data['transcript_totals'],
+        )
+
+
+def find_dependencies(specification: Dict) -> AreaDependencies:
+    """Builds the dependency index entry for an area specification, covering
+    all of its emphases."""
+
+    kind = specification.get('type', None)
+    if kind == 'degree' or AreaTemplate.compile(specification, check_emphases=False).is_conditional:
+        return AreaDependencies(all_courses=True)
+
+    area = AreaOfStudy.load(specification=specification, c=Constants(), all_emphases=True)
+
+    tokens: Set[str] = set()
+    try:
+        for rule_tokens in find_tokens_in_rule(area.result):
+            tokens.update(rule_tokens)
+
+        for limit in area.limit.limits:
+            tokens.update(require_tokens(clause_tokens(limit.where)))
+    except Unrestricted:
+        return AreaDependencies(all_courses=True)
+
+    return AreaDependencies(tokens=frozenset(tokens), transcript_totals=kind == 'major')
+
+
+class Unrestricted(Exception):
+    """Raised when part of an area could match any course."""
+
+
+def require_tokens(tokens: Optional[FrozenSet[str]]) -> FrozenSet[str]:
+    if tokens is None:
+        raise Unrestricted()
+    return tokens
+
+
+def find_tokens_in_rule(rule: Rule) -> Iterator[FrozenSet[str]]:
+    if isinstance(rule, CourseRule):
+        if rule.course:
+            yield frozenset([f"course:{rule.course}"])
+        elif rule.clbid:
+            yield frozenset([f"clbid:{rule.clbid}"])
+        elif rule.ap or rule.name:
+            yield frozenset([f"name:{rule.ap or rule.name}"])
+        else:
+            raise Unrestricted()
+
+    elif isinstance(rule, ProficiencyRule):
+        if rule.course:
+            yield from find_tokens_in_rule(rule.course)
+
+    elif isinstance(rule, QueryRule):
+        if rule.source is not QuerySource.Courses:
+            # claimed courses were matched elsewhere; the other sources aren't courses
+            return
+
+        if rule.where is None:
+            raise Unrestricted()
+
+        yield require_tokens(clause_tokens(rule.where))
+
+    elif isinstance(rule, CountRule):
+        for sub_rule in rule.items:
+            yield from find_tokens_in_rule(sub_rule)
+
+    elif isinstance(rule, RequirementRule):
+        if rule.result:
+            yield from find_tokens_in_rule(rule.result)
+
+
+def clause_tokens(clause: Clause) -> Optional[FrozenSet[str]]:
+    """Returns a set of tokens, at least one of which every matching course
+    must have, or None if the clause could match a course without any.
+
+    >>> clause_tokens(SingleClause(key='subject', expected='CSCI'))
+    frozenset({'subject:CSCI'})
+    >>> clause_tokens(SingleClause(key='level', expected=200)) is None
+    True
+    """
+
+    if isinstance(clause, AndClause):
+        # every child must match, so any child's tokens will do; the
+        # narrowest set skips the most changes
+        narrowest: Optional[FrozenSet[str]] = None
+        for child in clause.children:
+            tokens = clause_tokens(child)
+            if tokens is not None and (narrowest is None or len(tokens) < len(narrowest)):
+                narrowest = tokens
+        return narrowest
+
+    if isinstance(clause, OrClause):
+        union: Set[str] = set()
+        for child in clause.children:
+            tokens = clause_tokens(child)
+            if tokens is None:
+                return None
+            union.update(tokens)
+        return frozenset(union)
+
+    if isinstance(clause, SingleClause):
+        prefix = TOKEN_KEYS.get(clause.key, None)
+        if prefix is None:
+            return None
+
+        if clause.operator is Operator.EqualTo:
+            return frozenset([f"{prefix}:{clause.expected}"])
+
+        if clause.operator is Operator.In:
+            return frozenset(f"{prefix}:{value}" for value in clause.expected)
+
+    return None
+
+
+def course_tokens(row: Dict) -> FrozenSet[str]:
+    """Returns the tokens for one course from a student's input data.
+
+    >>> sorted(course_tokens({'clbid': '1', 'subject': 'CH/BI', 'number': '125', 'sub_type': '', 'name': 'Chem', 'attributes': [], 'gereqs': ['SPM']}))
+    ['clbid:1', 'course:CH/BI 125', 'gereq:SPM', 'name:Chem', 'subject:BIO', 'subject:CH/BI', 'subject:CHEM']
+    """
+
+    suffix = {'lab': '.L', 'flac': '.F', 'discussion': '.D'}.get(row.get('sub_type', ''), '')
+
+    tokens = {
+        f"clbid:{row['clbid']}",
+        f"course:{row['subject']} {row['number']}{suffix}",
+        f"subject:{row['subject']}",
+        f"name:{row['name']}",
+    }
+
+    # CH/BI courses count as either CHEM or BIO, when matching on subject
+    if row['subject'] == 'CH/BI':
+        tokens.update(['subject:CHEM', 'subject:BIO'])
+
+    tokens.update(f"attribute:{a}" for a in row.get('attributes', None) or [])
+    tokens.update(f"gereq:{g}" for g in row.get('gereqs', None) or [])
+
+    return frozenset(tokens)
+
+
+@attr.s(slots=True, kw_only=True, auto_attribs=True)
+class TranscriptChanges:
+    """The differences between two versions of a student's input data."""
+
+    other_data: bool = False
+    courses: List[Dict] = attr.Factory(list)
+    totals: bool = False
+    exceptions: Set[str] = attr.Factory(set)
+
+    @staticmethod
+    def diff(old: Dict, new: Dict) -> 'TranscriptChanges':
+        changes = TranscriptChanges()
+
+        ignored = {'courses', 'exceptions'}
+        if {k: v for k, v in old.items() if k not in ignored} != {k: v for k, v in new.items() if k not in ignored}:
+            changes.other_data = True
+
+        old_exceptions = old.get('exceptions', [])
+        new_exceptions = new.get('exceptions', [])
+        for e in [*old_exceptions, *new_exceptions]:
+            if (e in old_exceptions) != (e in new_exceptions):
+                changes.exceptions.add(e['area_code'])
+
+        old_courses = {c['clbid']: c for c in old.get('courses', [])}
+        new_courses = {c['clbid']: c for c in new.get('courses', [])}
+
+        for clbid in sorted(set(old_courses) | set(new_courses)):
+            before = old_courses.get(clbid, None)
+            after = new_courses.get(clbid, None)
+            if before == after:
+                continue
+
+            changes.courses.extend(row for row in (before, after) if row is not None)
+
+            if transcript_summary(before, data=old) != transcript_summary(after, data=new):
+                changes.totals = True
+
+        return changes
+
+    def affects(self, area_code: str, dependencies: AreaDependencies, *, exceptions: Iterable[Dict] = tuple()) -> bool:
+        """Could these changes change the audit of `area_code`? `exceptions`
+        are the student's exceptions, whose courses are always relevant."""
+
+        if self.other_data or area_code in self.exceptions:
+            return True
+
+        if not self.courses:
+            return False
+
+        if dependencies.all_courses:
+            return True
+
+        if dependencies.transcript_totals and self.totals:
+            return True
+
+        excepted = set(f"clbid:{e['clbid']}" for e in exceptions if e['area_code'] == area_code and 'clbid' in e)
+        tokens = dependencies.tokens | excepted
+
+        return any(course_tokens(row) & tokens for row in self.courses)
+
+
+def transcript_summary(row: Optional[Dict], *, data: Dict) -> Optional[Any]:
+    """What the "credits outside the major" requirement sees of a course:
+    whether it's on the transcript, and if so, its subject and credits."""
+
+    if row is None:
+        return None
+
+    course = next(load_transcript([row], current_term=data.get('current_term', None), overrides=[]), None)
+    if course is None:
+        return None
+
+    return (course.subject, course.credits)
+
+
+def plan_reaudits(
+    *,
+    new: Dict,
+    areas: Iterable[Tuple[str, str]],
+    previous: Dict[str, Dict],
+    index: Dict[str, AreaDependencies],
+) -> Iterator[Tuple[str, str]]:
+    """Yields the (catalog, area code) pairs from `areas` that need to be
+    audited again, given the student's `new` input data.
+
+    `previous` holds the input data each area was last audited with, by area
+    code, and `index` holds each area's dependencies, by "catalog/code".
+    Areas missing from either are always audited."""
+
+    diffs: Dict[int, TranscriptChanges] = {}
+
+    for catalog, code in areas:
+        old = previous.get(code, None)
+        dependencies = index.get(f"{catalog}/{code}", None)
+
+        if old is None or dependencies is None:
+            yield (catalog, code)
+            continue
+
+        # most of a student's areas were last audited with the same input
+        changes = diffs.get(id(old), None)
+        if changes is None:
+            changes = TranscriptChanges.diff(old, new)
+            diffs[id(old)] = changes
+
+        if changes.affects(code, dependencies, exceptions=new.get('exceptions', [])):
+            yield (catalog, code)
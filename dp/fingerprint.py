@@ -0,0 +1,41 @@
+from typing import Any
+import functools
+import hashlib
+import json
+import pathlib
+
+
+def json_fingerprint(data: Any) -> str:
+    """Hashes a JSON-compatible value, independent of its key order.
+
+    >>> json_fingerprint({'a': 1, 'b': [1, 2]}) == json_fingerprint({'b': [1, 2], 'a': 1})
+    True
+    >>> json_fingerprint({'a': 1}) == json_fingerprint({'a': 2})
+    False
+    """
+
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def engine_version() -> str:
+    """Hashes the source of the audit engine, so that anything cached from
+    its output is invalidated whenever the engine itself changes.
+
+    The server, testbed, and helper scripts don't affect audit results, so
+    they are left out of the hash."""
+
+    root = pathlib.Path(__file__).parent
+    skipped = {'bin', 'server', 'testbed'}
+
+    digest = hashlib.sha256()
+    for path in sorted(root.rglob('*.py')):
+        relative = path.relative_to(root)
+        if relative.parts[0] in skipped:
+            continue
+
+        digest.update(str(relative).encode('utf-8'))
+        digest.update(path.read_bytes())
+
+    return digest.hexdigest()
@@ -1,5 +1,5 @@
 from decimal import Decimal, ROUND_DOWN
-from typing import Iterable, TYPE_CHECKING
+from typing import Iterable, Optional, Union, TYPE_CHECKING
 from .data.course_enums import GradeCode, grade_code_to_points
 
 if TYPE_CHECKING:  # pragma: no cover
@@ -11,10 +11,33 @@ def grade_point_average_items(courses: Iterable['CourseInstance']) -> Iterable['
 
 
 def grade_point_average(courses: Iterable['CourseInstance']) -> Decimal:
+    items = list(grade_point_average_items(courses))
+
+    # Credits and GPA points are (almost always) whole hundredths, so we can
+    # sum them as integers and only build a Decimal for the final answer.
+    gp_sum = 0
+    credit_sum = 0
+    for c in items:
+        if c.gpa_point_hundredths_ is None or c.credit_hundredths_ is None:
+            return decimal_grade_point_average(items)
+        gp_sum += c.gpa_point_hundredths_
+        credit_sum += c.credit_hundredths_
+
+    if credit_sum == 0:
+        return Decimal('0.00')
+
+    if credit_sum < 0 or gp_sum < 0:
+        return decimal_grade_point_average(items)
+
+    # GPA is _truncated_ to two decimal places, not rounded
+    return Decimal(gp_sum * 100 // credit_sum).scaleb(-2)
+
+
+def decimal_grade_point_average(courses: Iterable['CourseInstance']) -> Decimal:
     gp_sum = Decimal('0')
     credit_sum = Decimal('0')
 
-    for c in grade_point_average_items(courses):
+    for c in courses:
         gp_sum += c.gpa_points
         credit_sum += c.credits
 
@@ -29,3 +52,37 @@ def grade_point_average(courses: Iterable['CourseInstance']) -> Decimal:
 
 def str_to_grade_points(s: str) -> Decimal:
     return grade_code_to_points.get(GradeCode(s), Decimal("0.00"))
+
+
+def to_hundredths(value: Union[int, Decimal]) -> Optional[int]:
+    """Converts a value into an integer number of hundredths, if it can be
+    represented exactly.
+
+    >>> to_hundredths(Decimal('1.25'))
+    125
+    >>> to_hundredths(1)
+    100
+    >>> to_hundredths(Decimal('0.125')) is None
+    True
+    """
+
+    scaled = Decimal(value).scaleb(2)
+    if not scaled.is_finite() or scaled != scaled.to_integral_value():
+        return None
+
+    return int(scaled)
+
+
+def sum_credit_hundredths(courses: Iterable['CourseInstance']) -> Optional[int]:
+    """Sums the credits of the given courses, in hundredths of a credit.
+
+    Returns None if any course's credits can't be represented that way, in
+    which case the caller needs to sum the Decimal credits instead."""
+
+    total = 0
+    for c in courses:
+        if c.credit_hundredths_ is None:
+            return None
+        total += c.credit_hundredths_
+
+    return total
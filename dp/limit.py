@@ -3,6 +3,7 @@ from collections import defaultdict
 import itertools
 import logging
 import decimal
+import math
 import enum
 
 import attr
@@ -10,6 +11,7 @@ import attr
 from .clause import Clause, str_clause
 from .load_clause import load_clause
 from .constants import Constants
+from .lib import sum_credit_hundredths
 from .ncr import ncr
 
 if TYPE_CHECKING:
@@ -96,6 +98,11 @@ class Limit:
                 yield combo
 
     def iterate_credits(self, courses: Sequence['CourseInstance']) -> Iterator[Tuple['CourseInstance', ...]]:
+        total = sum_credit_hundredths(courses)
+        if total is not None:
+            yield from self.iterate_credit_hundredths(courses, total=total)
+            return
+
         if sum(c.credits for c in courses) <= self.at_most:
             yield tuple(courses)
             return
@@ -107,6 +114,21 @@ class Limit:
                     # logger.debug("limit/loop(%s..<%s)/combo: n=%s combo=%s", 0, self.at_most + 1, n, combo)
                     yield combo
 
+    def iterate_credit_hundredths(self, courses: Sequence['CourseInstance'], *, total: int) -> Iterator[Tuple['CourseInstance', ...]]:
+        # the sums are whole hundredths, so they fit under at_most exactly
+        # when they fit under its floor
+        at_most = math.floor(self.at_most.scaleb(2))
+
+        if total <= at_most:
+            yield tuple(courses)
+            return
+
+        for n in range(0, len(courses) + 1):
+            for combo in itertools.combinations(courses, n):
+                combo_total = sum_credit_hundredths(combo)
+                if combo_total is not None and combo_total <= at_most:
+                    yield combo
+
     def estimate(self, courses: Sequence['CourseInstance']) -> int:
         acc = 0
 
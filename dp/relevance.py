@@ -0,0 +1,45 @@
+from typing import Dict, Optional
+
+from .area import area_template
+from .data.student import Student
+from .exception import load_exception, CourseOverrideException
+
+
+def relevant_projection(data: Dict, *, area_spec: Dict, student: Optional[Student] = None) -> Dict:
+    """Returns the parts of a student's input data that could affect an audit
+    of the given area, for use in cache keys.
+
+    The projection keeps everything except the courses that the area can't
+    see (see AreaOfStudy.relevant_clbids) and the exceptions for other areas.
+    The courses that remain are kept whole, rather than trimmed to the fields
+    that the area's clauses read, since every field of a course's row goes
+    into deciding whether it makes it onto the transcript at all. Areas with
+    conditional requirements may look at any course, so for them, every
+    course is kept.
+
+    `student` can be an already-loaded copy of the same data, as in
+    dp.run.run()."""
+
+    area_code = area_spec['code']
+
+    area_exceptions = [e for e in data.get('exceptions', []) if e['area_code'] == area_code]
+    projected = {**data, 'exceptions': area_exceptions}
+
+    template = area_template(area_spec, check_emphases=False)
+    if template.is_conditional:
+        return projected
+
+    exceptions = [load_exception(e) for e in area_exceptions]
+    course_overrides = [e for e in exceptions if isinstance(e, CourseOverrideException)]
+
+    if student is not None and not course_overrides:
+        student = student.for_area(area_code)
+    else:
+        student = Student.load(data, code=area_code, overrides=course_overrides)
+
+    area = template.specialize(c=student.constants(), student=student, exceptions=exceptions)
+    clbids = area.relevant_clbids(student=student, exceptions=exceptions)
+
+    projected['courses'] = [c for c in data.get('courses', []) if c['clbid'] in clbids]
+
+    return projected
@@ -3,6 +3,7 @@ from typing import Dict, List, Optional, Sequence, Iterator, Callable, Collectio
 import itertools
 import logging
 import decimal
+import math
 
 from ..base import Rule, BaseQueryRule
 from ..base.query import QuerySource
@@ -15,6 +16,7 @@ from ..solution.query import QuerySolution
 from ..constants import Constants
 from ..operator import Operator
 from ..data import CourseInstance
+from ..lib import sum_credit_hundredths
 from .assertion import AssertionRule, ConditionalAssertionRule, BaseAssertionRule
 
 if TYPE_CHECKING:  # pragma: no cover
@@ -369,6 +371,11 @@ def iterate_item_set(item_set: Collection[Clausable], *, rule: QueryRule) -> Ite
 
             # We can skip outputs with impunity here, because the calling
             # function will ensure that the fallback set is attempted
+            total = sum_credit_hundredths(item_set_courses)
+            if total is not None:
+                yield from iterate_credit_sums(item_set_courses, total=total, expected=simple_sum_assertion.expected)
+                return
+
             if sum(c.credits for c in item_set_courses) < simple_sum_assertion.expected:
                 return
 
@@ -386,6 +393,21 @@ def iterate_item_set(item_set: Collection[Clausable], *, rule: QueryRule) -> Ite
         yield tuple(item_set)
 
 
+def iterate_credit_sums(courses: Sequence[CourseInstance], *, total: int, expected: Union[int, decimal.Decimal]) -> Iterator[Tuple[CourseInstance, ...]]:
+    # the sums are whole hundredths, so they reach the expected value exactly
+    # when they reach its ceiling
+    minimum = math.ceil(decimal.Decimal(expected).scaleb(2))
+
+    if total < minimum:
+        return
+
+    for n in range(1, len(courses) + 1):
+        for combo in itertools.combinations(courses, n):
+            combo_total = sum_credit_hundredths(combo)
+            if combo_total is not None and combo_total >= minimum:
+                yield combo
+
+
 def estimate_item_set(item_set: Collection[Clausable], *, rule: QueryRule) -> int:
     # This is known to over-estimate the number of items, because it doesn't
     # check the credit sum inside of simple_sum_assertion.
@@ -1,7 +1,6 @@
 from typing import Any, Mapping, Optional, List, Iterator, Collection, TYPE_CHECKING
 import logging
 import attr
-import markdown2  # type: ignore
 
 from ..base import Rule, BaseRequirementRule
 from ..base.requirement import AuditedBy
@@ -92,6 +91,7 @@ class RequirementRule(Rule, BaseRequirementRule):
 
         message = data.get("message", None)
         if message:
+            import markdown2  # type: ignore
             message = markdown2.markdown(message)
 
         return RequirementRule(
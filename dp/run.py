@@ -1,18 +1,19 @@
 import json
-from typing import Iterator, List, Dict
+from typing import Iterator, List, Dict, Optional
 
-import yaml
-import csv
 import sys
 
-from .area import AreaOfStudy
+from .area import area_template
 from .exception import load_exception, CourseOverrideException
 from .lib import grade_point_average_items, grade_point_average
-from .data import Student
-from .audit import audit, Message, Arguments
+from .data.student import Student
+from .data.student_cache import load_student
+from .audit import audit, Message, Arguments, CheckpointMsg, ResultMsg, NoAuditsCompletedMsg
+from .checkpoint import checkpoint_key, load_checkpoint, save_checkpoint, discard_checkpoint
+from .bundle import load_bundled_area
 
 
-def run(args: Arguments, *, student: Dict, area_spec: Dict) -> Iterator[Message]:
+def run(args: Arguments, *, student: Dict, area_spec: Dict, loaded: Optional[Student] = None) -> Iterator[Message]:
     area_code = area_spec['code']
 
     exceptions = [
@@ -22,9 +23,15 @@ def run(args: Arguments, *, student: Dict, area_spec: Dict) -> Iterator[Message]
     ]
     course_overrides = [e for e in exceptions if isinstance(e, CourseOverrideException)]
 
-    loaded = Student.load(student, code=area_code, overrides=course_overrides)
+    if loaded is not None and not course_overrides:
+        # reuse a student already loaded from the same data for another area
+        loaded = loaded.for_area(area_code)
+    else:
+        loaded = load_student(student, code=area_code, overrides=course_overrides, cache_dir=args.student_cache)
 
     if args.transcript_only:
+        import csv
+
         writer = csv.writer(sys.stdout)
         writer.writerow(['course', 'name', 'clbid', 'type', 'credits', 'term', 'type', 'grade', 'in_gpa'])
         for c in loaded.courses:
@@ -35,6 +42,8 @@ def run(args: Arguments, *, student: Dict, area_spec: Dict) -> Iterator[Message]
         return
 
     if args.gpa_only:
+        import csv
+
         writer = csv.writer(sys.stdout)
         writer.writerow(['course', 'grade', 'points'])
 
@@ -45,26 +54,33 @@ def run(args: Arguments, *, student: Dict, area_spec: Dict) -> Iterator[Message]
         writer.writerow(['---', 'gpa:', str(grade_point_average(loaded.courses_with_failed))])
         return
 
-    exceptions = [
-        load_exception(e)
-        for e in student.get("exceptions", [])
-        if e['area_code'] == area_code
-    ]
-
-    area = AreaOfStudy.load(
-        specification=area_spec,
+    # the template reuses the student-independent parts of the rule tree
+    # across audits of the same specification
+    area = area_template(area_spec, check_emphases=args.check_emphases).specialize(
         c=loaded.constants(),
         student=loaded,
         exceptions=exceptions,
     )
     area.validate()
 
-    yield from audit(
-        area=area,
-        student=loaded,
-        exceptions=exceptions,
-        args=args,
-    )
+    if not args.checkpoint_dir:
+        yield from audit(area=area, student=loaded, exceptions=exceptions, args=args)
+        return
+
+    # pick up where an interrupted audit of the same inputs left off
+    key = checkpoint_key(student=student, area_spec=area_spec)
+    resume = load_checkpoint(args.checkpoint_dir, key)
+
+    for msg in audit(area=area, student=loaded, exceptions=exceptions, args=args, resume=resume):
+        if isinstance(msg, CheckpointMsg):
+            save_checkpoint(args.checkpoint_dir, key, msg.checkpoint)
+        elif isinstance(msg, NoAuditsCompletedMsg) or (isinstance(msg, ResultMsg) and not args.print_all):
+            # callers often stop reading at the result; with print_all, every
+            # solution is sent as a result, and the audit may yet be interrupted
+            discard_checkpoint(args.checkpoint_dir, key)
+        yield msg
+
+    discard_checkpoint(args.checkpoint_dir, key)
 
 
 def load_students(*filenames: str) -> List[Dict]:
@@ -81,6 +97,14 @@ def load_areas(*filenames: str) -> List[Dict]:
     specs: List[Dict] = []
 
     for area_file in filenames:
+        # prefer a prebuilt bundle (see dp.bin.bundle), if it is up-to-date
+        bundled = load_bundled_area(area_file)
+        if bundled is not None:
+            specs.append(bundled)
+            continue
+
+        import yaml
+
         with open(area_file, "r", encoding="utf-8") as infile:
             specs.append(yaml.load(stream=infile, Loader=yaml.SafeLoader))
 
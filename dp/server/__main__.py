@@ -1,20 +1,35 @@
 # mypy: warn_unreachable = False
 
+from typing import Callable, Dict, Optional
+from multiprocessing.connection import Connection
 from pathlib import Path
 import multiprocessing
+import functools
 import argparse
 import logging
 import select
 import math
 import json
+import time
 import os
 
+import attr
 import dotenv
 import psycopg2  # type: ignore
 import psycopg2.extensions  # type: ignore
 import sentry_sdk
 
-from dp.run import load_areas
+from dp.area_cache import AreaSpecCache
+from .queue import QueueRow, dequeue_one, fail_queued_item, find_queued_item
+from .progress import ProgressBuffer
+from .supervisor import Supervisor, WorkerSlot
+from .preempt import Preemptor
+from .result_cache import find_cached_results, result_cache_key
+from .cost import worker_lane
+from .metrics import Event, MetricsCollector
+from .dispatch import Dispatcher, DispatchedBackend
+from .scaling import ScalingPolicy, available_cpus
+from . import metrics
 
 # always resolve to the local .env file
 dotenv_path = Path(__file__).parent.parent.parent / '.env'
@@ -22,13 +37,20 @@ dotenv.load_dotenv(verbose=True, dotenv_path=dotenv_path)
 
 logger = logging.getLogger(__name__)
 
+# how many times an item interrupted mid-audit is left on the queue to resume
+# from its checkpoint, before it is saved as an error
+CHECKPOINT_RETRIES = 3
+
 if os.environ.get('SENTRY_DSN', None):
     sentry_sdk.init(dsn=os.environ.get('SENTRY_DSN'))
 else:
     logger.warning('SENTRY_DSN not set; skipping')
 
 # we need to import this after dotenv and sentry have loaded
-from .audit import audit  # noqa: F402
+from .audit import audit, insert_results, has_checkpoint  # noqa: F402
+from .writer import ResultWriter  # noqa: E402
+from .backend import PostgresBackend  # noqa: E402
+from .batched import process_queue_batched  # noqa: E402
 
 logformat = "%(asctime)s %(name)s [pid=%(process)d] %(processName)s [%(levelname)s] %(message)s"
 logger.setLevel(logging.INFO)
@@ -38,25 +60,157 @@ ch.setFormatter(logging.Formatter(logformat))
 logger.addHandler(ch)
 
 
-def wrapper(*, area_root: str) -> None:
+def wrapper(
+    *,
+    slot: WorkerSlot,
+    area_root: str,
+    area_cache_size: int,
+    batch_size: int,
+    write_behind: bool,
+    progress_interval: float,
+    result_cache: bool,
+    checkpoint_dir: Optional[str],
+    long_lanes: int,
+    preempt_priority: Optional[int],
+    leases: bool,
+    metrics_events: Optional['multiprocessing.Queue[Event]'],
+    channel: Optional[Connection] = None,
+) -> None:
+    # report this worker's audits to the supervisor (see dp.server.metrics)
+    metrics.configure(metrics_events)
+
     try:
-        worker(area_root=area_root)
+        if channel is not None:
+            dispatched_worker(
+                channel=channel,
+                slot=slot,
+                area_root=area_root,
+                area_cache_size=area_cache_size,
+                batch_size=batch_size,
+                result_cache=result_cache,
+                checkpoint_dir=checkpoint_dir,
+                long_lanes=long_lanes,
+            )
+            return
+
+        worker(
+            slot=slot,
+            area_root=area_root,
+            area_cache_size=area_cache_size,
+            batch_size=batch_size,
+            write_behind=write_behind,
+            progress_interval=progress_interval,
+            result_cache=result_cache,
+            checkpoint_dir=checkpoint_dir,
+            long_lanes=long_lanes,
+            preempt_priority=preempt_priority,
+            leases=leases,
+        )
     except KeyboardInterrupt:
         pass
 
 
-def worker(*, area_root: str) -> None:
-    logger.info(f'connect')
-
+def connect() -> psycopg2.extensions.connection:
     # empty string means "use the environment variables"
     conn = psycopg2.connect('', application_name='degreepath')
     conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    return conn
+
+
+def worker(
+    *,
+    slot: WorkerSlot,
+    area_root: str,
+    area_cache_size: int,
+    batch_size: int,
+    write_behind: bool,
+    progress_interval: float,
+    result_cache: bool,
+    checkpoint_dir: Optional[str],
+    long_lanes: int,
+    preempt_priority: Optional[int],
+    leases: bool,
+) -> None:
+    area_cache = AreaSpecCache(maxsize=area_cache_size)
+    progress = ProgressBuffer(interval=progress_interval)
+
+    logger.info(f'connect')
+
+    conn = connect()
 
     logger.info(f'connected')
 
+    progress.start(conn)
+
+    writer = ResultWriter(connect=connect).start() if write_behind else None
+
+    # whether other workers might be holding leases on the queue
+    leases = leases or batch_size > 1 or write_behind
+
+    preemptor: Optional[Preemptor] = None
+    if preempt_priority is not None:
+        # urgent items report their progress separately from the paused audit
+        urgent_progress = ProgressBuffer(interval=progress_interval)
+
+        def serve(curs: psycopg2.extensions.cursor, row: QueueRow) -> None:
+            audit_queued_item(curs, row, area_root=area_root, area_cache=area_cache, progress=urgent_progress, result_cache=result_cache, checkpoint_dir=checkpoint_dir)
+
+        preemptor = Preemptor(connect=connect, priority=preempt_priority, slot=slot, serve=serve, leases=leases)
+
+    try:
+        listen(conn=conn, slot=slot, area_root=area_root, area_cache=area_cache, batch_size=batch_size, writer=writer, progress=progress, result_cache=result_cache, checkpoint_dir=checkpoint_dir, lane=worker_lane(slot.index, long_lanes=long_lanes), preemptor=preemptor, leases=leases)
+    finally:
+        progress.close()
+        if writer is not None:
+            writer.close()
+        if preemptor is not None:
+            preemptor.close()
+
+
+def dispatched_worker(
+    *,
+    channel: Connection,
+    slot: WorkerSlot,
+    area_root: str,
+    area_cache_size: int,
+    batch_size: int,
+    result_cache: bool,
+    checkpoint_dir: Optional[str],
+    long_lanes: int,
+) -> None:
+    """Audits whatever the dispatcher hands over, without a connection of
+    its own (see dp.server.dispatch)."""
+
+    area_cache = AreaSpecCache(maxsize=area_cache_size)
+    backend = DispatchedBackend(channel, slot=slot)
+    lane = worker_lane(slot.index, long_lanes=long_lanes)
+
+    # the dispatcher's leases wait for work, so this only returns when a save fails
+    while True:
+        process_queue_batched(backend=backend, slot=slot, area_root=area_root, area_cache=area_cache, batch_size=batch_size, writer=None, result_cache=result_cache, checkpoint_dir=checkpoint_dir, lane=lane, preemptor=None)
+
+        # give the database a moment before leasing the same batch again
+        time.sleep(1.0)
+
+
+def listen(
+    *,
+    conn: psycopg2.extensions.connection,
+    slot: WorkerSlot,
+    area_root: str,
+    area_cache: AreaSpecCache,
+    batch_size: int,
+    writer: Optional[ResultWriter],
+    progress: ProgressBuffer,
+    result_cache: bool,
+    checkpoint_dir: Optional[str],
+    lane: Optional[str],
+    preemptor: Optional[Preemptor],
+    leases: bool,
+) -> None:
     with conn.cursor() as curs:
         # process any already-existing items
-        process_queue(curs=curs, area_root=area_root)
+        drain_queue(curs=curs, slot=slot, area_root=area_root, area_cache=area_cache, batch_size=batch_size, writer=writer, progress=progress, result_cache=result_cache, checkpoint_dir=checkpoint_dir, lane=lane, preemptor=preemptor, leases=leases)
 
     with conn.cursor() as curs:
         channel = 'dp_queue_update'
@@ -69,7 +223,13 @@ def worker(*, area_root: str) -> None:
             # the timeout is how long it will wait for there to be data... and
             # that if data shows up beforehand, it will return as soon as
             # there is data.
-            if select.select([conn], [], [], 5) == ([], [], []):
+            #
+            # in the meantime, once its results are saved, the worker may be
+            # stopped (see dp.server.scaling)
+            with slot.waiting(idle=writer is None or writer.caught_up()):
+                ready = select.select([conn], [], [], 5)
+
+            if ready == ([], [], []):
                 continue
 
             conn.poll()
@@ -77,30 +237,49 @@ def worker(*, area_root: str) -> None:
                 notify = conn.notifies.pop(0)
                 logger.info(f"NOTIFY: {notify.pid}, channel={notify.channel}, payload={notify.payload!r}")
 
-                process_queue(curs=curs, area_root=area_root)
-
-
-def process_queue(*, curs: psycopg2.extensions.cursor, area_root: str) -> None:
+                drain_queue(curs=curs, slot=slot, area_root=area_root, area_cache=area_cache, batch_size=batch_size, writer=writer, progress=progress, result_cache=result_cache, checkpoint_dir=checkpoint_dir, lane=lane, preemptor=preemptor, leases=leases)
+
+
+def drain_queue(
+    *,
+    curs: psycopg2.extensions.cursor,
+    slot: WorkerSlot,
+    area_root: str,
+    area_cache: AreaSpecCache,
+    batch_size: int,
+    writer: Optional[ResultWriter],
+    progress: ProgressBuffer,
+    result_cache: bool,
+    checkpoint_dir: Optional[str],
+    lane: Optional[str],
+    preemptor: Optional[Preemptor],
+    leases: bool,
+) -> None:
+    if batch_size > 1 or writer is not None:
+        process_queue_batched(backend=PostgresBackend(curs), slot=slot, area_root=area_root, area_cache=area_cache, batch_size=batch_size, writer=writer, result_cache=result_cache, checkpoint_dir=checkpoint_dir, lane=lane, preemptor=preemptor)
+    else:
+        process_queue(curs=curs, slot=slot, area_root=area_root, area_cache=area_cache, progress=progress, result_cache=result_cache, checkpoint_dir=checkpoint_dir, lane=lane, preemptor=preemptor, leases=leases)
+
+
+def process_queue(
+    *,
+    curs: psycopg2.extensions.cursor,
+    slot: WorkerSlot,
+    area_root: str,
+    area_cache: AreaSpecCache,
+    progress: ProgressBuffer,
+    result_cache: bool,
+    checkpoint_dir: Optional[str],
+    lane: Optional[str],
+    preemptor: Optional[Preemptor],
+    leases: bool,
+) -> None:
     # loop until the queue is empty
     while True:
         curs.execute('BEGIN;')
 
-        curs.execute('''
-            DELETE
-            FROM public.queue
-            WHERE id = (
-                SELECT id
-                FROM public.queue
-                ORDER BY priority DESC, ts
-                    FOR UPDATE
-                        SKIP LOCKED
-                LIMIT 1
-            )
-            RETURNING id, run, student_id, area_catalog, area_code, input_data::text;
-        ''')
-
         # fetch the next available queued item
-        row = curs.fetchone()
+        row = dequeue_one(curs, lane=lane, leases=leases)
 
         # if there are no more, return to waiting
         if row is None:
@@ -108,27 +287,26 @@ def process_queue(*, curs: psycopg2.extensions.cursor, area_root: str) -> None:
             break
 
         try:
-            queue_id, run_id, student_id, area_catalog, area_code, input_data = row
+            queue_id, run_id, student_id, area_catalog, area_code, input_data, priority, _ = row
         except Exception:
             curs.execute('COMMIT;')
             break
 
+        # let the supervisor know what we're working on, in case it hangs
+        slot.begin(queue_id)
+
         try:
             area_id = area_catalog + '/' + area_code
-            area_path = os.path.join(area_root, area_catalog, area_code + '.yaml')
-
-            logger.info(f'[q={queue_id}] begin  {student_id}::{area_id}')
-
-            area_spec = load_areas(area_path)[0]
 
-            # run the audit
-            audit(
-                curs=curs,
-                student=json.loads(input_data),
-                area_spec=area_spec,
-                area_catalog=area_catalog,
-                area_code=area_code,
-                run_id=run_id,
+            audit_queued_item(
+                curs,
+                row,
+                area_root=area_root,
+                area_cache=area_cache,
+                progress=progress,
+                result_cache=result_cache,
+                checkpoint_dir=checkpoint_dir,
+                preempt=preemptor.hook(priority) if preemptor is not None else None,
             )
 
             # once the audit is done, commit the queue's DELETE
@@ -146,38 +324,198 @@ def process_queue(*, curs: psycopg2.extensions.cursor, area_root: str) -> None:
             # log the exception
             logger.error(f'[q={queue_id}] error  {student_id}::{area_id}')
 
+        finally:
+            slot.finish()
+
     logger.info(f'queue is empty')
 
 
+def audit_queued_item(
+    curs: psycopg2.extensions.cursor,
+    row: QueueRow,
+    *,
+    area_root: str,
+    area_cache: AreaSpecCache,
+    progress: ProgressBuffer,
+    result_cache: bool,
+    checkpoint_dir: Optional[str],
+    preempt: Optional[Callable[[], None]] = None,
+) -> None:
+    """Audits one item taken off the queue, and saves its result, inside
+    the transaction that took it."""
+
+    queue_id, run_id, student_id, area_catalog, area_code, input_data, _, queued_at = row
+
+    metrics.observe('dp_queue_wait_seconds', time.time() - queued_at)
+
+    area_id = area_catalog + '/' + area_code
+    area_path = os.path.join(area_root, area_catalog, area_code + '.yaml')
+
+    logger.info(f'[q={queue_id}] begin  {student_id}::{area_id}')
+
+    # the cache has already checked the area's emphases
+    area_spec, area_fingerprint = area_cache.load_with_fingerprint(area_path)
+    student = json.loads(input_data)
+
+    cache_key: Optional[str] = None
+    if result_cache:
+        cache_key = result_cache_key(student=student, area_spec=area_spec, area_fingerprint=area_fingerprint)
+        cached = find_cached_results(curs, cache_keys=[cache_key]).get(cache_key, None)
+
+        if cached is not None:
+            # nothing has changed since the last time; save a copy of that result
+            insert_results(curs, [attr.evolve(cached, student_id=student_id, area_code=area_code, catalog=area_catalog, run=run_id, input_data=input_data)])
+
+            logger.info(f'[q={queue_id}] cached {student_id}::{area_id}')
+            metrics.inc('dp_cached_results_total')
+            return
+
+    # run the audit
+    audit(
+        curs=curs,
+        student=student,
+        area_spec=area_spec,
+        area_catalog=area_catalog,
+        area_code=area_code,
+        run_id=run_id,
+        check_emphases=False,
+        progress=progress,
+        cache_key=cache_key,
+        checkpoint_dir=checkpoint_dir,
+        preempt=preempt,
+    )
+
+
 def main() -> None:
     area_root = os.getenv('AREA_ROOT')
     assert area_root is not None, "The AREA_ROOT environment variable is required"
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--workers", "-w", type=int, help="the number of worker processes to spawn")
+    parser.add_argument("--min-workers", type=int, default=1, help="with --max-workers, the fewest worker processes to keep running")
+    parser.add_argument("--max-workers", type=int, help="grow and shrink the pool of workers with the queue and the host's load, up to this many (see dp.server.scaling)")
+    parser.add_argument("--scale-cool-off", type=float, default=300.0, help="how long, in seconds, fewer workers must be wanted before idle ones are stopped")
+    parser.add_argument("--area-cache-size", type=int, default=256, help="how many parsed area specifications each worker keeps in memory")
+    parser.add_argument("--batch-size", type=int, default=1, help="how many queue items each worker leases at once (needs the lease columns; see dp.server.queue)")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="how often, in seconds, each worker saves the progress of its running audits")
+    parser.add_argument("--timeout", type=float, default=600.0, help="the most time, in seconds, that a single audit may run before its worker is restarted (0 for no limit)")
+    parser.add_argument("--result-cache", action='store_true', help="reuse earlier results for audits whose student data, area, and engine haven't changed (needs the cache_key column; see dp.server.result_cache)")
+    parser.add_argument("--checkpoint-dir", help="save the place of long audits in this directory, so that audits interrupted by a restart, or by the time limit, resume where they stopped (see dp.checkpoint)")
+    parser.add_argument("--long-lanes", type=int, default=0, help="how many workers take the costliest queued items first, while the rest take the cheapest first (needs the cost column; see dp.server.cost)")
+    parser.add_argument("--preempt-priority", type=int, help="let items queued at this priority or above pause lower-priority audits until they are done (see dp.server.preempt)")
+    parser.add_argument("--leases", action='store_true', help="skip items leased by batched workers when taking one item at a time, for servers sharing a queue with batched ones (needs the lease columns; see dp.server.queue)")
+    parser.add_argument("--write-behind", action='store_true', help="save leased batches on a background thread while the next batch is audited")
+    parser.add_argument("--dispatch", action='store_true', help="have one connection in the supervisor take items off the queue and hand them to the workers, instead of every worker listening for itself (needs the lease columns; see dp.server.dispatch)")
+    parser.add_argument("--metrics-port", type=int, help="serve counters and histograms of the workers' audits at http://127.0.0.1:PORT/metrics (see dp.server.metrics)")
+    parser.add_argument("--metrics-textfile", help="write counters and histograms of the workers' audits to this file every few seconds, for a textfile collector (see dp.server.metrics)")
     args = parser.parse_args()
 
+    if args.dispatch and args.preempt_priority is not None:
+        parser.error("--preempt-priority needs each worker to have its own connection, so it can't be used with --dispatch")
+
     if args.workers:
         worker_count = args.workers
     else:
-        try:
-            # only available on linux
-            worker_count = len(os.sched_getaffinity(0))
-        except AttributeError:
-            worker_count = multiprocessing.cpu_count()
+        worker_count = math.floor(available_cpus() * 0.75)
+
+    scaling: Optional[ScalingPolicy] = None
+    if args.max_workers is not None:
+        if not 0 < args.min_workers <= args.max_workers:
+            parser.error("--min-workers must be at least 1, and no more than --max-workers")
 
-        worker_count = math.floor(worker_count * 0.75)
+        scaling = ScalingPolicy(min_workers=args.min_workers, max_workers=args.max_workers, cool_off=args.scale_cool_off)
+        worker_count = max(args.min_workers, min(args.max_workers, worker_count))
 
     logger.info(f"spawning {worker_count:,} worker thread{'s' if worker_count != 1 else ''}")
 
-    processes = []
-    for _ in range(worker_count):
-        p = multiprocessing.Process(target=wrapper, kwargs=dict(area_root=area_root))
-        processes.append(p)
-        p.start()
+    collector: Optional[MetricsCollector] = None
+    if args.metrics_port is not None or args.metrics_textfile is not None:
+        collector = MetricsCollector(port=args.metrics_port, textfile=args.metrics_textfile).start()
+
+    dispatcher: Optional[Dispatcher] = None
+    if args.dispatch:
+        dispatcher = Dispatcher(connect=connect, write_behind=args.write_behind).start()
+
+    # the supervisor replaces workers that crash or overrun the time limit, so
+    # the pool stays the same size however long it runs, unless it is scaling
+    supervisor = Supervisor(
+        target=wrapper,
+        kwargs=dict(area_root=area_root, area_cache_size=args.area_cache_size, batch_size=args.batch_size, write_behind=args.write_behind, progress_interval=args.progress_interval, result_cache=args.result_cache, checkpoint_dir=args.checkpoint_dir, long_lanes=args.long_lanes, preempt_priority=args.preempt_priority, leases=args.leases, metrics_events=collector.events if collector is not None else None),
+        worker_count=worker_count,
+        timeout=args.timeout or None,
+        on_failure=functools.partial(record_failure, area_root=area_root, checkpoint_dir=args.checkpoint_dir, retries={}),
+        dispatcher=dispatcher,
+        scaling=scaling,
+        queue_depth=count_queued,
+    )
+
+    try:
+        supervisor.start().run()
+    finally:
+        if dispatcher is not None:
+            dispatcher.close()
+        if collector is not None:
+            collector.close()
+
+
+def count_queued() -> int:
+    """Counts the queued items, for scaling the pool of workers."""
+
+    conn = connect()
+    try:
+        with conn.cursor() as curs:
+            curs.execute('SELECT count(*) FROM public.queue')
+            count: int = curs.fetchone()[0]
+            return count
+    finally:
+        conn.close()
+
+
+def record_failure(
+    queue_id: int,
+    error: str,
+    *,
+    area_root: str,
+    checkpoint_dir: Optional[str] = None,
+    retries: Optional[Dict[int, int]] = None,
+) -> None:
+    """Saves an error result for an item that timed out or crashed its worker.
+
+    With `checkpoint_dir`, an item whose audit saved its place is left on the
+    queue instead, up to CHECKPOINT_RETRIES times, counted in `retries`, so
+    that a long audit can finish over several attempts."""
+
+    # a fresh connection each time, so that no connection is ever shared with
+    # the forked workers
+    conn = connect()
+    try:
+        with conn.cursor() as curs:
+            if checkpoint_dir is not None and retries is not None:
+                attempts = retries.pop(queue_id, 0)
+                if attempts < CHECKPOINT_RETRIES and resumable(curs, queue_id=queue_id, area_root=area_root, checkpoint_dir=checkpoint_dir):
+                    retries[queue_id] = attempts + 1
+                    logger.warning(f'[q={queue_id}] retry  {error}; resuming from its checkpoint ({attempts + 1} of {CHECKPOINT_RETRIES})')
+                    return
+
+            if fail_queued_item(curs, queue_id=queue_id, error=json.dumps({"error": error})):
+                logger.error(f'[q={queue_id}] error  {error}')
+    finally:
+        conn.close()
+
+
+def resumable(curs: psycopg2.extensions.cursor, *, queue_id: int, area_root: str, checkpoint_dir: str) -> bool:
+    """Whether an item is still queued, and its interrupted audit saved its
+    place. Its worker's transaction, lease, or dispatcher puts it back on the
+    queue once the worker is gone."""
+
+    row = find_queued_item(curs, queue_id=queue_id)
+    if row is None:
+        return False
+
+    _, _, _, area_catalog, area_code, input_data, _, _ = row
+    area_spec = AreaSpecCache(maxsize=1).load(os.path.join(area_root, area_catalog, area_code + '.yaml'))
 
-    for p in processes:
-        p.join()
+    return has_checkpoint(student=json.loads(input_data), area_spec=area_spec, checkpoint_dir=checkpoint_dir)
 
 
 if __name__ == '__main__':
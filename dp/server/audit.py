@@ -1,22 +1,56 @@
 # mypy: warn_unreachable = False
 
-from typing import Dict, cast
+from typing import Callable, Dict, Optional, Sequence, Any, cast
 import json
+import time
 import logging
 import datetime
 
+import attr
 import psycopg2.extensions  # type: ignore
+import psycopg2.extras  # type: ignore
 import sentry_sdk
 
 from dp.run import run
+from dp.data.student import Student
 from dp.ms import pretty_ms
-from dp.audit import ResultMsg, NoAuditsCompletedMsg, ProgressMsg, Arguments, EstimateMsg
+from dp.audit import ResultMsg, NoAuditsCompletedMsg, ProgressMsg, Arguments, EstimateMsg, CheckpointMsg
+from dp.checkpoint import checkpoint_key, load_checkpoint
+
+from .progress import ProgressBuffer
+from . import metrics
 
 logger = logging.getLogger(__name__)
 
+# how often, in seconds, a running audit's place is saved
+CHECKPOINT_INTERVAL = 60.0
+
+
+def audit(
+    *,
+    area_spec: Dict,
+    area_code: str,
+    area_catalog: str,
+    student: Dict,
+    run_id: int,
+    curs: psycopg2.extensions.cursor,
+    check_emphases: bool = True,
+    progress: Optional[ProgressBuffer] = None,
+    cache_key: Optional[str] = None,
+    checkpoint_dir: Optional[str] = None,
+    preempt: Optional[Callable[[], None]] = None,
+) -> None:
+    """Runs an audit, saving its progress and result over `curs`.
+
+    With `checkpoint_dir`, the audit's place is saved once a minute, and an
+    interrupted audit of the same inputs resumes from it (see dp.checkpoint).
+    `preempt` is called each time the audit reports its progress, and may
+    audit other items before returning (see dp.server.preempt)."""
+
+    if progress is None:
+        progress = ProgressBuffer()
 
-def audit(*, area_spec: Dict, area_code: str, area_catalog: str, student: Dict, run_id: int, curs: psycopg2.extensions.cursor) -> None:
-    args = Arguments()
+    args = Arguments(check_emphases=check_emphases, progress_interval=progress.report_interval, **checkpoint_arguments(checkpoint_dir))
 
     stnum = student['stnum']
 
@@ -41,28 +75,41 @@ def audit(*, area_spec: Dict, area_code: str, area_catalog: str, student: Dict,
         scope.set_tag("catalog", area_catalog)
         scope.set_extra("result_id", result_id)
 
+    area_id = area_catalog + '/' + area_code
+    estimate: Optional[int] = None
+
     try:
         for msg in run(args, area_spec=area_spec, student=student):
             if isinstance(msg, NoAuditsCompletedMsg):
                 logger.critical('no audits completed')
+                metrics.inc('dp_audit_errors_total', area=area_id)
 
             elif isinstance(msg, EstimateMsg):
+                estimate = msg.estimate
+
+            elif isinstance(msg, CheckpointMsg):
                 pass
 
             elif isinstance(msg, ProgressMsg):
                 avg_iter_time = pretty_ms(msg.avg_iter_ms, format_sub_ms=True)
 
-                curs.execute("""
-                    UPDATE result
-                    SET iterations = %(count)s, duration = interval %(elapsed)s
-                    WHERE id = %(result_id)s
-                """, {"result_id": result_id, "count": msg.iters, "elapsed": f"{msg.elapsed_ms}ms"})
+                # progress is written along with any other in-flight audits',
+                # by the buffer's own timer if it has been started
+                progress.report(result_id, iters=msg.iters, elapsed_ms=msg.elapsed_ms)
+                if progress.thread is None:
+                    progress.flush(curs)
 
                 logger.info(f"{msg.iters:,} at {avg_iter_time} per audit")
 
+                if preempt is not None:
+                    preempt()
+
             elif isinstance(msg, ResultMsg):
                 result = msg.result.to_dict()
+                metrics.record_audit(area=area_id, iterations=msg.iters, elapsed_ms=msg.elapsed_ms, estimate=estimate, ok=result["ok"])
 
+                progress.discard(result_id)
+                write_started_at = time.perf_counter()
                 curs.execute("""
                     UPDATE result
                     SET iterations = %(total_count)s
@@ -94,14 +141,185 @@ def audit(*, area_spec: Dict, area_code: str, area_catalog: str, student: Dict,
                     "now": datetime.datetime.now(),
                 })
 
+                # only touch the cache_key column when the result cache is in use
+                if cache_key is not None:
+                    curs.execute("UPDATE result SET cache_key = %(cache_key)s WHERE id = %(result_id)s", {
+                        "result_id": result_id,
+                        "cache_key": cache_key,
+                    })
+
+                metrics.observe('dp_db_write_seconds', time.perf_counter() - write_started_at, operation='result')
+
             else:
                 logger.critical('unknown message %s', msg)
 
     except Exception as ex:
         sentry_sdk.capture_exception(ex)
+        metrics.inc('dp_audit_errors_total', area=area_id)
 
+        progress.discard(result_id)
         curs.execute("""
             UPDATE result
             SET in_progress = false, error = %(error)s
             WHERE id = %(result_id)s
         """, {"result_id": result_id, "error": json.dumps({"error": str(ex)})})
+
+
+def checkpoint_arguments(checkpoint_dir: Optional[str]) -> Dict[str, Any]:
+    if checkpoint_dir is None:
+        return {}
+    return {"checkpoint_dir": checkpoint_dir, "checkpoint_interval": CHECKPOINT_INTERVAL}
+
+
+def has_checkpoint(*, student: Dict, area_spec: Dict, checkpoint_dir: str) -> bool:
+    """Whether an interrupted audit of these inputs saved its place."""
+    return load_checkpoint(checkpoint_dir, checkpoint_key(student=student, area_spec=area_spec)) is not None
+
+
+@attr.s(slots=True, kw_only=True, auto_attribs=True)
+class ResultRow:
+    """A finished audit, held in memory until it is written to the result
+    table alongside the rest of its batch."""
+
+    student_id: str
+    area_code: str
+    catalog: str
+    run: int
+    input_data: str
+    iterations: int = 0
+    duration: str = '0ms'
+    per_iteration: str = '0ms'
+    rank: Optional[str] = None
+    max_rank: Optional[str] = None
+    result: Optional[str] = None
+    claimed_courses: Optional[str] = None
+    ok: Optional[bool] = None
+    gpa: Optional[str] = None
+    ts: Optional[datetime.datetime] = None
+    error: Optional[str] = None
+    cache_key: Optional[str] = None
+
+    def to_params(self) -> Dict[str, Any]:
+        return attr.asdict(self)
+
+
+def audit_to_row(
+    *,
+    area_spec: Dict,
+    area_code: str,
+    area_catalog: str,
+    student: Dict,
+    run_id: int,
+    check_emphases: bool = True,
+    loaded: Optional[Student] = None,
+    input_data: Optional[str] = None,
+    cache_key: Optional[str] = None,
+    checkpoint_dir: Optional[str] = None,
+    preempt: Optional[Callable[[], None]] = None,
+) -> ResultRow:
+    """Runs an audit without touching the database, for the batched queue
+    mode. Unlike audit(), no progress is reported while it runs.
+
+    `loaded` and `input_data` let the audits of one student's areas share a
+    single parsed transcript and serialized input. `preempt` is called about
+    once a second while the audit runs (see dp.server.preempt)."""
+
+    args = Arguments(check_emphases=check_emphases, **checkpoint_arguments(checkpoint_dir))
+
+    stnum = student['stnum']
+
+    logger.info("auditing #%s against %s %s", stnum, area_catalog, area_code)
+    with sentry_sdk.configure_scope() as scope:
+        scope.user = dict(id=stnum)
+        scope.set_tag("area_code", area_code)
+        scope.set_tag("catalog", area_catalog)
+
+    if input_data is None:
+        input_data = json.dumps(student)
+
+    row = ResultRow(student_id=stnum, area_code=area_code, catalog=area_catalog, run=run_id, input_data=input_data, cache_key=cache_key)
+
+    area_id = area_catalog + '/' + area_code
+    estimate: Optional[int] = None
+
+    try:
+        for msg in run(args, area_spec=area_spec, student=student, loaded=loaded):
+            if isinstance(msg, NoAuditsCompletedMsg):
+                logger.critical('no audits completed')
+                row.error = json.dumps({"error": "no audits completed"})
+                metrics.inc('dp_audit_errors_total', area=area_id)
+
+            elif isinstance(msg, EstimateMsg):
+                estimate = msg.estimate
+
+            elif isinstance(msg, CheckpointMsg):
+                pass
+
+            elif isinstance(msg, ProgressMsg):
+                if preempt is not None:
+                    preempt()
+
+            elif isinstance(msg, ResultMsg):
+                result = msg.result.to_dict()
+
+                row.iterations = msg.iters
+                row.duration = f"{msg.elapsed_ms}ms"
+                row.per_iteration = f"{msg.avg_iter_ms}ms"
+                row.rank = result["rank"]
+                row.max_rank = result["max_rank"]
+                row.result = json.dumps(result)
+                row.claimed_courses = json.dumps(msg.result.keyed_claims())
+                row.ok = result["ok"]
+                row.gpa = result["gpa"]
+                row.ts = datetime.datetime.now()
+
+                metrics.record_audit(area=area_id, iterations=msg.iters, elapsed_ms=msg.elapsed_ms, estimate=estimate, ok=result["ok"])
+
+            else:
+                logger.critical('unknown message %s', msg)
+
+    except Exception as ex:
+        sentry_sdk.capture_exception(ex)
+        row.error = json.dumps({"error": str(ex)})
+        metrics.inc('dp_audit_errors_total', area=area_id)
+
+    return row
+
+
+def insert_results(curs: psycopg2.extensions.cursor, rows: Sequence[ResultRow]) -> None:
+    """Writes a batch of finished audits to the result table."""
+
+    finished = [r.to_params() for r in rows if r.error is None]
+    failed = [r.to_params() for r in rows if r.error is not None]
+
+    # only touch the cache_key column when the result cache is in use
+    cached = [p for p in finished if p['cache_key'] is not None]
+    uncached = [p for p in finished if p['cache_key'] is None]
+
+    if cached:
+        psycopg2.extras.execute_values(curs, """
+            INSERT INTO result (student_id, area_code, catalog, run, input_data, iterations, duration, per_iteration,
+                                rank, max_rank, result, ok, ts, gpa, in_progress, claimed_courses, cache_key)
+            VALUES %s
+        """, cached, template="""(
+            %(student_id)s, %(area_code)s, %(catalog)s, %(run)s, %(input_data)s, %(iterations)s,
+            %(duration)s::interval, %(per_iteration)s::interval, %(rank)s, %(max_rank)s, %(result)s::jsonb,
+            %(ok)s, %(ts)s, %(gpa)s, false, %(claimed_courses)s::jsonb, %(cache_key)s
+        )""")
+
+    if uncached:
+        psycopg2.extras.execute_values(curs, """
+            INSERT INTO result (student_id, area_code, catalog, run, input_data, iterations, duration, per_iteration,
+                                rank, max_rank, result, ok, ts, gpa, in_progress, claimed_courses)
+            VALUES %s
+        """, uncached, template="""(
+            %(student_id)s, %(area_code)s, %(catalog)s, %(run)s, %(input_data)s, %(iterations)s,
+            %(duration)s::interval, %(per_iteration)s::interval, %(rank)s, %(max_rank)s, %(result)s::jsonb,
+            %(ok)s, %(ts)s, %(gpa)s, false, %(claimed_courses)s::jsonb
+        )""")
+
+    if failed:
+        psycopg2.extras.execute_values(curs, """
+            INSERT INTO result (student_id, area_code, catalog, run, input_data, in_progress, error)
+            VALUES %s
+        """, failed, template="(%(student_id)s, %(area_code)s, %(catalog)s, %(run)s, %(input_data)s, false, %(error)s)")
@@ -0,0 +1,415 @@
+"""The queue and result-store operations behind the batched worker loop.
+
+A batched worker (see dp.server.batched) only needs to lease items, look up
+earlier results, and save its results; a QueueBackend provides those. The
+server uses PostgresBackend, over the queue and result tables described in
+dp.server.queue. SQLiteBackend keeps the same tables in a local SQLite
+database, in WAL mode so that several worker processes can share it, and
+MemoryBackend keeps them in memory, for a single process. Together with
+dp.server.loadgen, they let the worker loop be run and measured without a
+Postgres server.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+import abc
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+import attr
+import psycopg2.extensions  # type: ignore
+import psycopg2.extras  # type: ignore
+
+from .audit import ResultRow
+from .queue import QueueRow, LANE_ORDER, lease_batch, release_dead_leases, release_leased
+from .result_cache import find_cached_results
+from .writer import WriteJob, save_results
+
+
+@attr.s(slots=True, kw_only=True, auto_attribs=True)
+class QueueItem:
+    student_id: str
+    area_catalog: str
+    area_code: str
+    input_data: str
+    run: int
+    priority: int = 1
+    cost: Optional[float] = None
+
+
+class QueueBackend(abc.ABC):
+    # identifies this worker's leases
+    worker_id: int
+
+    @abc.abstractmethod
+    def enqueue(self, items: Sequence[QueueItem]) -> None:
+        raise NotImplementedError('must define an enqueue() method')
+
+    @abc.abstractmethod
+    def release_dead_leases(self) -> int:
+        """Returns items leased by workers that have since died to the queue,
+        and returns how many there were."""
+        raise NotImplementedError('must define a release_dead_leases() method')
+
+    @abc.abstractmethod
+    def lease(self, *, size: int, lane: Optional[str] = None) -> List[QueueRow]:
+        """Leases the next `size` items, along with every other queued item
+        for the same students (see dp.server.queue.lease_batch)."""
+        raise NotImplementedError('must define a lease() method')
+
+    @abc.abstractmethod
+    def release(self, *, queue_ids: Sequence[int]) -> None:
+        """Returns items leased by this worker to the queue, unaudited."""
+        raise NotImplementedError('must define a release() method')
+
+    @abc.abstractmethod
+    def find_cached_results(self, *, cache_keys: Sequence[str]) -> Dict[str, ResultRow]:
+        """See dp.server.result_cache.find_cached_results."""
+        raise NotImplementedError('must define a find_cached_results() method')
+
+    @abc.abstractmethod
+    def save(self, *, rows: Sequence[ResultRow], queue_ids: Sequence[int]) -> bool:
+        """Saves the results and removes their items from the queue, together.
+        If that fails, the items are released, and this returns False."""
+        raise NotImplementedError('must define a save() method')
+
+    @abc.abstractmethod
+    def count_queued(self) -> int:
+        raise NotImplementedError('must define a count_queued() method')
+
+
+class PostgresBackend(QueueBackend):
+    def __init__(self, curs: psycopg2.extensions.cursor) -> None:
+        self.curs = curs
+        self.worker_id = curs.connection.get_backend_pid()
+
+    def enqueue(self, items: Sequence[QueueItem]) -> None:
+        # costs are left out, since the cost column is optional (see dp.server.cost)
+        psycopg2.extras.execute_values(self.curs, """
+            INSERT INTO queue (priority, student_id, area_catalog, area_code, input_data, run)
+            VALUES %s
+            ON CONFLICT DO NOTHING
+        """, [attr.asdict(item) for item in items], template="""(
+            %(priority)s, %(student_id)s, %(area_catalog)s, %(area_code)s, cast(%(input_data)s as jsonb), %(run)s
+        )""")
+
+    def release_dead_leases(self) -> int:
+        return release_dead_leases(self.curs)
+
+    def lease(self, *, size: int, lane: Optional[str] = None) -> List[QueueRow]:
+        return lease_batch(self.curs, size=size, lane=lane)
+
+    def release(self, *, queue_ids: Sequence[int]) -> None:
+        release_leased(self.curs, queue_ids=queue_ids, leased_by=self.worker_id)
+
+    def find_cached_results(self, *, cache_keys: Sequence[str]) -> Dict[str, ResultRow]:
+        return find_cached_results(self.curs, cache_keys=cache_keys)
+
+    def save(self, *, rows: Sequence[ResultRow], queue_ids: Sequence[int]) -> bool:
+        return save_results(self.curs, [WriteJob(rows=list(rows), queue_ids=list(queue_ids), leased_by=self.worker_id)])
+
+    def count_queued(self) -> int:
+        self.curs.execute('SELECT count(*) FROM public.queue')
+        count: int = self.curs.fetchone()[0]
+        return count
+
+
+SQLITE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS queue (
+        id integer PRIMARY KEY AUTOINCREMENT,
+        priority integer NOT NULL DEFAULT 1,
+        ts real NOT NULL,
+        student_id text NOT NULL,
+        area_catalog text NOT NULL,
+        area_code text NOT NULL,
+        input_data text NOT NULL,
+        run integer NOT NULL,
+        cost real,
+        leased_by integer,
+        leased_at real,
+        UNIQUE (student_id, area_catalog, area_code)
+    );
+
+    CREATE TABLE IF NOT EXISTS result (
+        id integer PRIMARY KEY AUTOINCREMENT,
+        student_id text NOT NULL,
+        area_code text NOT NULL,
+        catalog text NOT NULL,
+        run integer NOT NULL,
+        input_data text NOT NULL,
+        iterations integer,
+        duration text,
+        per_iteration text,
+        rank text,
+        max_rank text,
+        result text,
+        claimed_courses text,
+        ok integer,
+        gpa text,
+        ts text,
+        error text,
+        cache_key text,
+        in_progress integer NOT NULL DEFAULT 0
+    );
+
+    CREATE INDEX IF NOT EXISTS result_cache_key_idx ON result (cache_key, id);
+'''
+
+RESULT_COLUMNS = [
+    'student_id', 'area_code', 'catalog', 'run', 'input_data', 'iterations', 'duration', 'per_iteration',
+    'rank', 'max_rank', 'result', 'claimed_courses', 'ok', 'gpa', 'ts', 'error', 'cache_key',
+]
+
+
+class SQLiteBackend(QueueBackend):
+    def __init__(self, path: str) -> None:
+        """Opens (and if needed, creates) the database at `path`. Each worker
+        process should open its own."""
+
+        self.path = path
+        self.worker_id = os.getpid()
+
+        # transactions are managed explicitly, as with the server's connections
+        self.conn = sqlite3.connect(path, isolation_level=None, timeout=30.0)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SQLITE_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def enqueue(self, items: Sequence[QueueItem]) -> None:
+        now = time.time()
+
+        self.conn.execute('BEGIN IMMEDIATE')
+        self.conn.executemany('''
+            INSERT OR IGNORE INTO queue (priority, ts, student_id, area_catalog, area_code, input_data, run, cost)
+            VALUES (:priority, :ts, :student_id, :area_catalog, :area_code, :input_data, :run, :cost)
+        ''', [dict(attr.asdict(item), ts=now) for item in items])
+        self.conn.execute('COMMIT')
+
+    def release_dead_leases(self) -> int:
+        holders = [pid for (pid,) in self.conn.execute('SELECT DISTINCT leased_by FROM queue WHERE leased_by IS NOT NULL')]
+        dead = [pid for pid in holders if not process_exists(pid)]
+        if not dead:
+            return 0
+
+        cursor = self.conn.execute(f'''
+            UPDATE queue
+            SET leased_by = NULL, leased_at = NULL
+            WHERE leased_by IN ({", ".join("?" * len(dead))})
+        ''', dead)
+
+        released: int = cursor.rowcount
+        return released
+
+    def lease(self, *, size: int, lane: Optional[str] = None) -> List[QueueRow]:
+        now = time.time()
+
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can't
+        # pick the same rows
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.execute(f'''
+                UPDATE queue
+                SET leased_by = :worker, leased_at = :now
+                WHERE leased_by IS NULL
+                  AND student_id IN (
+                      SELECT student_id
+                      FROM queue
+                      WHERE leased_by IS NULL
+                      ORDER BY priority DESC, {LANE_ORDER[lane]}
+                      LIMIT :size
+                  )
+            ''', {'worker': self.worker_id, 'now': now, 'size': size})
+
+            rows: List[QueueRow] = self.conn.execute('''
+                SELECT id, run, student_id, area_catalog, area_code, input_data, priority, ts
+                FROM queue
+                WHERE leased_by = :worker
+                  AND leased_at = :now
+                ORDER BY priority DESC, ts, id
+            ''', {'worker': self.worker_id, 'now': now}).fetchall()
+
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+
+        return rows
+
+    def release(self, *, queue_ids: Sequence[int]) -> None:
+        ids = list(queue_ids)
+        self.conn.execute(f'''
+            UPDATE queue
+            SET leased_by = NULL, leased_at = NULL
+            WHERE leased_by = ? AND id IN ({", ".join("?" * len(ids))})
+        ''', [self.worker_id, *ids])
+
+    def find_cached_results(self, *, cache_keys: Sequence[str]) -> Dict[str, ResultRow]:
+        if not cache_keys:
+            return {}
+
+        keys = list(set(cache_keys))
+        rows = self.conn.execute(f'''
+            SELECT {", ".join(RESULT_COLUMNS)}
+            FROM result
+            WHERE id IN (
+                SELECT max(id)
+                FROM result
+                WHERE cache_key IN ({", ".join("?" * len(keys))})
+                  AND error IS NULL
+                  AND in_progress = 0
+                GROUP BY cache_key
+            )
+        ''', keys).fetchall()
+
+        now = datetime.datetime.now()
+
+        found: Dict[str, ResultRow] = {}
+        for values in rows:
+            row = ResultRow(**dict(zip(RESULT_COLUMNS, values)))
+            row.ok = bool(row.ok) if row.ok is not None else None
+            row.ts = now
+            found[str(row.cache_key)] = row
+
+        return found
+
+    def save(self, *, rows: Sequence[ResultRow], queue_ids: Sequence[int]) -> bool:
+        ids = list(queue_ids)
+
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.executemany(f'''
+                INSERT INTO result ({", ".join(RESULT_COLUMNS)})
+                VALUES ({", ".join(":" + c for c in RESULT_COLUMNS)})
+            ''', [sqlite_params(row) for row in rows])
+            self.conn.execute(f'''
+                DELETE FROM queue
+                WHERE leased_by = ? AND id IN ({", ".join("?" * len(ids))})
+            ''', [self.worker_id, *ids])
+            self.conn.execute('COMMIT')
+        except sqlite3.Error:
+            self.conn.execute('ROLLBACK')
+            self.conn.execute(f'''
+                UPDATE queue
+                SET leased_by = NULL, leased_at = NULL
+                WHERE leased_by = ? AND id IN ({", ".join("?" * len(ids))})
+            ''', [self.worker_id, *ids])
+            return False
+
+        return True
+
+    def count_queued(self) -> int:
+        count: int = self.conn.execute('SELECT count(*) FROM queue').fetchone()[0]
+        return count
+
+    def results(self) -> List[ResultRow]:
+        rows = self.conn.execute(f'SELECT {", ".join(RESULT_COLUMNS)} FROM result ORDER BY id').fetchall()
+        return [ResultRow(**dict(zip(RESULT_COLUMNS, values))) for values in rows]
+
+
+def sqlite_params(row: ResultRow) -> Dict[str, Any]:
+    params = row.to_params()
+    params['ts'] = row.ts.isoformat() if row.ts is not None else None
+    return params
+
+
+def process_exists(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MemoryBackend(QueueBackend):
+    """Keeps the queue and results in memory. Leases are only ever released
+    when a save fails, since every worker shares the one process."""
+
+    def __init__(self, *, worker_id: int = 1) -> None:
+        self.worker_id = worker_id
+        self.lock = threading.Lock()
+        self.queue: Dict[int, QueueItem] = {}
+        self.leases: Dict[int, int] = {}
+        self.queued_at: Dict[int, float] = {}
+        self.results: List[ResultRow] = []
+        self.next_id = 1
+
+    def enqueue(self, items: Sequence[QueueItem]) -> None:
+        now = time.time()
+        with self.lock:
+            queued = {(i.student_id, i.area_catalog, i.area_code) for i in self.queue.values()}
+            for item in items:
+                if (item.student_id, item.area_catalog, item.area_code) in queued:
+                    continue
+                self.queue[self.next_id] = item
+                self.queued_at[self.next_id] = now
+                self.next_id += 1
+
+    def release_dead_leases(self) -> int:
+        return 0
+
+    def lease(self, *, size: int, lane: Optional[str] = None) -> List[QueueRow]:
+        with self.lock:
+            available = [(queue_id, item) for queue_id, item in self.queue.items() if queue_id not in self.leases]
+            available.sort(key=lambda pair: memory_order(pair[0], pair[1], lane=lane))
+
+            students: List[str] = []
+            for _, item in available:
+                if item.student_id not in students:
+                    students.append(item.student_id)
+                if len(students) >= size:
+                    break
+
+            rows: List[QueueRow] = []
+            for queue_id, item in available:
+                if item.student_id in students:
+                    self.leases[queue_id] = self.worker_id
+                    rows.append((queue_id, item.run, item.student_id, item.area_catalog, item.area_code, item.input_data, item.priority, self.queued_at[queue_id]))
+
+            return rows
+
+    def release(self, *, queue_ids: Sequence[int]) -> None:
+        with self.lock:
+            for queue_id in queue_ids:
+                if self.leases.get(queue_id, None) == self.worker_id:
+                    del self.leases[queue_id]
+
+    def find_cached_results(self, *, cache_keys: Sequence[str]) -> Dict[str, ResultRow]:
+        keys = set(cache_keys)
+        with self.lock:
+            # later results replace earlier ones
+            return {r.cache_key: r for r in self.results if r.cache_key in keys and r.error is None and r.cache_key is not None}
+
+    def save(self, *, rows: Sequence[ResultRow], queue_ids: Sequence[int]) -> bool:
+        with self.lock:
+            self.results.extend(rows)
+            for queue_id in queue_ids:
+                if self.leases.get(queue_id, None) == self.worker_id:
+                    del self.leases[queue_id]
+                    del self.queue[queue_id]
+                    del self.queued_at[queue_id]
+        return True
+
+    def count_queued(self) -> int:
+        with self.lock:
+            return len(self.queue)
+
+
+def memory_order(queue_id: int, item: QueueItem, *, lane: Optional[str]) -> Any:
+    """Sorts items the way LANE_ORDER does, using the queue id in place of
+    the time each was queued."""
+
+    if lane is None:
+        return (-item.priority, queue_id)
+
+    # items without a cost go last in either lane
+    missing = item.cost is None
+    cost = item.cost or 0.0
+
+    return (-item.priority, missing, cost if lane == 'short' else -cost, queue_id)
@@ -1,5 +1,5 @@
 from concurrent.futures import ProcessPoolExecutor, as_completed
-from typing import Iterator, Set, Dict, Tuple, cast
+from typing import Iterator, Optional, Set, Dict, Tuple, cast
 from pathlib import Path
 import argparse
 import math
@@ -9,10 +9,14 @@ import os
 import tqdm  # type: ignore
 import urllib3  # type: ignore
 import psycopg2  # type: ignore
+import psycopg2.extensions  # type: ignore
 import sentry_sdk
 import dotenv
 
+from dp.area_cache import AreaSpecCache
 from dp.bin.expand import expand_student
+from dp.dependencies import AreaDependencies, plan_reaudits
+from dp.server.cost import AreaHistory, area_histories, estimate_cost, estimate_solutions
 
 # always resolve to the local .env file
 dotenv_path = Path(__file__).parent.parent.parent / '.env'
@@ -62,12 +66,62 @@ def batch() -> Iterator[Tuple[Dict, str]]:
                 print(f'fetching {stnum} generated an exception: {exc}')
 
 
+def load_dependency_index(path: str) -> Dict[str, AreaDependencies]:
+    with open(path, "r", encoding="utf-8") as infile:
+        return {key: AreaDependencies.from_dict(value) for key, value in json.load(infile).items()}
+
+
+def last_audited_inputs(curs: psycopg2.extensions.cursor, *, stnum: str) -> Dict[str, Dict]:
+    """Returns the input data of the student's most recent result for each
+    area, leaving out areas whose most recent audit failed."""
+
+    curs.execute('''
+        SELECT DISTINCT ON (area_code) area_code, input_data, error
+        FROM result
+        WHERE student_id = %(stnum)s
+          AND in_progress = false
+        ORDER BY area_code, id DESC
+    ''', {'stnum': stnum})
+
+    return {code: input_data for code, input_data, error in curs.fetchall() if error is None}
+
+
+def queue_cost(
+    student: Dict,
+    *,
+    catalog: str,
+    code: str,
+    area_root: str,
+    area_cache: AreaSpecCache,
+    histories: Dict[Tuple[str, str], AreaHistory],
+) -> Optional[float]:
+    try:
+        area_spec = area_cache.load(os.path.join(area_root, catalog, code + '.yaml'))
+    except Exception:
+        solutions = None
+    else:
+        solutions = estimate_solutions(student=student, area_spec=area_spec)
+
+    return estimate_cost(solutions=solutions, history=histories.get((catalog, code), None))
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--run', type=int, nargs='?')
     parser.add_argument('--code', type=str, nargs='?')
+    parser.add_argument(
+        '--changed-only', metavar='INDEX',
+        help="only queue areas whose audits could be changed by what's new in each student's data, using the dependency index "
+             "written by `dp.bin.discover --dependencies`; rebuild the index, and queue everything, when the areas or the engine change",
+    )
+    parser.add_argument(
+        '--estimate-costs', action='store_true',
+        help="attach an estimated cost to each queued audit, for the server's --long-lanes (needs the cost column; see dp.server.cost)",
+    )
     args = parser.parse_args()
 
+    index: Optional[Dict[str, AreaDependencies]] = load_dependency_index(args.changed_only) if args.changed_only else None
+
     assert SINGLE_URL
     assert BATCH_URL
 
@@ -82,6 +136,15 @@ def main() -> None:
             run = row[0]
 
     count = 0
+    unchanged = 0
+
+    area_root = os.getenv('AREA_ROOT')
+    area_cache = AreaSpecCache()
+    histories: Dict[Tuple[str, str], AreaHistory] = {}
+    if args.estimate_costs:
+        assert area_root is not None, "The AREA_ROOT environment variable is required to estimate costs"
+        with conn, conn.cursor() as curs:
+            histories = area_histories(curs)
 
     with conn, conn.cursor() as curs:
         curs.execute('''
@@ -94,7 +157,14 @@ def main() -> None:
             queued_items.add((stnum, code))
 
         for student, data in batch():
-            for stnum, catalog, code in expand_student(student=student):
+            pairs = list(expand_student(student=student))
+
+            wanted: Optional[Set[Tuple[str, str]]] = None
+            if index is not None:
+                previous = last_audited_inputs(curs, stnum=student['stnum'])
+                wanted = set(plan_reaudits(new=student, areas=[(catalog, code) for _, catalog, code in pairs], previous=previous, index=index))
+
+            for stnum, catalog, code in pairs:
                 if (stnum, code) in queued_items:
                     print('skipping', stnum, code, 'due to already being queued')
                     continue
@@ -107,15 +177,32 @@ def main() -> None:
                 if args.code is not None and args.code != code:
                     continue
 
+                if wanted is not None and (catalog, code) not in wanted:
+                    unchanged += 1
+                    continue
+
                 count += 1
 
+                if not args.estimate_costs:
+                    curs.execute('''
+                        INSERT INTO queue (priority, student_id, area_catalog, area_code, input_data, run)
+                        VALUES (1, %(stnum)s, %(catalog)s, %(code)s, cast(%(data)s as jsonb), %(run)s)
+                        ON CONFLICT DO NOTHING
+                    ''', {'stnum': stnum, 'catalog': catalog, 'code': code, 'data': data, 'run': run})
+                    continue
+
+                assert area_root is not None
+                cost = queue_cost(student, catalog=catalog, code=code, area_root=area_root, area_cache=area_cache, histories=histories)
+
                 curs.execute('''
-                    INSERT INTO queue (priority, student_id, area_catalog, area_code, input_data, run)
-                    VALUES (1, %(stnum)s, %(catalog)s, %(code)s, cast(%(data)s as jsonb), %(run)s)
+                    INSERT INTO queue (priority, student_id, area_catalog, area_code, input_data, run, cost)
+                    VALUES (1, %(stnum)s, %(catalog)s, %(code)s, cast(%(data)s as jsonb), %(run)s, %(cost)s)
                     ON CONFLICT DO NOTHING
-                ''', {'stnum': stnum, 'catalog': catalog, 'code': code, 'data': data, 'run': run})
+                ''', {'stnum': stnum, 'catalog': catalog, 'code': code, 'data': data, 'run': run, 'cost': cost})
 
     print(f'queued {count:,} audits in the database')
+    if index is not None:
+        print(f'skipped {unchanged:,} audits that nothing new could change')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,198 @@
+"""The batched worker loop: lease a batch of queued items, audit them, and
+save their results together (see dp.server.queue for the leases, and
+dp.server.backend for where they come from).
+"""
+
+from typing import Dict, List, Optional, Tuple
+import logging
+import json
+import time
+import os
+
+import attr
+import sentry_sdk
+
+from dp.area_cache import AreaSpecCache
+from dp.data.student import Student
+
+from .audit import audit_to_row, ResultRow
+from .backend import QueueBackend
+from .preempt import Preemptor
+from .queue import QueueRow
+from .result_cache import result_cache_key
+from .supervisor import WorkerSlot
+from .writer import ResultWriter, WriteJob
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def process_queue_batched(
+    *,
+    backend: QueueBackend,
+    slot: WorkerSlot,
+    area_root: str,
+    area_cache: AreaSpecCache,
+    batch_size: int,
+    writer: Optional[ResultWriter],
+    result_cache: bool,
+    checkpoint_dir: Optional[str],
+    lane: Optional[str],
+    preemptor: Optional[Preemptor],
+) -> None:
+    """Leases, audits, and saves batches of queued items until the queue is
+    empty. `writer` saves the batches in the background, instead of through
+    the backend; it only works with PostgresBackend."""
+
+    # loop until the queue is empty
+    while True:
+        # put back anything leased by workers that have since died
+        released = backend.release_dead_leases()
+        if released:
+            logger.warning(f're-queued {released:,} items leased by dead workers')
+
+        # the lease is committed right away; nothing is held open while we audit
+        rows = backend.lease(size=batch_size, lane=lane)
+
+        # if there are no more, return to waiting
+        if not rows:
+            break
+
+        logger.info(f'leased {len(rows):,} items')
+
+        now = time.time()
+        for row in rows:
+            metrics.observe('dp_queue_wait_seconds', now - row[7])
+
+        # each student's data is parsed, and their transcript loaded, once
+        # for all of their areas
+        groups = group_by_student(rows)
+        students: Dict[str, Dict] = {input_data: json.loads(input_data) for input_data, _ in groups}
+        loaded_students = {input_data: load_shared_student(student) for input_data, student in students.items()}
+
+        # look up every item's area, and its previous result, before auditing any of them
+        specs, cached = prepare_batch(
+            backend=backend,
+            rows=rows,
+            students=students,
+            loaded_students=loaded_students,
+            area_root=area_root,
+            area_cache=area_cache,
+            result_cache=result_cache,
+        )
+
+        results: List[ResultRow] = []
+        for input_data, group in groups:
+            for queue_id, run_id, student_id, area_catalog, area_code, _, priority, _ in group:
+                if queue_id not in specs:
+                    continue
+
+                area_id = area_catalog + '/' + area_code
+                area_spec, cache_key = specs[queue_id]
+
+                previous = cached.get(cache_key, None) if cache_key is not None else None
+                if previous is not None:
+                    # nothing has changed since the last time; save a copy of that result
+                    logger.info(f'[q={queue_id}] cached {student_id}::{area_id}')
+                    metrics.inc('dp_cached_results_total')
+                    results.append(attr.evolve(previous, student_id=student_id, area_code=area_code, catalog=area_catalog, run=run_id, input_data=input_data))
+                    continue
+
+                logger.info(f'[q={queue_id}] begin  {student_id}::{area_id}')
+                slot.begin(queue_id)
+
+                results.append(audit_to_row(
+                    student=students[input_data],
+                    area_spec=area_spec,
+                    area_catalog=area_catalog,
+                    area_code=area_code,
+                    run_id=run_id,
+                    check_emphases=False,
+                    loaded=loaded_students[input_data],
+                    input_data=input_data,
+                    cache_key=cache_key,
+                    checkpoint_dir=checkpoint_dir,
+                    preempt=preemptor.hook(priority) if preemptor is not None else None,
+                ))
+
+        slot.finish()
+
+        # the results are written and the batch removed from the queue
+        # together, so a crash before then simply re-queues the whole batch
+        queue_ids = [row[0] for row in rows]
+
+        if writer is not None:
+            # hand the batch off, and start on the next one
+            writer.submit(WriteJob(rows=results, queue_ids=queue_ids, leased_by=backend.worker_id))
+            continue
+
+        if not backend.save(rows=results, queue_ids=queue_ids):
+            # wait for the next notification, rather than immediately leasing
+            # the same batch again
+            break
+
+        logger.info(f'commit {len(results):,} results')
+
+    logger.info('queue is empty')
+
+
+def prepare_batch(
+    *,
+    backend: QueueBackend,
+    rows: List[QueueRow],
+    students: Dict[str, Dict],
+    loaded_students: Dict[str, Optional[Student]],
+    area_root: str,
+    area_cache: AreaSpecCache,
+    result_cache: bool,
+) -> Tuple[Dict[int, Tuple[Dict, Optional[str]]], Dict[str, ResultRow]]:
+    """Loads the area for each leased item, and finds any earlier results
+    that can be reused. Items whose area can't be loaded are left out."""
+
+    specs: Dict[int, Tuple[Dict, Optional[str]]] = {}
+    for queue_id, run_id, student_id, area_catalog, area_code, input_data, _, _ in rows:
+        area_path = os.path.join(area_root, area_catalog, area_code + '.yaml')
+
+        try:
+            # the cache has already checked the area's emphases
+            area_spec, area_fingerprint = area_cache.load_with_fingerprint(area_path)
+        except Exception as exc:
+            # drop the item along with the rest of the batch, just so it
+            # doesn't endlessly re-run itself
+            sentry_sdk.capture_exception(exc)
+            logger.error(f'[q={queue_id}] error  {student_id}::{area_catalog}/{area_code}')
+            continue
+
+        cache_key: Optional[str] = None
+        if result_cache:
+            cache_key = result_cache_key(
+                student=students[input_data],
+                area_spec=area_spec,
+                area_fingerprint=area_fingerprint,
+                loaded=loaded_students[input_data],
+            )
+
+        specs[queue_id] = (area_spec, cache_key)
+
+    cached = backend.find_cached_results(cache_keys=[key for _, key in specs.values() if key is not None])
+
+    return specs, cached
+
+
+def load_shared_student(student: Dict) -> Optional[Student]:
+    try:
+        return Student.load(student)
+    except Exception:
+        # leave it to each audit to load the student, and record the error
+        return None
+
+
+def group_by_student(rows: List[QueueRow]) -> List[Tuple[str, List[QueueRow]]]:
+    """Groups leased items by their input data, keeping the order in which
+    each student was first leased."""
+
+    groups: Dict[str, List[QueueRow]] = {}
+    for row in rows:
+        groups.setdefault(row[5], []).append(row)
+
+    return list(groups.items())
@@ -0,0 +1,102 @@
+"""Estimating how long each queued audit will take, so that workers can take
+the short ones first.
+
+When `dp.server.batch` is run with `--estimate-costs`, it attaches a cost to
+each item it queues: the number of solutions the area's search could check
+for that student (the same estimate that `python3 -m dp --estimate` prints),
+multiplied by how long, on average, one solution of that area has taken in
+recent runs. Most audits stop well before checking every solution, so the
+cost is an upper bound, but it ranks the items well enough to schedule them.
+When the search can't be estimated, the area's average duration is used.
+
+With `--long-lanes N`, the server's first N workers take the costliest items
+first, and the rest take the cheapest first, within each priority. The many
+short audits then finish quickly across most of the workers, while the few
+long ones run on their own lanes from the start, instead of being picked up
+last and stretching out the end of the batch. Items without a cost are taken
+after the others, in either lane.
+
+Costs need one extra column on the queue table:
+
+    ALTER TABLE queue ADD COLUMN cost double precision;
+"""
+
+from typing import Dict, Optional, Tuple
+import logging
+
+import attr
+import psycopg2.extensions  # type: ignore
+
+from dp.audit import Arguments, EstimateMsg
+from dp.run import run
+
+logger = logging.getLogger(__name__)
+
+# how long one solution is assumed to take, for areas without a history
+DEFAULT_ITERATION_MS = 1.0
+
+
+@attr.s(cache_hash=True, slots=True, kw_only=True, frozen=True, auto_attribs=True)
+class AreaHistory:
+    per_iteration_ms: float
+    duration_ms: float
+
+
+def area_histories(curs: psycopg2.extensions.cursor, *, days: int = 30) -> Dict[Tuple[str, str], AreaHistory]:
+    """Returns the average time per solution, and per audit, of each area's
+    successful audits over the last `days` days, keyed by (catalog, code)."""
+
+    curs.execute('''
+        SELECT catalog
+             , area_code
+             , avg(extract(epoch FROM per_iteration)) * 1000
+             , avg(extract(epoch FROM duration)) * 1000
+        FROM result
+        WHERE error IS NULL
+          AND in_progress = false
+          AND ts > now() - make_interval(days => %(days)s)
+        GROUP BY catalog, area_code
+    ''', {'days': days})
+
+    return {
+        (catalog, code): AreaHistory(per_iteration_ms=float(per_iteration_ms or 0), duration_ms=float(duration_ms or 0))
+        for catalog, code, per_iteration_ms, duration_ms in curs.fetchall()
+    }
+
+
+def estimate_solutions(*, student: Dict, area_spec: Dict) -> Optional[int]:
+    """Returns how many solutions an audit of the area could check for this
+    student, or None if the area can't be audited."""
+
+    args = Arguments(estimate_only=True, check_emphases=False)
+
+    try:
+        for msg in run(args, student=student, area_spec=area_spec):
+            if isinstance(msg, EstimateMsg):
+                return msg.estimate
+    except Exception as ex:
+        logger.warning("could not estimate %s for #%s: %s", area_spec.get('code', None), student.get('stnum', None), ex)
+
+    return None
+
+
+def estimate_cost(*, solutions: Optional[int], history: Optional[AreaHistory]) -> Optional[float]:
+    """Returns the expected cost of an audit, in milliseconds, or None if
+    there's nothing to go on."""
+
+    if solutions is None:
+        return history.duration_ms if history is not None else None
+
+    per_iteration_ms = history.per_iteration_ms if history is not None and history.per_iteration_ms > 0 else DEFAULT_ITERATION_MS
+
+    return solutions * per_iteration_ms
+
+
+def worker_lane(index: int, *, long_lanes: int) -> Optional[str]:
+    """Returns which lane the `index`th worker pulls from: "long", "short",
+    or None when lanes aren't in use."""
+
+    if long_lanes <= 0:
+        return None
+
+    return 'long' if index < long_lanes else 'short'
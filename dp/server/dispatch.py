@@ -0,0 +1,356 @@
+"""Handing queued items to the workers from a single connection.
+
+Normally, every worker opens its own connection and LISTENs for queue
+updates, and on each NOTIFY they all wake up and race for the new items,
+most of them finding nothing. With `--dispatch`, the supervisor's process
+runs a Dispatcher instead: it alone LISTENs, leases batches, looks up cached
+results, and saves results, over one connection (two with `--write-behind`).
+Each worker has a pipe to the dispatcher, and runs the batched worker loop
+(see dp.server.batched) against a DispatchedBackend, which sends each queue
+operation down that pipe; the workers themselves never connect to the
+database.
+
+A worker asking for a lease when the queue is empty waits until the
+dispatcher has something for it. Leases are held by the dispatcher's
+connection (see dp.server.queue), which keeps track of which worker has each
+item. When a worker dies, the supervisor records the item it was on as
+failed (see dp.server.supervisor), and then tells the dispatcher, which
+returns the rest of that worker's batch to the queue.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple, TYPE_CHECKING
+from multiprocessing.connection import Connection, wait
+import multiprocessing
+import itertools
+import threading
+import logging
+import time
+
+import psycopg2.extensions  # type: ignore
+import sentry_sdk
+
+from .audit import ResultRow
+from .backend import QueueBackend, QueueItem, PostgresBackend
+from .queue import QueueRow
+from .writer import ResultWriter, WriteJob
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .supervisor import WorkerSlot
+
+logger = logging.getLogger(__name__)
+
+
+class DispatchedBackend(QueueBackend):
+    """A worker's end of the pipe to the dispatcher. Each call waits for the
+    dispatcher's answer; lease() waits until there is something to lease,
+    and meanwhile marks the worker's `slot` as waiting for work."""
+
+    def __init__(self, channel: Connection, *, slot: Optional['WorkerSlot'] = None) -> None:
+        self.channel = channel
+        self.slot = slot
+        # leases are held by the dispatcher's connection
+        self.worker_id = self.request('worker_id')
+
+    def request(self, method: str, **kwargs: Any) -> Any:
+        self.channel.send((method, kwargs))
+        return self.channel.recv()
+
+    def enqueue(self, items: Sequence[QueueItem]) -> None:
+        self.request('enqueue', items=list(items))
+
+    def release_dead_leases(self) -> int:
+        # the dispatcher does this itself, once for everyone
+        return 0
+
+    def lease(self, *, size: int, lane: Optional[str] = None) -> List[QueueRow]:
+        if self.slot is None:
+            rows: List[QueueRow] = self.request('lease', size=size, lane=lane)
+            return rows
+
+        # everything this worker had is saved by now; whatever the dispatcher
+        # leases it is returned to the queue if the worker is stopped
+        with self.slot.waiting():
+            rows = self.request('lease', size=size, lane=lane)
+        return rows
+
+    def release(self, *, queue_ids: Sequence[int]) -> None:
+        self.request('release', queue_ids=list(queue_ids))
+
+    def find_cached_results(self, *, cache_keys: Sequence[str]) -> Dict[str, ResultRow]:
+        found: Dict[str, ResultRow] = self.request('find_cached_results', cache_keys=list(cache_keys))
+        return found
+
+    def save(self, *, rows: Sequence[ResultRow], queue_ids: Sequence[int]) -> bool:
+        saved: bool = self.request('save', rows=list(rows), queue_ids=list(queue_ids))
+        return saved
+
+    def count_queued(self) -> int:
+        count: int = self.request('count_queued')
+        return count
+
+
+class Dispatcher:
+    def __init__(
+        self,
+        *,
+        connect: Optional[Callable[[], psycopg2.extensions.connection]] = None,
+        write_behind: bool = False,
+        poll_interval: float = 5.0,
+    ) -> None:
+        """`connect` opens the dispatcher's connection. `poll_interval` is
+        how often, in seconds, waiting workers are offered the queue even
+        without a notification."""
+
+        self.connect = connect
+        self.write_behind = write_behind
+        self.poll_interval = poll_interval
+
+        # messages from the supervisor's thread
+        self.control, self.control_send = multiprocessing.Pipe(duplex=False)
+        self.lock = threading.Lock()
+        self.opened: Dict[int, Tuple[int, Connection]] = {}
+        self.tokens = itertools.count()
+
+        # everything below belongs to the dispatcher's thread
+        self.backend: Optional[QueueBackend] = None
+        self.writer: Optional[ResultWriter] = None
+        self.channels: Dict[int, Connection] = {}
+        self.waiting: Dict[int, Dict[str, Any]] = {}
+        self.outstanding: Dict[int, Set[int]] = {}
+        self.closed = False
+
+        self.thread: Optional[threading.Thread] = None
+        self.error: Optional[BaseException] = None
+
+        self.leases = 0
+        self.saves = 0
+
+    def start(self, *, backend: Optional[QueueBackend] = None) -> 'Dispatcher':
+        """Starts dispatching on a background thread. A `backend` is used in
+        place of the Postgres connection, and is polled instead of LISTENed to."""
+
+        if backend is not None:
+            self.thread = threading.Thread(target=self.dispatch, args=(backend,), name='dispatcher', daemon=True)
+        else:
+            self.thread = threading.Thread(target=self.run, name='dispatcher', daemon=True)
+
+        self.thread.start()
+        return self
+
+    def is_alive(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def open_channel(self, index: int) -> Connection:
+        """Makes a pipe for a newly-started `index`th worker, and returns the
+        worker's end. Replaces any earlier worker's pipe."""
+
+        ours, theirs = multiprocessing.Pipe()
+        with self.lock:
+            token = next(self.tokens)
+            self.opened[token] = (index, ours)
+        self.control_send.send(('opened', token))
+        return theirs
+
+    def worker_exited(self, index: int) -> None:
+        """Returns the items still leased to the `index`th worker to the queue."""
+
+        self.control_send.send(('exited', index))
+
+    def close(self) -> None:
+        if self.is_alive():
+            self.control_send.send(('close', None))
+            assert self.thread is not None
+            self.thread.join()
+
+    def run(self) -> None:
+        try:
+            assert self.connect is not None
+            conn: psycopg2.extensions.connection = self.connect()
+            with conn.cursor() as curs:
+                channel = 'dp_queue_update'
+                curs.execute(f"LISTEN {channel};")
+                logger.info(f"LISTEN {channel};")
+
+                if self.write_behind:
+                    self.writer = ResultWriter(connect=self.connect).start()
+
+                self.dispatch(PostgresBackend(curs), notifications=conn)
+        except BaseException as exc:
+            self.error = exc
+            sentry_sdk.capture_exception(exc)
+            logger.exception('the dispatcher has stopped')
+        finally:
+            if self.writer is not None:
+                self.writer.close()
+
+    def dispatch(self, backend: QueueBackend, *, notifications: Optional[psycopg2.extensions.connection] = None) -> None:
+        """Answers the workers until closed. Without `notifications`, waiting
+        workers are only offered the queue every `poll_interval` seconds."""
+
+        self.backend = backend
+
+        # put back anything leased by an earlier dispatcher
+        released = backend.release_dead_leases()
+        if released:
+            logger.warning(f're-queued {released:,} items leased by dead workers')
+
+        next_offer = time.monotonic() + self.poll_interval
+
+        while not self.closed:
+            channels = dict(self.channels)
+            sources: List[Any] = [self.control, *channels.values()]
+            if notifications is not None:
+                sources.append(notifications)
+
+            ready = wait(sources, timeout=max(0.0, next_offer - time.monotonic()))
+
+            if notifications is not None and notifications in ready:
+                notifications.poll()
+                notifications.notifies.clear()
+
+            # finish the workers' requests before handling any exits, so that
+            # a worker's last save is never returned to the queue
+            for index, channel in channels.items():
+                if channel in ready:
+                    self.receive(index, channel)
+
+            if self.control in ready:
+                self.handle_control(*self.control.recv())
+
+            # however busy the pipes are, waiting workers are offered the
+            # queue at least every poll_interval
+            if notifications in ready or time.monotonic() >= next_offer:
+                self.offer_queue()
+                next_offer = time.monotonic() + self.poll_interval
+
+    def receive(self, index: int, channel: Connection) -> None:
+        try:
+            method, kwargs = channel.recv()
+        except (EOFError, OSError):
+            # the worker has gone; the supervisor will say so
+            if self.channels.get(index, None) is channel:
+                del self.channels[index]
+            return
+
+        answered, answer = self.handle(index, method, kwargs)
+        if answered:
+            self.answer(channel, answer)
+
+    def answer(self, channel: Connection, answer: Any) -> None:
+        try:
+            channel.send(answer)
+        except OSError:
+            # the worker has gone, and its leases will be returned once the
+            # supervisor says so
+            pass
+
+    def handle(self, index: int, method: str, kwargs: Dict[str, Any]) -> Tuple[bool, Any]:
+        """Carries out a worker's request. Returns whether to answer right
+        away, and the answer."""
+
+        assert self.backend is not None
+
+        if method == 'worker_id':
+            return True, self.backend.worker_id
+
+        if method == 'lease':
+            rows = self.lease(index, **kwargs)
+            if not rows:
+                # answered once something is queued
+                self.waiting[index] = kwargs
+                return False, None
+            return True, rows
+
+        if method == 'save':
+            return True, self.save(index, **kwargs)
+
+        if method == 'release':
+            self.outstanding.get(index, set()).difference_update(kwargs['queue_ids'])
+            released = self.backend.release(**kwargs)
+
+            # nothing is notified when items go back on the queue
+            self.offer_queue()
+            return True, released
+
+        if method in ('enqueue', 'find_cached_results', 'count_queued'):
+            return True, getattr(self.backend, method)(**kwargs)
+
+        raise ValueError(f'unknown request {method!r}')
+
+    def lease(self, index: int, *, size: int, lane: Optional[str] = None) -> List[QueueRow]:
+        assert self.backend is not None
+
+        rows = self.backend.lease(size=size, lane=lane)
+        if rows:
+            self.leases += 1
+            self.outstanding.setdefault(index, set()).update(row[0] for row in rows)
+            logger.info(f'leased {len(rows):,} items to worker {index}')
+
+        return rows
+
+    def save(self, index: int, *, rows: Sequence[ResultRow], queue_ids: Sequence[int]) -> bool:
+        assert self.backend is not None
+
+        self.outstanding.get(index, set()).difference_update(queue_ids)
+        self.saves += 1
+
+        if self.writer is not None:
+            self.writer.submit(WriteJob(rows=list(rows), queue_ids=list(queue_ids), leased_by=self.backend.worker_id))
+            return True
+
+        return self.backend.save(rows=rows, queue_ids=queue_ids)
+
+    def offer_queue(self) -> None:
+        """Leases a batch for each waiting worker, until the queue runs out."""
+
+        for index, kwargs in list(self.waiting.items()):
+            channel = self.channels.get(index, None)
+            if channel is None:
+                del self.waiting[index]
+                continue
+
+            rows = self.lease(index, **kwargs)
+            if not rows:
+                break
+
+            del self.waiting[index]
+            self.answer(channel, rows)
+
+    def handle_control(self, message: str, arg: Optional[int]) -> None:
+        if message == 'close':
+            self.closed = True
+
+        elif message == 'opened' and arg is not None:
+            with self.lock:
+                index, channel = self.opened.pop(arg)
+
+            previous = self.channels.get(index, None)
+            if previous is not None:
+                previous.close()
+            self.channels[index] = channel
+
+        elif message == 'exited' and arg is not None:
+            self.release_worker(arg)
+
+    def release_worker(self, index: int) -> None:
+        assert self.backend is not None
+
+        self.waiting.pop(index, None)
+
+        # save anything the worker sent before it went
+        channel = self.channels.pop(index, None)
+        if channel is not None:
+            try:
+                while channel.poll(0):
+                    method, kwargs = channel.recv()
+                    if method == 'save':
+                        self.save(index, **kwargs)
+            except (EOFError, OSError):
+                pass
+            channel.close()
+
+        queue_ids = self.outstanding.pop(index, set())
+        if queue_ids:
+            self.backend.release(queue_ids=sorted(queue_ids))
+            logger.warning(f're-queued {len(queue_ids):,} items leased to worker {index}')
+            self.offer_queue()
@@ -0,0 +1,249 @@
+"""Measuring the batched worker loop without a Postgres server.
+
+    AREA_ROOT=... python3 -m dp.server.loadgen students/ --workers 1 2 4 8
+
+For each worker count, this queues an audit of every area of every student
+file in the directory into a fresh SQLite database (see dp.server.backend),
+starts that many worker processes running the server's batched loop (see
+dp.server.batched) against it, and waits for them to empty the queue. It
+then reports the audits per second, and how much of the workers' time was
+spent in queue and result-store operations, rather than auditing.
+
+`--backend memory` runs a single worker in this process instead, against an
+in-memory queue, which leaves out SQLite's own overhead.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+from pathlib import Path
+import multiprocessing
+import multiprocessing.sharedctypes
+import argparse
+import tempfile
+import logging
+import json
+import time
+import os
+
+import attr
+
+from dp.area_cache import AreaSpecCache
+from dp.bin.expand import expand_student
+
+from .audit import ResultRow
+from .backend import QueueBackend, QueueItem, SQLiteBackend, MemoryBackend
+from .batched import process_queue_batched
+from .queue import QueueRow
+from .supervisor import WorkerSlot
+
+logger = logging.getLogger(__name__)
+
+
+class TimedBackend(QueueBackend):
+    """Passes every call through to another backend, and adds up how long
+    the calls took."""
+
+    def __init__(self, backend: QueueBackend) -> None:
+        self.backend = backend
+        self.worker_id = backend.worker_id
+        self.seconds = 0.0
+        self.saved = 0
+
+    def timed(self, started_at: float) -> None:
+        self.seconds += time.perf_counter() - started_at
+
+    def enqueue(self, items: Sequence[QueueItem]) -> None:
+        started_at = time.perf_counter()
+        self.backend.enqueue(items)
+        self.timed(started_at)
+
+    def release_dead_leases(self) -> int:
+        started_at = time.perf_counter()
+        released = self.backend.release_dead_leases()
+        self.timed(started_at)
+        return released
+
+    def lease(self, *, size: int, lane: Optional[str] = None) -> List[QueueRow]:
+        started_at = time.perf_counter()
+        rows = self.backend.lease(size=size, lane=lane)
+        self.timed(started_at)
+        return rows
+
+    def release(self, *, queue_ids: Sequence[int]) -> None:
+        started_at = time.perf_counter()
+        self.backend.release(queue_ids=queue_ids)
+        self.timed(started_at)
+
+    def find_cached_results(self, *, cache_keys: Sequence[str]) -> Dict[str, ResultRow]:
+        started_at = time.perf_counter()
+        found = self.backend.find_cached_results(cache_keys=cache_keys)
+        self.timed(started_at)
+        return found
+
+    def save(self, *, rows: Sequence[ResultRow], queue_ids: Sequence[int]) -> bool:
+        started_at = time.perf_counter()
+        saved = self.backend.save(rows=rows, queue_ids=queue_ids)
+        self.timed(started_at)
+        if saved:
+            self.saved += len(rows)
+        return saved
+
+    def count_queued(self) -> int:
+        return self.backend.count_queued()
+
+
+@attr.s(slots=True, kw_only=True, auto_attribs=True)
+class LoadReport:
+    workers: int
+    audits: int
+    elapsed: float
+    worker_seconds: float
+    queue_seconds: float
+
+    def audits_per_second(self) -> float:
+        return self.audits / self.elapsed if self.elapsed else 0.0
+
+    def queue_overhead(self) -> float:
+        """The share of the workers' time spent on queue and result-store
+        operations."""
+        return self.queue_seconds / self.worker_seconds if self.worker_seconds else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"workers={self.workers} audits={self.audits:,} elapsed={self.elapsed:.1f}s "
+            f"audits/sec={self.audits_per_second():.1f} queue overhead={self.queue_overhead():.1%}"
+        )
+
+
+def load_queue_items(directory: str, *, run: int = 1) -> List[QueueItem]:
+    """Makes a queue item for every area of every student file in `directory`."""
+
+    items: List[QueueItem] = []
+    for path in sorted(Path(directory).glob('*.json')):
+        input_data = path.read_text(encoding='utf-8')
+        student = json.loads(input_data)
+
+        for stnum, catalog, code in expand_student(student=student):
+            items.append(QueueItem(student_id=stnum, area_catalog=catalog, area_code=code, input_data=input_data, run=run))
+
+    return items
+
+
+def drain(backend: QueueBackend, *, slot: WorkerSlot, area_root: str, batch_size: int, result_cache: bool) -> Tuple[int, float, float]:
+    """Runs the batched worker loop until the queue is empty. Returns the
+    number of results saved, the time taken, and the time spent in the
+    backend."""
+
+    timed = TimedBackend(backend)
+    started_at = time.perf_counter()
+
+    process_queue_batched(
+        backend=timed,
+        slot=slot,
+        area_root=area_root,
+        area_cache=AreaSpecCache(),
+        batch_size=batch_size,
+        writer=None,
+        result_cache=result_cache,
+        checkpoint_dir=None,
+        lane=None,
+        preemptor=None,
+    )
+
+    return timed.saved, time.perf_counter() - started_at, timed.seconds
+
+
+def sqlite_worker(*, path: str, slot: WorkerSlot, area_root: str, batch_size: int, result_cache: bool, stats: 'multiprocessing.Queue[Tuple[int, float, float]]') -> None:
+    backend = SQLiteBackend(path)
+    try:
+        stats.put(drain(backend, slot=slot, area_root=area_root, batch_size=batch_size, result_cache=result_cache))
+    finally:
+        backend.close()
+
+
+def run_sqlite(items: Sequence[QueueItem], *, workers: int, area_root: str, batch_size: int, result_cache: bool) -> LoadReport:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'queue.sqlite3')
+
+        backend = SQLiteBackend(path)
+        backend.enqueue(items)
+        backend.close()
+
+        queue_ids = multiprocessing.sharedctypes.RawArray('q', workers)
+        started = multiprocessing.sharedctypes.RawArray('d', workers)
+        stats: 'multiprocessing.Queue[Tuple[int, float, float]]' = multiprocessing.Queue()
+
+        started_at = time.perf_counter()
+
+        processes = [
+            multiprocessing.Process(target=sqlite_worker, kwargs=dict(
+                path=path,
+                slot=WorkerSlot(index=i, queue_ids=queue_ids, started_at=started),
+                area_root=area_root,
+                batch_size=batch_size,
+                result_cache=result_cache,
+                stats=stats,
+            ))
+            for i in range(workers)
+        ]
+        for p in processes:
+            p.start()
+
+        results = [stats.get() for _ in processes]
+        for p in processes:
+            p.join()
+
+        elapsed = time.perf_counter() - started_at
+
+    return LoadReport(
+        workers=workers,
+        audits=sum(saved for saved, _, _ in results),
+        elapsed=elapsed,
+        worker_seconds=sum(seconds for _, seconds, _ in results),
+        queue_seconds=sum(queue_seconds for _, _, queue_seconds in results),
+    )
+
+
+def run_memory(items: Sequence[QueueItem], *, area_root: str, batch_size: int, result_cache: bool) -> LoadReport:
+    backend = MemoryBackend()
+    backend.enqueue(items)
+
+    slot = WorkerSlot(index=0, queue_ids=[0], started_at=[0.0])
+    saved, seconds, queue_seconds = drain(backend, slot=slot, area_root=area_root, batch_size=batch_size, result_cache=result_cache)
+
+    return LoadReport(workers=1, audits=saved, elapsed=seconds, worker_seconds=seconds, queue_seconds=queue_seconds)
+
+
+def main() -> None:
+    area_root = os.getenv('AREA_ROOT')
+    assert area_root is not None, "The AREA_ROOT environment variable is required"
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("students", help="a directory of student files to replay")
+    parser.add_argument("--workers", "-w", type=int, nargs='+', default=[1], help="the worker counts to measure")
+    parser.add_argument("--backend", choices=("sqlite", "memory"), default="sqlite")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--result-cache", action='store_true')
+    args = parser.parse_args()
+
+    if args.backend == 'memory' and args.workers != [1]:
+        parser.error("the memory backend only runs a single worker")
+
+    logging.basicConfig(level=logging.WARNING)
+
+    items = load_queue_items(args.students)
+    print(f"replaying {len(items):,} audits from {args.students}")
+
+    for workers in args.workers:
+        if args.backend == 'memory':
+            report = run_memory(items, area_root=area_root, batch_size=args.batch_size, result_cache=args.result_cache)
+        else:
+            report = run_sqlite(items, workers=workers, area_root=area_root, batch_size=args.batch_size, result_cache=args.result_cache)
+
+        print(report)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,286 @@
+"""Counters and histograms of the server's audits, in the Prometheus text
+format.
+
+With `--metrics-port PORT`, the server answers `GET /metrics` on localhost
+with them; with `--metrics-textfile PATH`, it writes the same text to PATH
+every few seconds, for node_exporter's textfile collector.
+
+Each worker reports what it does with inc() and observe(), which send the
+report over a multiprocessing queue to the supervisor's process. The
+supervisor adds the reports up, so the numbers cover every worker, including
+those that have since been restarted. Until configure() is called, inc() and
+observe() do nothing.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import multiprocessing
+import socketserver
+import threading
+import tempfile
+import logging
+import queue
+import time
+import os
+
+import attr
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# ('inc' or 'observe', metric name, labels, value)
+Event = Tuple[str, str, Labels, float]
+
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 600.0)
+ITERATION_BUCKETS = (1.0, 10.0, 100.0, 1_000.0, 10_000.0, 100_000.0, 1_000_000.0)
+RATIO_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0)
+WAIT_BUCKETS = (1.0, 5.0, 30.0, 60.0, 300.0, 900.0, 3_600.0, 14_400.0, 86_400.0)
+WRITE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+COUNTERS = {
+    'dp_audits_total': 'Audits completed, by area and whether the student passed.',
+    'dp_audit_errors_total': 'Audits that failed with an error, by area.',
+    'dp_audit_timeouts_total': 'Audits stopped for overrunning the time limit.',
+    'dp_worker_restarts_total': 'Workers replaced after crashing or overrunning the time limit.',
+    'dp_cached_results_total': 'Results copied from an earlier audit by the result cache.',
+}
+
+HISTOGRAMS = {
+    'dp_audit_duration_seconds': ('How long each audit took, by area.', DURATION_BUCKETS),
+    'dp_audit_iterations': ('How many solutions each audit checked, by area.', ITERATION_BUCKETS),
+    'dp_audit_estimate_ratio': ('The solutions each audit checked, as a share of the estimated number of solutions.', RATIO_BUCKETS),
+    'dp_queue_wait_seconds': ('How long each item waited in the queue before a worker took it.', WAIT_BUCKETS),
+    'dp_db_write_seconds': ('How long saving results took, by operation.', WRITE_BUCKETS),
+}
+
+# how many reports may pile up before new ones are dropped
+MAX_PENDING_EVENTS = 10_000
+
+_events: Optional['multiprocessing.Queue[Event]'] = None
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    # http.server.ThreadingHTTPServer, which needs Python 3.7
+    daemon_threads = True
+
+
+def configure(events: Optional['multiprocessing.Queue[Event]']) -> None:
+    """Sends this process's reports to `events`, or turns them off."""
+
+    global _events
+    _events = events
+
+
+def inc(name: str, amount: float = 1.0, **labels: str) -> None:
+    report('inc', name, labels, amount)
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    report('observe', name, labels, value)
+
+
+def report(kind: str, name: str, labels: Dict[str, str], value: float) -> None:
+    if _events is None:
+        return
+
+    try:
+        _events.put_nowait((kind, name, tuple(sorted(labels.items())), float(value)))
+    except queue.Full:
+        # a metric is never worth holding up an audit
+        pass
+
+
+def record_audit(*, area: str, iterations: int, elapsed_ms: float, estimate: Optional[int], ok: bool) -> None:
+    inc('dp_audits_total', area=area, ok='true' if ok else 'false')
+    observe('dp_audit_duration_seconds', elapsed_ms / 1000, area=area)
+    observe('dp_audit_iterations', iterations, area=area)
+
+    if estimate:
+        observe('dp_audit_estimate_ratio', iterations / estimate)
+
+
+@attr.s(slots=True, kw_only=True, auto_attribs=True)
+class Histogram:
+    buckets: Sequence[float]
+    counts: List[int]
+    total: float = 0.0
+    count: int = 0
+
+    @staticmethod
+    def empty(buckets: Sequence[float]) -> 'Histogram':
+        return Histogram(buckets=buckets, counts=[0] * len(buckets))
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    """Adds up reported events. Safe to use from several threads."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def apply(self, event: Event) -> None:
+        kind, name, labels, value = event
+
+        with self.lock:
+            if kind == 'inc' and name in COUNTERS:
+                self.counters[(name, labels)] = self.counters.get((name, labels), 0.0) + value
+
+            elif kind == 'observe' and name in HISTOGRAMS:
+                if (name, labels) not in self.histograms:
+                    self.histograms[(name, labels)] = Histogram.empty(HISTOGRAMS[name][1])
+                self.histograms[(name, labels)].observe(value)
+
+            else:
+                logger.warning('unknown metric %s %s', kind, name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        with self.lock:
+            for name, help_text in COUNTERS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for (key, labels), value in sorted(self.counters.items()):
+                    if key == name:
+                        lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+
+            for name, (help_text, _) in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (key, labels), histogram in sorted(self.histograms.items(), key=lambda pair: pair[0]):
+                    if key == name:
+                        lines.extend(render_histogram(name, labels, histogram))
+
+        return '\n'.join(lines) + '\n'
+
+
+def render_histogram(name: str, labels: Labels, histogram: Histogram) -> List[str]:
+    lines = [
+        f'{name}_bucket{format_labels(labels + (("le", format_value(bound)),))} {count}'
+        for bound, count in zip(histogram.buckets, histogram.counts)
+    ]
+    lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {histogram.count}')
+    lines.append(f'{name}_sum{format_labels(labels)} {format_value(histogram.total)}')
+    lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+    return lines
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+
+    escaped = (
+        (key, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+class MetricsCollector:
+    """Runs in the supervisor's process: gathers the workers' reports, and
+    serves or writes out their totals."""
+
+    def __init__(self, *, port: Optional[int] = None, textfile: Optional[str] = None, interval: float = 15.0) -> None:
+        self.port = port
+        self.textfile = textfile
+        self.interval = interval
+
+        self.metrics = Metrics()
+        self.events: 'multiprocessing.Queue[Event]' = multiprocessing.Queue(maxsize=MAX_PENDING_EVENTS)
+        self.server: Optional[_Server] = None
+        self.threads: List[threading.Thread] = []
+
+    def start(self) -> 'MetricsCollector':
+        # the supervisor reports its own timeouts and restarts
+        configure(self.events)
+
+        self.threads.append(threading.Thread(target=self.collect, name='metrics-collector', daemon=True))
+
+        if self.port is not None:
+            self.server = _Server(('127.0.0.1', self.port), metrics_handler(self.metrics))
+            self.threads.append(threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True))
+            logger.info(f'serving metrics on http://127.0.0.1:{self.port}/metrics')
+
+        if self.textfile is not None:
+            self.threads.append(threading.Thread(target=self.write_periodically, name='metrics-textfile', daemon=True))
+
+        for thread in self.threads:
+            thread.start()
+
+        return self
+
+    def collect(self) -> None:
+        while True:
+            self.metrics.apply(self.events.get())
+
+    def write_periodically(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except OSError as exc:
+                logger.error(f'could not write metrics to {self.textfile}: {exc}')
+
+    def write(self) -> None:
+        if self.textfile is None:
+            return
+
+        directory = os.path.dirname(os.path.abspath(self.textfile))
+
+        # the textfile collector may read the file at any moment, so it is
+        # written alongside and renamed into place
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            # mkstemp makes the file readable only by its owner, which would
+            # hide it from a collector running as another user
+            os.fchmod(fd, 0o644)
+            with os.fdopen(fd, 'w', encoding='utf-8') as outfile:
+                outfile.write(self.metrics.render())
+            os.replace(tmp_path, self.textfile)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def close(self) -> None:
+        configure(None)
+
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+        if self.textfile is not None:
+            self.write()
+
+
+def metrics_handler(metrics: Metrics) -> Type[BaseHTTPRequestHandler]:
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            # keep the scrapes out of the server's log
+            pass
+
+    return MetricsHandler
@@ -0,0 +1,119 @@
+"""Letting urgent queue items cut in front of audits that are already running.
+
+What-if audits (see dp.server.whatif) are queued at a high priority, but if
+every worker is partway through a long batch audit, they wait until one of
+those audits finishes. With `--preempt-priority N`, a worker that is auditing
+an item queued below priority N checks the queue each time the audit reports
+its progress. If an item at priority N or above is waiting, the worker pauses
+its audit, audits the urgent item, saves it, and then picks the paused audit
+back up where it stopped.
+
+The paused audit is held in memory, as a suspended generator, so its place in
+the search doesn't need to be saved anywhere, and its result is the same as if
+it had never been paused (though its duration includes the pause). Urgent
+items are taken and saved over a second connection, because the worker's own
+connection may be holding the paused item's transaction open.
+"""
+
+from typing import Callable, Optional
+import logging
+import time
+
+import psycopg2.extensions  # type: ignore
+import sentry_sdk
+
+from .queue import QueueRow, dequeue_urgent
+from .supervisor import WorkerSlot
+
+logger = logging.getLogger(__name__)
+
+
+class Preemptor:
+    def __init__(
+        self,
+        *,
+        connect: Callable[[], psycopg2.extensions.connection],
+        priority: int,
+        slot: WorkerSlot,
+        serve: Callable[[psycopg2.extensions.cursor, QueueRow], None],
+        leases: bool = False,
+    ) -> None:
+        """`serve` audits and saves one urgent item, using the given cursor.
+        `leases` should be set when the worker leases batches (see
+        dp.server.queue), so that items leased by other workers are left
+        alone."""
+
+        self.connect = connect
+        self.priority = priority
+        self.slot = slot
+        self.serve = serve
+        self.leases = leases
+
+        self.conn: Optional[psycopg2.extensions.connection] = None
+        self.serving = False
+        self.served = 0
+
+    def hook(self, priority: int) -> Optional[Callable[[], None]]:
+        """Returns the check to run during the audit of an item queued at
+        `priority`, or None if nothing may preempt it."""
+
+        if priority >= self.priority:
+            return None
+
+        return self.check
+
+    def check(self) -> None:
+        """Audits every waiting urgent item, then returns to the paused audit."""
+
+        # an urgent item is never itself preempted
+        if self.serving:
+            return
+
+        if self.conn is None:
+            self.conn = self.connect()
+
+        paused = self.slot.current()
+        paused_at = time.time()
+
+        self.serving = True
+        try:
+            with self.conn.cursor() as curs:
+                while self.serve_one(curs):
+                    self.served += 1
+        finally:
+            self.serving = False
+
+            # don't count the pause against the paused audit's time limit
+            if paused is not None:
+                queue_id, started_at = paused
+                self.slot.begin(queue_id, started_at=started_at + (time.time() - paused_at))
+            else:
+                self.slot.finish()
+
+    def serve_one(self, curs: psycopg2.extensions.cursor) -> bool:
+        curs.execute('BEGIN;')
+
+        row = dequeue_urgent(curs, priority=self.priority, leases=self.leases)
+        if row is None:
+            curs.execute('COMMIT;')
+            return False
+
+        queue_id = row[0]
+        logger.info(f'[q={queue_id}] preempting the current audit')
+        self.slot.begin(queue_id)
+
+        try:
+            self.serve(curs, row)
+        except Exception as exc:
+            sentry_sdk.capture_exception(exc)
+            logger.error(f'[q={queue_id}] error  while preempting')
+        finally:
+            # commit the deletion either way, just so it doesn't endlessly re-run itself
+            curs.execute('COMMIT;')
+
+        return True
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
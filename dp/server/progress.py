@@ -0,0 +1,103 @@
+from typing import Dict, Tuple, Optional
+import threading
+import logging
+import time
+
+import attr
+import psycopg2.extensions  # type: ignore
+import psycopg2.extras  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# how many times an audit reports its progress for each time it is written,
+# so that a write is never more than a fraction of an interval late
+REPORTS_PER_FLUSH = 4
+
+
+@attr.s(slots=True, kw_only=True, auto_attribs=True)
+class ProgressBuffer:
+    """Holds the latest progress of every in-flight audit, and writes all of
+    it to the result table in one statement, at most every `interval`
+    seconds.
+
+    Only the most recent report for each result row is kept, so audits that
+    report more often than the buffer is flushed cost nothing extra. Once
+    started, the buffer also flushes itself on a timer, so that progress is
+    written on schedule even while no new reports arrive."""
+
+    interval: float = 5.0
+    pending: Dict[int, Tuple[int, float]] = attr.Factory(dict)
+    last_flush: float = 0.0
+
+    lock: threading.Lock = attr.Factory(threading.Lock)
+    stopped: threading.Event = attr.Factory(threading.Event)
+    thread: Optional[threading.Thread] = None
+
+    @property
+    def report_interval(self) -> float:
+        """How often, in seconds, audits should report their progress."""
+        return self.interval / REPORTS_PER_FLUSH
+
+    def start(self, conn: psycopg2.extensions.connection) -> 'ProgressBuffer':
+        """Flushes the buffer every `interval` seconds, over a cursor of
+        `conn`, so that the writes join any transaction open on it."""
+
+        self.thread = threading.Thread(target=self.flush_periodically, args=(conn,), name='progress-writer', daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def flush_periodically(self, conn: psycopg2.extensions.connection) -> None:
+        with conn.cursor() as curs:
+            while not self.stopped.wait(max(0.0, self.last_flush + self.interval - time.perf_counter())):
+                try:
+                    if not self.flush(curs):
+                        # nothing was due; wait out a whole interval
+                        self.last_flush = time.perf_counter()
+                except psycopg2.Error as exc:
+                    logger.error(f'could not save the progress of the running audits: {exc}')
+
+    def report(self, result_id: int, *, iters: int, elapsed_ms: float) -> None:
+        with self.lock:
+            self.pending[result_id] = (iters, elapsed_ms)
+
+    def discard(self, result_id: int) -> None:
+        """Forgets a result's progress, once its final values have been written."""
+        with self.lock:
+            self.pending.pop(result_id, None)
+
+    def is_due(self, *, now: Optional[float] = None) -> bool:
+        if now is None:
+            now = time.perf_counter()
+        return bool(self.pending) and now - self.last_flush >= self.interval
+
+    def flush(self, curs: psycopg2.extensions.cursor, *, force: bool = False) -> int:
+        """Writes the pending progress, if it's time to. Returns the number
+        of result rows updated."""
+
+        with self.lock:
+            now = time.perf_counter()
+            if not force and not self.is_due(now=now):
+                return 0
+
+            rows = [(result_id, iters, f"{elapsed_ms}ms") for result_id, (iters, elapsed_ms) in self.pending.items()]
+            self.pending.clear()
+            self.last_flush = now
+
+            if not rows:
+                return 0
+
+            # a finished audit's final values are never overwritten
+            psycopg2.extras.execute_values(curs, """
+                UPDATE result
+                SET iterations = v.iterations, duration = v.duration
+                FROM (VALUES %s) AS v (id, iterations, duration)
+                WHERE result.id = v.id
+                  AND result.in_progress
+            """, rows, template="(%s, %s, %s::interval)")
+
+            return len(rows)
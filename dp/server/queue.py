@@ -0,0 +1,215 @@
+"""The SQL behind the server's audit queue.
+
+Workers either take one row at a time, deleting it inside a transaction that
+stays open for the length of the audit, or lease a batch of rows at once.
+
+Leases need two extra columns on the queue table:
+
+    ALTER TABLE queue ADD COLUMN leased_by int, ADD COLUMN leased_at timestamptz;
+
+Workers taking one row at a time only look at these columns with `--leases`,
+which keeps them from taking rows leased by batched servers sharing the
+queue; without it, they work with a queue table that lacks the columns.
+
+A lease records the worker connection's backend pid and the time of the
+lease, and is committed immediately, so no transaction is held open while
+the batch is audited. Once the batch's results are written, its rows are
+deleted in the same transaction. A lease always takes every unleased item
+for the students it picks, so that one worker audits all of a student's
+areas together. If a worker dies mid-batch, its connection
+disappears from pg_stat_activity, and the next worker to lease a batch puts
+those rows back on the queue.
+
+An item whose audit runs too long, or takes its worker down with it, is
+removed from the queue by the supervisor (see dp.server.supervisor) and
+recorded as an error, rather than being retried. With `--checkpoint-dir`, an
+item whose audit saved its place is instead left on the queue a few times,
+so that its next audit resumes from the checkpoint.
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+import psycopg2.extensions  # type: ignore
+
+# id, run, student_id, area_catalog, area_code, input_data, priority, and when
+# it was queued, in seconds since the epoch
+QueueRow = Tuple[int, int, str, str, str, str, int, float]
+
+# how each lane orders the items queued at the same priority (see dp.server.cost)
+LANE_ORDER = {
+    None: 'ts',
+    'short': 'cost ASC NULLS LAST, ts',
+    'long': 'cost DESC NULLS LAST, ts',
+}
+
+
+def dequeue_one(curs: psycopg2.extensions.cursor, *, lane: Optional[str] = None, leases: bool = False) -> Optional[QueueRow]:
+    """Deletes the next queued item in the worker's `lane` and returns it.
+    Must be called inside a transaction, which should be committed once the
+    audit has been saved. With `leases`, leased items are left alone."""
+
+    curs.execute(f'''
+        DELETE
+        FROM public.queue
+        WHERE id = (
+            SELECT id
+            FROM public.queue
+            {"WHERE leased_by IS NULL" if leases else ""}
+            ORDER BY priority DESC, {LANE_ORDER[lane]}
+                FOR UPDATE
+                    SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING id, run, student_id, area_catalog, area_code, input_data::text, priority, extract(epoch FROM ts)::float8;
+    ''')
+
+    row: Optional[QueueRow] = curs.fetchone()
+    return row
+
+
+def dequeue_urgent(curs: psycopg2.extensions.cursor, *, priority: int, leases: bool = False) -> Optional[QueueRow]:
+    """Like dequeue_one, but only takes an item queued at `priority` or
+    above. With `leases`, items leased by batched workers are left alone."""
+
+    curs.execute(f'''
+        DELETE
+        FROM public.queue
+        WHERE id = (
+            SELECT id
+            FROM public.queue
+            WHERE priority >= %(priority)s
+              {"AND leased_by IS NULL" if leases else ""}
+            ORDER BY priority DESC, ts
+                FOR UPDATE
+                    SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING id, run, student_id, area_catalog, area_code, input_data::text, priority, extract(epoch FROM ts)::float8;
+    ''', {'priority': priority})
+
+    row: Optional[QueueRow] = curs.fetchone()
+    return row
+
+
+def release_dead_leases(curs: psycopg2.extensions.cursor) -> int:
+    """Returns items leased by connections that have since gone away to the
+    queue. Returns the number of items released."""
+
+    # a backend pid can be reused by a later connection, so a lease is only
+    # live if the connection holding that pid started before the lease did
+    curs.execute('''
+        UPDATE public.queue q
+        SET leased_by = NULL, leased_at = NULL
+        WHERE q.leased_by IS NOT NULL
+          AND NOT EXISTS (
+              SELECT 1
+              FROM pg_stat_activity a
+              WHERE a.pid = q.leased_by
+                AND a.backend_start <= q.leased_at
+          )
+    ''')
+
+    released: int = curs.rowcount
+    return released
+
+
+def lease_batch(curs: psycopg2.extensions.cursor, *, size: int, lane: Optional[str] = None) -> List[QueueRow]:
+    """Leases the next `size` unleased items in the worker's `lane` to this
+    connection, along with every other unleased item for the same students,
+    and returns them. The lease is committed as soon as the statement
+    finishes.
+
+    The batch can be larger than `size`, by however many other areas those
+    students have waiting. The students are picked by locking their next
+    items, skipping any that another worker is leasing at the same time, so
+    concurrent workers pick different students instead of contending for
+    the same ones."""
+
+    curs.execute(f'''
+        WITH picked AS (
+            SELECT student_id
+            FROM public.queue
+            WHERE leased_by IS NULL
+            ORDER BY priority DESC, {LANE_ORDER[lane]}
+                FOR UPDATE
+                    SKIP LOCKED
+            LIMIT %(size)s
+        )
+        UPDATE public.queue
+        SET leased_by = pg_backend_pid(), leased_at = now()
+        WHERE id IN (
+            SELECT id
+            FROM public.queue
+            WHERE leased_by IS NULL
+              AND student_id IN (SELECT student_id FROM picked)
+                FOR UPDATE
+                    SKIP LOCKED
+        )
+        RETURNING id, run, student_id, area_catalog, area_code, input_data::text, priority, extract(epoch FROM ts)::float8;
+    ''', {'size': size})
+
+    rows: List[QueueRow] = curs.fetchall()
+    return rows
+
+
+def release_leased(curs: psycopg2.extensions.cursor, *, queue_ids: Sequence[int], leased_by: int) -> None:
+    """Returns items leased by the `leased_by` connection to the queue."""
+
+    curs.execute('''
+        UPDATE public.queue
+        SET leased_by = NULL, leased_at = NULL
+        WHERE id = ANY(%(ids)s)
+          AND leased_by = %(leased_by)s
+    ''', {'ids': list(queue_ids), 'leased_by': leased_by})
+
+
+def delete_leased(curs: psycopg2.extensions.cursor, *, queue_ids: Sequence[int], leased_by: int) -> int:
+    """Removes finished items from the queue, as long as the `leased_by`
+    connection still holds their lease. Returns how many were removed.
+
+    The lease is checked against an explicit backend pid, rather than the
+    current connection's, so that results can be saved over a different
+    connection than the one that leased the items."""
+
+    curs.execute('''
+        DELETE
+        FROM public.queue
+        WHERE id = ANY(%(ids)s)
+          AND leased_by = %(leased_by)s
+    ''', {'ids': list(queue_ids), 'leased_by': leased_by})
+
+    deleted: int = curs.rowcount
+    return deleted
+
+
+def find_queued_item(curs: psycopg2.extensions.cursor, *, queue_id: int) -> Optional[QueueRow]:
+    """Returns an item that is still queued, leased or not, without taking it."""
+
+    curs.execute('''
+        SELECT id, run, student_id, area_catalog, area_code, input_data::text, priority, extract(epoch FROM ts)::float8
+        FROM public.queue
+        WHERE id = %(id)s
+    ''', {'id': queue_id})
+
+    row: Optional[QueueRow] = curs.fetchone()
+    return row
+
+
+def fail_queued_item(curs: psycopg2.extensions.cursor, *, queue_id: int, error: str) -> bool:
+    """Removes an item from the queue, leased or not, and records `error` as
+    its result. Returns False if the item was no longer queued."""
+
+    curs.execute('''
+        WITH item AS (
+            DELETE
+            FROM public.queue
+            WHERE id = %(id)s
+            RETURNING run, student_id, area_catalog, area_code, input_data
+        )
+        INSERT INTO result (student_id, area_code, catalog, run, input_data, in_progress, error)
+        SELECT student_id, area_code, area_catalog, run, input_data, false, %(error)s
+        FROM item
+    ''', {'id': queue_id, 'error': error})
+
+    failed: bool = curs.rowcount > 0
+    return failed
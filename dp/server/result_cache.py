@@ -0,0 +1,98 @@
+"""Reusing the results of earlier runs for audits whose inputs haven't changed.
+
+Every finished result is saved with a cache key: a hash of the parts of the
+student's input data that the area can see (see dp.relevance), of the area
+specification, and of the audit engine's source (see dp.fingerprint), so a
+new course or grade that no rule in the area could match doesn't invalidate
+that area's result. Before auditing a queued item, a worker looks for an
+earlier successful result with the same key, and if it finds one, saves a
+copy of it under the new run instead of auditing again. Errors are never
+reused.
+
+The cache needs one extra column on the result table:
+
+    ALTER TABLE result ADD COLUMN cache_key text;
+    CREATE INDEX result_cache_key_idx ON result (cache_key, id DESC)
+        WHERE cache_key IS NOT NULL AND error IS NULL AND in_progress = false;
+"""
+
+from typing import Dict, Optional, Sequence
+import datetime
+import logging
+
+import psycopg2.extensions  # type: ignore
+
+from dp.data.student import Student
+from dp.fingerprint import json_fingerprint, engine_version
+from dp.relevance import relevant_projection
+
+from .audit import ResultRow
+
+logger = logging.getLogger(__name__)
+
+
+def result_cache_key(*, student: Dict, area_spec: Dict, area_fingerprint: str, loaded: Optional[Student] = None) -> str:
+    try:
+        projected = relevant_projection(student, area_spec=area_spec, student=loaded)
+    except Exception as ex:
+        # the audit will report the problem; key on the whole input meanwhile
+        logger.warning("could not project the input data onto %s: %s", area_spec.get('code', None), ex)
+        projected = student
+
+    return json_fingerprint({
+        'engine': engine_version(),
+        'area': area_fingerprint,
+        'student': projected,
+    })
+
+
+def find_cached_results(curs: psycopg2.extensions.cursor, *, cache_keys: Sequence[str]) -> Dict[str, ResultRow]:
+    """Looks up the most recent successful result for each of the cache keys,
+    and returns copies of the ones that were found, keyed by cache key.
+
+    The copies still carry the earlier run's student, area, and run number;
+    use attr.evolve to point them at the item being audited."""
+
+    if not cache_keys:
+        return {}
+
+    curs.execute('''
+        SELECT DISTINCT ON (cache_key)
+            cache_key, student_id, area_code, catalog, run, input_data::text,
+            iterations, duration::text, per_iteration::text, rank::text, max_rank::text,
+            result::text, claimed_courses::text, ok, gpa::text
+        FROM result
+        WHERE cache_key = ANY(%(keys)s)
+          AND error IS NULL
+          AND in_progress = false
+        ORDER BY cache_key, id DESC
+    ''', {'keys': list(set(cache_keys))})
+
+    now = datetime.datetime.now()
+
+    found: Dict[str, ResultRow] = {}
+    for (
+        cache_key, student_id, area_code, catalog, run, input_data,
+        iterations, duration, per_iteration, rank, max_rank,
+        result, claimed_courses, ok, gpa,
+    ) in curs.fetchall():
+        found[cache_key] = ResultRow(
+            student_id=student_id,
+            area_code=area_code,
+            catalog=catalog,
+            run=run,
+            input_data=input_data,
+            iterations=iterations,
+            duration=duration,
+            per_iteration=per_iteration,
+            rank=rank,
+            max_rank=max_rank,
+            result=result,
+            claimed_courses=claimed_courses,
+            ok=ok,
+            gpa=gpa,
+            ts=now,
+            cache_key=cache_key,
+        )
+
+    return found
@@ -0,0 +1,92 @@
+"""Deciding how many workers the server should run.
+
+With `--max-workers`, the supervisor (see dp.server.supervisor) resizes its
+pool every few seconds, between `--min-workers` and `--max-workers`. It
+measures how much work is queued, how much CPU time each audit has taken
+lately, and how busy the host is, and asks a ScalingPolicy how many workers
+that calls for:
+
+- enough to get through the queued audits in about `drain_seconds`, given
+  the CPU time each audit takes and the share of a core each worker uses;
+- but no more than fit on the cores that the host's other processes (as
+  seen in the load average) leave free.
+
+More workers are started as soon as they're wanted. Workers are only stopped
+once fewer have been wanted for the whole cool-off period, and only while
+they're waiting for work, with nothing leased or left to save.
+"""
+
+from typing import Optional
+import math
+import os
+
+import attr
+
+
+def available_cpus() -> int:
+    try:
+        # only available on linux
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+@attr.s(cache_hash=True, slots=True, kw_only=True, frozen=True, auto_attribs=True)
+class PoolLoad:
+    # how many workers are running, and how many of them are auditing
+    workers: int
+    busy: int
+    # how many items are queued, including any being audited
+    queued: int
+    # the average CPU seconds per audit, if any have finished lately
+    cpu_per_audit: Optional[float]
+    # the share of a core that an auditing worker uses
+    cpu_share: float
+    load_average: float
+    cpus: int
+
+
+@attr.s(slots=True, kw_only=True, auto_attribs=True)
+class ScalingPolicy:
+    min_workers: int
+    max_workers: int
+    cool_off: float = 300.0
+    drain_seconds: float = 60.0
+
+    # when fewer workers than are running first started being wanted
+    wanted_fewer_since: Optional[float] = None
+
+    def wanted(self, load: PoolLoad) -> int:
+        """How many workers the current load calls for, ignoring the cool-off."""
+
+        cpu_share = max(load.cpu_share, 0.1)
+
+        if load.queued <= 0:
+            demand = 0
+        elif load.cpu_per_audit is None:
+            demand = load.queued
+        else:
+            demand = math.ceil(load.queued * load.cpu_per_audit / (self.drain_seconds * cpu_share))
+
+        # the load average counts our own auditing workers, too
+        others = max(0.0, load.load_average - load.busy * cpu_share)
+        capacity = math.floor(max(0.0, load.cpus - others) / cpu_share)
+
+        return max(self.min_workers, min(self.max_workers, demand, capacity))
+
+    def decide(self, load: PoolLoad, *, now: float) -> int:
+        """How many workers should be running."""
+
+        wanted = self.wanted(load)
+
+        if wanted >= load.workers:
+            self.wanted_fewer_since = None
+            return wanted
+
+        if self.wanted_fewer_since is None:
+            self.wanted_fewer_since = now
+
+        if now - self.wanted_fewer_since < self.cool_off:
+            return load.workers
+
+        return wanted
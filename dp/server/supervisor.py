@@ -0,0 +1,377 @@
+"""Keeping the server's worker processes running.
+
+The supervisor starts a number of worker processes and watches them.
+Each worker has a slot in shared memory where it records the queue item it is
+auditing, and when it started. If an audit runs past the time limit, the
+supervisor kills the worker; if a worker dies on its own, the supervisor
+notices. Either way, the item the worker was on is reported as failed (so it
+is not picked up and run forever), and a fresh worker takes its place.
+
+With a Dispatcher (see dp.server.dispatch), each worker is also given a pipe
+to it, and the dispatcher is told when a worker is replaced.
+
+With a ScalingPolicy (see dp.server.scaling), the supervisor also grows and
+shrinks the pool as the queue and the host's load change. Each worker adds
+the CPU and wall-clock time of every audit it finishes to its slot, so the
+supervisor can tell how costly the recent audits have been. It only stops
+workers that have said, in their slot, that they are waiting for work.
+"""
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import multiprocessing
+import multiprocessing.sharedctypes
+import contextlib
+import logging
+import signal
+import time
+import os
+
+from . import metrics
+from .dispatch import Dispatcher
+from .scaling import PoolLoad, ScalingPolicy, available_cpus
+
+logger = logging.getLogger(__name__)
+
+# what each worker is doing, as far as stopping it goes
+WORKING = 0
+WAITING = 1
+RETIRING = 2
+
+
+class WorkerSlot:
+    """One worker's entry in the shared table of in-flight queue items.
+
+    A worker only ever writes its own slot, and the supervisor only reads it,
+    so no lock is needed: the queue id is cleared while the start time is
+    written, and the supervisor re-reads the queue id to make sure it didn't
+    see a half-written entry.
+
+    `usage`, if given, holds three running totals per worker: the CPU
+    seconds and wall-clock seconds spent on audits, and how many audits
+    there were.
+
+    `states`, if given, holds whether each worker is WORKING, WAITING for
+    work, or RETIRING; it, unlike the rest, is only changed under `lock`."""
+
+    def __init__(self, *, index: int, queue_ids: Any, started_at: Any, usage: Any = None, states: Any = None, lock: Any = None) -> None:
+        self.index = index
+        self.queue_ids = queue_ids
+        self.started_at = started_at
+        self.usage = usage
+        self.states = states
+        self.lock = lock
+
+        # when this process began its current audit, by the clock and in CPU time
+        self.begun: Optional[Tuple[float, float]] = None
+
+    def begin(self, queue_id: int, *, started_at: Optional[float] = None) -> None:
+        self.account()
+
+        self.queue_ids[self.index] = 0
+        self.started_at[self.index] = time.time() if started_at is None else started_at
+        self.queue_ids[self.index] = queue_id
+
+        self.begun = (time.perf_counter(), time.process_time())
+
+    def finish(self) -> None:
+        self.account()
+        self.queue_ids[self.index] = 0
+
+    def account(self) -> None:
+        """Adds the time taken by the audit that just ended to the totals."""
+
+        if self.begun is None or self.usage is None:
+            return
+
+        wall_started, cpu_started = self.begun
+        self.begun = None
+
+        self.usage[self.index * 3] += time.process_time() - cpu_started
+        self.usage[self.index * 3 + 1] += time.perf_counter() - wall_started
+        self.usage[self.index * 3 + 2] += 1
+
+    @contextlib.contextmanager
+    def waiting(self, *, idle: bool = True) -> Iterator[None]:
+        """Marks the worker as waiting for work, if it's `idle`, while the
+        block runs: it holds no leases, and has no results left to save, so
+        the supervisor may stop it. If the supervisor has begun to, the worker
+        exits once the block is done, rather than starting on anything."""
+
+        if not idle or self.states is None:
+            yield
+            return
+
+        with self.lock:
+            self.states[self.index] = WAITING
+
+        try:
+            yield
+        finally:
+            with self.lock:
+                retiring = self.states[self.index] == RETIRING
+                self.states[self.index] = WORKING
+
+        if retiring:
+            raise SystemExit(0)
+
+    def retire(self) -> bool:
+        """Claims the worker for stopping, if it's waiting for work."""
+
+        if self.states is None:
+            return False
+
+        with self.lock:
+            if self.states[self.index] != WAITING:
+                return False
+            self.states[self.index] = RETIRING
+            return True
+
+    def reset(self) -> None:
+        self.finish()
+        if self.states is not None:
+            with self.lock:
+                self.states[self.index] = WORKING
+
+    def current(self) -> Optional[Tuple[int, float]]:
+        """Returns the queue item the worker is on, and when it started it."""
+
+        queue_id = self.queue_ids[self.index]
+        started_at = self.started_at[self.index]
+
+        if queue_id == 0 or queue_id != self.queue_ids[self.index]:
+            return None
+
+        return (queue_id, started_at)
+
+
+class Supervisor:
+    def __init__(
+        self,
+        *,
+        target: Callable[..., None],
+        kwargs: Dict[str, Any],
+        worker_count: int,
+        on_failure: Callable[[int, str], None],
+        timeout: Optional[float] = None,
+        poll_interval: float = 1.0,
+        dispatcher: Optional[Dispatcher] = None,
+        scaling: Optional[ScalingPolicy] = None,
+        queue_depth: Optional[Callable[[], int]] = None,
+        scale_interval: float = 15.0,
+    ) -> None:
+        """`target` is called in each worker process with `kwargs`, plus the
+        worker's `slot`, and with a `dispatcher`, the worker's `channel` to
+        it. `on_failure` is called, in the supervisor's process, with the
+        queue id of each item that timed out or crashed its worker, and a
+        description of what happened.
+
+        With `scaling`, `worker_count` workers are started, and the pool is
+        resized every `scale_interval` seconds; `queue_depth` returns how
+        many items are queued."""
+
+        self.target = target
+        self.kwargs = kwargs
+        self.worker_count = worker_count
+        self.on_failure = on_failure
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.dispatcher = dispatcher
+        self.scaling = scaling
+        self.queue_depth = queue_depth
+        self.scale_interval = scale_interval
+
+        # there is a slot for every worker the pool could grow to
+        slot_count = max(worker_count, scaling.max_workers) if scaling is not None else worker_count
+
+        self.queue_ids = multiprocessing.sharedctypes.RawArray('q', slot_count)
+        self.started_at = multiprocessing.sharedctypes.RawArray('d', slot_count)
+        self.usage = multiprocessing.sharedctypes.RawArray('d', slot_count * 3)
+        self.states = multiprocessing.sharedctypes.RawArray('b', slot_count)
+        self.states_lock = multiprocessing.Lock()
+        self.slots = [
+            WorkerSlot(index=i, queue_ids=self.queue_ids, started_at=self.started_at, usage=self.usage, states=self.states, lock=self.states_lock)
+            for i in range(slot_count)
+        ]
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * slot_count
+
+        self.restarts = 0
+        self.timeouts = 0
+
+        # the usage totals as of the last resize, and what they worked out to
+        self.measured_usage = (0.0, 0.0, 0.0)
+        self.cpu_per_audit: Optional[float] = None
+        self.cpu_share = 1.0
+
+    def start(self) -> 'Supervisor':
+        for index in range(self.worker_count):
+            self.spawn(index)
+        return self
+
+    def spawn(self, index: int) -> None:
+        self.slots[index].reset()
+
+        kwargs = dict(self.kwargs, slot=self.slots[index])
+        if self.dispatcher is not None:
+            kwargs['channel'] = self.dispatcher.open_channel(index)
+
+        p = multiprocessing.Process(target=self.target, kwargs=kwargs, name=f'worker-{index}')
+        p.start()
+        self.processes[index] = p
+
+        if self.dispatcher is not None:
+            # only the worker holds its end of the pipe
+            kwargs['channel'].close()
+
+    def run(self) -> None:
+        """Watches the workers until interrupted, then stops them."""
+
+        next_scale = time.time() + self.scale_interval
+
+        try:
+            while True:
+                self.check()
+
+                if self.scaling is not None and time.time() >= next_scale:
+                    self.scale()
+                    next_scale = time.time() + self.scale_interval
+
+                time.sleep(self.poll_interval)
+        finally:
+            self.stop()
+
+    def check(self, *, now: Optional[float] = None) -> None:
+        """Replaces any worker that has died or has overrun the time limit."""
+
+        if self.dispatcher is not None and not self.dispatcher.is_alive():
+            raise RuntimeError('the dispatcher has stopped') from self.dispatcher.error
+
+        for index, p in enumerate(self.processes):
+            if p is None:
+                continue
+
+            current = self.slots[index].current()
+
+            if not p.is_alive():
+                logger.error(f'{p.name} exited with code {p.exitcode}; restarting it')
+                if current is not None:
+                    self.fail(current[0], f'worker exited with code {p.exitcode} while auditing this item')
+
+            elif current is not None and self.timeout is not None and (now or time.time()) - current[1] > self.timeout:
+                queue_id, _ = current
+                logger.error(f'{p.name} exceeded the {self.timeout}s time limit on queue item {queue_id}; restarting it')
+
+                kill(p)
+                p.join()
+
+                self.timeouts += 1
+                metrics.inc('dp_audit_timeouts_total')
+                self.fail(queue_id, f'audit exceeded the time limit of {self.timeout}s')
+
+            else:
+                continue
+
+            # the failed item is recorded before the rest of its batch goes back
+            if self.dispatcher is not None:
+                self.dispatcher.worker_exited(index)
+
+            self.restarts += 1
+            metrics.inc('dp_worker_restarts_total')
+            self.spawn(index)
+
+    def scale(self, *, now: Optional[float] = None) -> None:
+        """Starts or stops workers, as the scaling policy decides."""
+
+        assert self.scaling is not None
+
+        load = self.measure()
+        wanted = self.scaling.decide(load, now=now or time.time())
+
+        if wanted > load.workers:
+            free = [index for index, p in enumerate(self.processes) if p is None]
+            logger.info(f'scaling up from {load.workers} to {wanted} workers ({load.queued:,} queued, load {load.load_average:.1f})')
+            for index in free[:wanted - load.workers]:
+                self.spawn(index)
+
+        elif wanted < load.workers:
+            # stop the highest-numbered waiting workers, so the lanes of the
+            # lowest-numbered ones stay put (see dp.server.cost); a worker
+            # between audits may still have a batch to lease or save
+            stopping: List[int] = []
+            for index in reversed(range(len(self.processes))):
+                if len(stopping) == load.workers - wanted:
+                    break
+                if self.processes[index] is not None and self.slots[index].retire():
+                    stopping.append(index)
+
+            if stopping:
+                logger.info(f'scaling down from {load.workers} to {load.workers - len(stopping)} workers ({load.queued:,} queued, load {load.load_average:.1f})')
+            for index in stopping:
+                self.retire(index)
+
+    def measure(self) -> PoolLoad:
+        running = [index for index, p in enumerate(self.processes) if p is not None]
+
+        cpu = sum(self.usage[0::3])
+        wall = sum(self.usage[1::3])
+        audits = sum(self.usage[2::3])
+
+        # only the audits since the last resize count
+        last_cpu, last_wall, last_audits = self.measured_usage
+        if audits > last_audits:
+            self.cpu_per_audit = (cpu - last_cpu) / (audits - last_audits)
+            if wall > last_wall:
+                self.cpu_share = min(1.0, (cpu - last_cpu) / (wall - last_wall))
+        self.measured_usage = (cpu, wall, audits)
+
+        return PoolLoad(
+            workers=len(running),
+            busy=sum(1 for index in running if self.slots[index].current() is not None),
+            queued=self.queue_depth() if self.queue_depth is not None else 0,
+            cpu_per_audit=self.cpu_per_audit,
+            cpu_share=self.cpu_share,
+            load_average=os.getloadavg()[0],
+            cpus=available_cpus(),
+        )
+
+    def retire(self, index: int) -> None:
+        """Stops a worker whose slot has been claimed for stopping (see WorkerSlot.retire)."""
+
+        p = self.processes[index]
+        if p is None:
+            return
+
+        p.terminate()
+        p.join()
+        self.processes[index] = None
+
+        # a batch the dispatcher leased it as it was stopped goes back on the queue
+        if self.dispatcher is not None:
+            self.dispatcher.worker_exited(index)
+
+    def fail(self, queue_id: int, error: str) -> None:
+        try:
+            self.on_failure(queue_id, error)
+        except Exception as exc:
+            logger.error(f'could not record the failure of queue item {queue_id}: {exc}')
+
+    def stop(self) -> None:
+        for p in self.processes:
+            if p is not None and p.is_alive():
+                p.terminate()
+
+        for p in self.processes:
+            if p is not None:
+                p.join()
+
+
+def kill(p: multiprocessing.Process) -> None:
+    # Process.kill() needs Python 3.7
+    sigkill = getattr(signal, 'SIGKILL', None)
+    if p.pid is None or sigkill is None:
+        p.terminate()
+        return
+
+    try:
+        os.kill(p.pid, sigkill)
+    except ProcessLookupError:
+        pass
@@ -0,0 +1,163 @@
+"""Saving finished audits to the database.
+
+Batched workers hand each finished batch to a ResultWriter. The writer owns
+its own connection and saves results on a background thread, while the worker
+moves on to its next batch. The writer's queue is bounded, so a worker that
+gets too far ahead of the database waits for the writer to catch up.
+"""
+
+from typing import Callable, List, Optional, Sequence
+import threading
+import logging
+import queue
+import time
+
+import attr
+import psycopg2.extensions  # type: ignore
+import sentry_sdk
+
+from .audit import ResultRow, insert_results
+from .queue import delete_leased, release_leased
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@attr.s(slots=True, kw_only=True, auto_attribs=True)
+class WriteJob:
+    rows: List[ResultRow]
+    queue_ids: List[int]
+    leased_by: int
+
+
+def save_results(curs: psycopg2.extensions.cursor, jobs: Sequence[WriteJob]) -> bool:
+    """Inserts the jobs' results and removes their items from the queue, in
+    one transaction.
+
+    If that fails, the items are returned to the queue to be audited again,
+    and this returns False. A job whose lease has been lost, on any of its
+    items, is left out of the transaction, so that its results aren't saved
+    twice; whatever it still holds is returned to the queue, and this also
+    returns False."""
+
+    started_at = time.perf_counter()
+    lost: List[WriteJob] = []
+
+    curs.execute('BEGIN;')
+    try:
+        for job in jobs:
+            curs.execute('SAVEPOINT job;')
+            insert_results(curs, job.rows)
+
+            if delete_leased(curs, queue_ids=job.queue_ids, leased_by=job.leased_by) != len(set(job.queue_ids)):
+                curs.execute('ROLLBACK TO SAVEPOINT job;')
+                lost.append(job)
+
+        curs.execute('COMMIT;')
+    except Exception as exc:
+        curs.execute('ROLLBACK;')
+        sentry_sdk.capture_exception(exc)
+        logger.error(f'could not save {sum(len(job.queue_ids) for job in jobs):,} items; returning them to the queue')
+
+        for job in jobs:
+            release_leased(curs, queue_ids=job.queue_ids, leased_by=job.leased_by)
+
+        return False
+
+    for job in lost:
+        logger.warning(f'lost the lease on some of {len(job.queue_ids):,} items; discarding their results')
+        release_leased(curs, queue_ids=job.queue_ids, leased_by=job.leased_by)
+
+    metrics.observe('dp_db_write_seconds', time.perf_counter() - started_at, operation='batch')
+
+    return not lost
+
+
+class ResultWriter:
+    def __init__(
+        self,
+        *,
+        connect: Callable[[], psycopg2.extensions.connection],
+        max_pending: int = 8,
+        max_jobs_per_commit: int = 32,
+    ) -> None:
+        self.connect = connect
+        self.max_jobs_per_commit = max_jobs_per_commit
+        self.pending: 'queue.Queue[Optional[WriteJob]]' = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self.run, name='result-writer', daemon=True)
+        self.error: Optional[BaseException] = None
+
+        self.jobs_submitted = 0
+        self.jobs_finished = 0
+        self.jobs_written = 0
+        self.rows_written = 0
+        self.commits = 0
+
+    def start(self) -> 'ResultWriter':
+        self.thread.start()
+        return self
+
+    def submit(self, job: WriteJob) -> None:
+        """Queues a job to be saved, waiting if the writer is too far behind."""
+
+        while True:
+            if self.error is not None or not self.thread.is_alive():
+                raise RuntimeError('the result writer has stopped') from self.error
+
+            try:
+                self.pending.put(job, timeout=1)
+                self.jobs_submitted += 1
+                return
+            except queue.Full:
+                continue
+
+    def caught_up(self) -> bool:
+        """Whether every submitted job has been saved, or given up on."""
+
+        return self.jobs_finished == self.jobs_submitted
+
+    def close(self) -> None:
+        """Saves everything that has been submitted, then stops the writer."""
+
+        if self.thread.is_alive():
+            self.pending.put(None)
+            self.thread.join()
+
+    def run(self) -> None:
+        try:
+            conn = self.connect()
+            with conn.cursor() as curs:
+                self.write_until_closed(curs)
+        except BaseException as exc:
+            self.error = exc
+            sentry_sdk.capture_exception(exc)
+            logger.exception('the result writer has stopped')
+
+    def write_until_closed(self, curs: psycopg2.extensions.cursor) -> None:
+        closed = False
+        while not closed:
+            job = self.pending.get()
+            if job is None:
+                break
+
+            # save everything that has piled up since the last commit together
+            jobs = [job]
+            while len(jobs) < self.max_jobs_per_commit:
+                try:
+                    next_job = self.pending.get_nowait()
+                except queue.Empty:
+                    break
+
+                if next_job is None:
+                    closed = True
+                    break
+
+                jobs.append(next_job)
+
+            if save_results(curs, jobs):
+                self.jobs_written += len(jobs)
+                self.rows_written += sum(len(job.rows) for job in jobs)
+                self.commits += 1
+                logger.info(f'commit {sum(len(job.rows) for job in jobs):,} results')
+
+            self.jobs_finished += len(jobs)
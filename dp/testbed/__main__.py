@@ -1,6 +1,3 @@
-# input() will use readline if imported
-import readline  # noqa: F401
-
 import argparse
 import sqlite3
 import decimal
@@ -20,8 +17,6 @@ from .run import run_one
 from .invoke import print_invocation
 from .db import init_local_db
 
-import dotenv
-
 logger = logging.getLogger(__name__)
 
 
@@ -38,6 +33,7 @@ def main() -> None:
     parser.set_defaults(func=lambda args: parser.print_usage())
 
     parser.add_argument('--db', action='store', default='testbed_db.db')
+    parser.add_argument('--student-cache', action='store', default=os.getenv('DP_STUDENT_CACHE'), help='a directory in which to cache loaded students between runs')
     parser.add_argument('-w', '--workers', action='store', type=int, help='how many workers to use to run parallel audits', default=math.floor((os.cpu_count() or 0) / 4 * 3))
 
     subparsers = parser.add_subparsers(title='subcommands', description='valid subcommands')
@@ -106,6 +102,8 @@ def main() -> None:
 
 
 if __name__ == "__main__":
+    import dotenv
+
     dotenv.load_dotenv(verbose=True)
 
     # Register the adapter
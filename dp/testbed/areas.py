@@ -2,10 +2,10 @@ from typing import Sequence, Dict, Any, Tuple
 from concurrent.futures import ProcessPoolExecutor, as_completed
 import argparse
 import pathlib
-import yaml
 import os
 
-import tqdm  # type: ignore
+from dp.run import load_areas as run_load_areas
+from dp.bundle import get_bundle, bundle_path_for
 
 
 def load_areas(args: argparse.Namespace, areas_to_load: Sequence[Dict]) -> Dict[str, Any]:
@@ -15,7 +15,12 @@ def load_areas(args: argparse.Namespace, areas_to_load: Sequence[Dict]) -> Dict[
 
     area_specs = {}
 
-    if len(areas_to_load) > args.workers:
+    # reading from a bundle is fast enough that it isn't worth spreading out
+    has_bundle = get_bundle(bundle_path_for(str(area_root))) is not None
+
+    if len(areas_to_load) > args.workers and not has_bundle:
+        import tqdm  # type: ignore
+
         print(f'loading {len(areas_to_load):,} areas...')
         with ProcessPoolExecutor(max_workers=args.workers) as executor:
             futures = [executor.submit(load_area, area_root, record['catalog'], record['code']) for record in areas_to_load]
@@ -30,5 +35,5 @@ def load_areas(args: argparse.Namespace, areas_to_load: Sequence[Dict]) -> Dict[
 
 
 def load_area(root: pathlib.Path, catalog: str, code: str) -> Tuple[str, Dict]:
-    with open(root / catalog / f"{code}.yaml", "r", encoding="utf-8") as infile:
-        return f"{catalog}/{code}", yaml.load(stream=infile, Loader=yaml.SafeLoader)
+    # dp.run.load_areas reads from the prebuilt bundle when one is available
+    return f"{catalog}/{code}", run_load_areas(str(root / catalog / f"{code}.yaml"))[0]
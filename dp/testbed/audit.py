@@ -16,6 +16,7 @@ def audit(
     area_spec: Dict,
     run_id: str = '',
     timeout: Optional[float] = None,
+    student_cache: Optional[str] = None,
 ) -> Optional[Dict]:
     stnum, catalog, code = row
 
@@ -36,7 +37,7 @@ def audit(
         student = data
         area_spec = area_spec
 
-    estimate_count = estimate((stnum, catalog, code), db=db, area_spec=area_spec)
+    estimate_count = estimate((stnum, catalog, code), data=student, db=db, area_spec=area_spec, student_cache=student_cache)
     assert estimate_count is not None
 
     db_keys = {'stnum': stnum, 'catalog': catalog, 'code': code, 'estimate': estimate_count, 'branch': run_id}
@@ -57,7 +58,7 @@ def audit(
 
     start_time = time.perf_counter()
 
-    for message in run(args=Arguments(), student=student, area_spec=area_spec):
+    for message in run(args=Arguments(student_cache=student_cache), student=student, area_spec=area_spec):
         if isinstance(message, ResultMsg):
             result = message.result.to_dict()
             return {
@@ -88,6 +89,7 @@ def estimate(
     db: str,
     area_spec: Dict,
     run_id: str = '',
+    student_cache: Optional[str] = None,
 ) -> Optional[int]:
     stnum, catalog, code = row
 
@@ -108,7 +110,7 @@ def estimate(
         student = data
         area_spec = area_spec
 
-    for message in run(args=Arguments(estimate_only=True), student=student, area_spec=area_spec):
+    for message in run(args=Arguments(estimate_only=True, student_cache=student_cache), student=student, area_spec=area_spec):
         if isinstance(message, EstimateMsg):
             return message.estimate
         else:
@@ -2,8 +2,6 @@ from concurrent.futures import ProcessPoolExecutor, as_completed
 import argparse
 import sqlite3
 
-import tqdm  # type: ignore
-
 from .sqlite import sqlite_connect, sqlite_cursor
 from .audit import audit
 from .fetch import fetch_if_needed
@@ -60,6 +58,8 @@ def branch(args: argparse.Namespace) -> None:
 
         records = [(stnum, catalog, code) for stnum, catalog, code in results]
 
+    import tqdm  # type: ignore
+
     print(f'running {len(records):,} audits...')
 
     with sqlite_connect(args.db) as conn:
@@ -71,6 +71,7 @@ def branch(args: argparse.Namespace) -> None:
                     db=args.db,
                     area_spec=area_specs[f"{catalog}/{code}"],
                     timeout=float(minimum_duration.sec()),
+                    student_cache=args.student_cache,
                     run_id=args.branch,
                 ): (stnum, catalog, code)
                 for (stnum, catalog, code) in records
@@ -1,8 +1,6 @@
 from typing import Any
 import argparse
 
-import tqdm  # type: ignore
-
 from .sqlite import sqlite_connect, sqlite_cursor
 from dp.ms import pretty_ms
 
@@ -10,6 +8,7 @@ from dp.ms import pretty_ms
 def fetch(args: argparse.Namespace) -> None:
     import psycopg2  # type: ignore
     import psycopg2.extras  # type: ignore
+    import tqdm  # type: ignore
 
     # empty string means "use the environment variables"
     pg_conn = psycopg2.connect('', application_name='degreepath-testbed', cursor_factory=psycopg2.extras.DictCursor)
@@ -87,6 +86,9 @@ def fetch__select_run(args: argparse.Namespace, conn: Any) -> int:
         else:
             fetch__print_summary(args=args, curs=curs)
 
+            # input() will use readline if imported
+            import readline  # noqa: F401
+
             print('Download which run?')
             to_fetch = int(input('>>> '))
 
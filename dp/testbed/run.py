@@ -24,7 +24,7 @@ def run_one(args: argparse.Namespace) -> None:
         input_data = json.loads(record['input_data'])
 
     areas = load_areas(args, [{'catalog': catalog, 'code': code}])
-    result_msg = audit((stnum, catalog, code), data=input_data, db=args.db, area_spec=areas[f"{catalog}/{code}"])
+    result_msg = audit((stnum, catalog, code), data=input_data, db=args.db, area_spec=areas[f"{catalog}/{code}"], student_cache=args.student_cache)
     assert result_msg
 
     print(render_result(input_data, json.loads(result_msg['result'])))
@@ -348,3 +348,32 @@ def x_test_count_seminars():
     assert result.value == 0
     assert result.data == ()
     assert len(result.courses) == 0
+
+
+def test_average_grades__matches_decimal_average():
+    from dp.lib import grade_point_average, decimal_grade_point_average
+
+    grades = ['A', 'A-', 'B+', 'B-', 'C+', 'D-', 'F']
+    credits = [Decimal('0.25'), Decimal('0.5'), Decimal('1.00'), Decimal('1'), Decimal('0.33')]
+
+    for i in range(len(grades)):
+        courses = [
+            course_from_str(f"A {100 + j}", grade_code=grades[(i + j) % len(grades)], credits=credits[(i * j) % len(credits)])
+            for j in range(i + 2)
+        ]
+
+        result = grade_point_average(courses)
+        expected = decimal_grade_point_average(courses)
+        assert str(result) == str(expected)
+
+
+def test_average_grades__inexact_credits():
+    from dp.lib import grade_point_average
+
+    courses = [
+        course_from_str("A 100", grade_code='A-', credits=Decimal('0.125')),
+        course_from_str("B 200", grade_code='B', credits=Decimal('1.00')),
+    ]
+
+    assert courses[0].credit_hundredths_ is None
+    assert str(grade_point_average(courses)) == '3.07'
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from dp.area_cache import AreaSpecCache
+
+
+def write_area(path, name):
+    path.write_text(f"name: {name}\ntype: major\ncode: '140'\nresult:\n  course: DEPT 123\n")
+
+
+def test_area_cache_reuses_parsed_specs(tmp_path):
+    area_file = tmp_path / "140.yaml"
+    write_area(area_file, "First")
+
+    cache = AreaSpecCache()
+    first = cache.load(str(area_file))
+    second = cache.load(str(area_file))
+
+    assert first is second
+    assert first['name'] == 'First'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_area_cache_reloads_modified_files(tmp_path):
+    area_file = tmp_path / "140.yaml"
+    write_area(area_file, "First")
+
+    cache = AreaSpecCache()
+    cache.load(str(area_file))
+
+    write_area(area_file, "Second")
+    stat = os.stat(area_file)
+    os.utime(area_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert cache.load(str(area_file))['name'] == 'Second'
+    assert cache.misses == 2
+
+
+def test_area_cache_evicts_least_recently_used(tmp_path):
+    files = []
+    for code in ['a', 'b', 'c']:
+        f = tmp_path / f"{code}.yaml"
+        write_area(f, code)
+        files.append(str(f))
+
+    cache = AreaSpecCache(maxsize=2)
+    cache.load(files[0])
+    cache.load(files[1])
+    cache.load(files[0])
+    cache.load(files[2])
+
+    assert list(cache.entries.keys()) == [files[0], files[2]]
+
+
+def test_area_cache_checks_emphases_on_load(tmp_path):
+    area_file = tmp_path / "140.yaml"
+    area_file.write_text("name: Bad\ncode: '140'\nresult:\n  course: DEPT 123\nemphases:\n  1:\n    result:\n      unknown-key: 1\n")
+
+    with pytest.raises(Exception):
+        AreaSpecCache().load(str(area_file))
@@ -0,0 +1,131 @@
+from dp.area import AreaOfStudy, AreaTemplate, area_template
+from dp.data import course_from_str, Student, AreaPointer
+from dp.data.area_enums import AreaStatus, AreaType
+from dp.exception import load_exception
+
+spec = {
+    "name": "Test",
+    "type": "major",
+    "code": "140",
+    "degree": "B.A.",
+    "result": {"all": [{"requirement": "Req"}, {"requirement": "Recent"}]},
+    "requirements": {
+        "Req": {"result": {"course": "DEPT 123"}},
+        "Recent": {
+            "result": {
+                "from": "courses",
+                "where": {"year": {"$gte": "$matriculation-year"}},
+                "assert": {"count(courses)": {"$gte": 1}},
+            },
+        },
+    },
+    "emphases": {
+        1: {
+            "name": "Emphasis",
+            "result": {"course": "DEPT 234"},
+        },
+    },
+}
+
+
+def make_student(*, courses, matriculation=2000, emphasis=False):
+    areas = [AreaPointer(
+        code='140', status=AreaStatus.Declared, kind=AreaType.Major, name='Test',
+        degree='B.A.', dept='DEPT', gpa=None, terms_since_declaration=None,
+    )]
+    if emphasis:
+        areas.append(AreaPointer(
+            code='1', status=AreaStatus.Declared, kind=AreaType.Emphasis, name='Emphasis',
+            degree='B.A.', dept='DEPT', gpa=None, terms_since_declaration=None,
+        ))
+
+    return Student.load(dict(courses=courses, areas=areas, matriculation=matriculation), code='140')
+
+
+def specialize_and_load(template, student, exceptions=()):
+    specialized = template.specialize(c=student.constants(), student=student, exceptions=exceptions)
+    loaded = AreaOfStudy.load(specification=template.specification, c=student.constants(), student=student, exceptions=exceptions)
+    return specialized, loaded
+
+
+def test_template_matches_full_load():
+    template = AreaTemplate.compile(spec)
+    assert template.is_conditional is False
+    assert [k.value for k in template.constants] == ['$matriculation-year']
+
+    students = [
+        make_student(courses=[course_from_str('DEPT 123')]),
+        make_student(courses=[course_from_str('DEPT 234')]),
+        make_student(courses=[course_from_str('DEPT 123')], matriculation=2001),
+        make_student(courses=[course_from_str('DEPT 123')], emphasis=True),
+    ]
+
+    for student in students:
+        specialized, loaded = specialize_and_load(template, student)
+        assert specialized == loaded
+
+    # one variant per (matriculation year, declared emphases) combination
+    assert len(template.variants) == 3
+
+
+def test_template_reuses_rule_trees():
+    template = AreaTemplate.compile(spec)
+
+    a, _ = specialize_and_load(template, make_student(courses=[course_from_str('DEPT 234')]))
+    b, _ = specialize_and_load(template, make_student(courses=[course_from_str('DEPT 345')]))
+
+    assert a.result is b.result
+    assert a.excluded_clbids == b.excluded_clbids == frozenset()
+
+
+def test_template_excludes_required_courses_per_student():
+    template = AreaTemplate.compile(spec)
+
+    course = course_from_str('DEPT 123')
+    with_required, loaded = specialize_and_load(template, make_student(courses=[course]))
+    without_required, _ = specialize_and_load(template, make_student(courses=[course_from_str('DEPT 234')]))
+
+    assert with_required.excluded_clbids == loaded.excluded_clbids == frozenset([course.clbid])
+    assert without_required.excluded_clbids == frozenset()
+
+
+def test_template_falls_back_for_conditionals():
+    conditional = {
+        "result": {"all": [{"requirement": "Req"}]},
+        "requirements": {
+            "Req": {
+                "if": {"from": "courses", "where": {"subject": {"$eq": "DEPT"}}, "assert": {"count(courses)": {"$gte": 1}}},
+                "then": {"course": "DEPT 123"},
+                "else": {"course": "OTHER 123"},
+            },
+        },
+    }
+
+    template = AreaTemplate.compile(conditional)
+    assert template.is_conditional is True
+
+    for courses in [[course_from_str('DEPT 123')], [course_from_str('OTHER 123')]]:
+        specialized, loaded = specialize_and_load(template, make_student(courses=courses))
+        assert specialized == loaded
+
+    assert len(template.variants) == 0
+
+
+def test_template_falls_back_for_count_insertions():
+    template = AreaTemplate.compile(spec)
+
+    course = course_from_str('OTHER 999')
+    exception = load_exception({"type": "insert", "path": ["$", ".count"], "clbid": course.clbid})
+
+    specialized, loaded = specialize_and_load(template, make_student(courses=[course]), exceptions=[exception])
+
+    assert specialized == loaded
+    assert len(specialized.result.items) == 3
+    assert len(template.variants) == 0
+
+
+def test_area_template_cache_is_keyed_by_identity():
+    copy = dict(spec)
+
+    assert area_template(spec) is area_template(spec)
+    assert area_template(copy) is not area_template(spec)
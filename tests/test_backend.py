@@ -0,0 +1,119 @@
+import sqlite3
+import json
+
+import pytest
+import yaml
+
+from dp.area_cache import AreaSpecCache
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('sentry_sdk')
+
+from dp.server.audit import ResultRow  # noqa: E402
+from dp.server.backend import QueueItem, MemoryBackend, SQLiteBackend  # noqa: E402
+from dp.server.batched import process_queue_batched  # noqa: E402
+from dp.server.loadgen import TimedBackend  # noqa: E402
+from dp.server.supervisor import WorkerSlot  # noqa: E402
+
+from .test_checkpoint import specification, rows  # noqa: E402
+
+
+def make_items():
+    return [
+        QueueItem(student_id='1', area_catalog='2019-20', area_code='140', input_data=json.dumps({"stnum": "1", "courses": rows}), run=1),
+        QueueItem(student_id='1', area_catalog='2019-20', area_code='150', input_data='{"stnum": "1"}', run=1),
+        QueueItem(student_id='2', area_catalog='2019-20', area_code='140', input_data=json.dumps({"stnum": "2", "courses": rows[:6]}), run=1, cost=5.0),
+    ]
+
+
+def check_backend(backend):
+    backend.enqueue(make_items())
+    backend.enqueue(make_items()[:1])
+    assert backend.count_queued() == 3
+
+    # a lease takes every item for the students it picks
+    leased = backend.lease(size=1)
+    assert [(row[2], row[4]) for row in leased] == [('1', '140'), ('1', '150')]
+    assert [row[2] for row in backend.lease(size=5)] == ['2']
+    assert backend.lease(size=5) == []
+
+    saved = ResultRow(student_id='1', area_code='140', catalog='2019-20', run=1, input_data='{}', ok=True, cache_key='key')
+    assert backend.save(rows=[saved], queue_ids=[row[0] for row in leased]) is True
+    assert backend.count_queued() == 1
+
+    found = backend.find_cached_results(cache_keys=['key', 'other'])
+    assert list(found) == ['key']
+    assert found['key'].ok is True
+
+
+def test_memory_backend():
+    check_backend(MemoryBackend())
+
+
+def test_sqlite_backend(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'queue.sqlite3'))
+    check_backend(backend)
+
+    # a second connection, as from another worker process, sees the same queue
+    assert SQLiteBackend(str(tmp_path / 'queue.sqlite3')).count_queued() == 1
+
+
+def test_sqlite_backend_save_while_locked(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'queue.sqlite3'))
+    backend.enqueue(make_items())
+    leased = backend.lease(size=1)
+    backend.conn.execute('PRAGMA busy_timeout = 0')
+
+    other = SQLiteBackend(str(tmp_path / 'queue.sqlite3'))
+    other.conn.execute('BEGIN IMMEDIATE')
+
+    # the lock isn't taken, so there is nothing to roll back
+    saved = ResultRow(student_id='1', area_code='140', catalog='2019-20', run=1, input_data='{}')
+    with pytest.raises(sqlite3.OperationalError, match='locked'):
+        backend.save(rows=[saved], queue_ids=[row[0] for row in leased])
+
+    other.conn.execute('ROLLBACK')
+    assert backend.save(rows=[saved], queue_ids=[row[0] for row in leased]) is True
+
+
+def test_memory_backend_lanes():
+    backend = MemoryBackend()
+    backend.enqueue([
+        QueueItem(student_id='1', area_catalog='2019-20', area_code='140', input_data='{}', run=1, cost=50.0),
+        QueueItem(student_id='2', area_catalog='2019-20', area_code='140', input_data='{}', run=1),
+        QueueItem(student_id='3', area_catalog='2019-20', area_code='140', input_data='{}', run=1, cost=5.0),
+    ])
+
+    assert [row[2] for row in backend.lease(size=1, lane='long')] == ['1']
+    assert [row[2] for row in backend.lease(size=1, lane='short')] == ['3']
+
+
+def test_batched_worker_loop(tmp_path):
+    (tmp_path / '2019-20').mkdir()
+    (tmp_path / '2019-20' / '140.yaml').write_text(yaml.dump(specification))
+
+    backend = TimedBackend(MemoryBackend())
+    backend.enqueue(make_items())
+
+    slot = WorkerSlot(index=0, queue_ids=[0], started_at=[0.0])
+    process_queue_batched(
+        backend=backend,
+        slot=slot,
+        area_root=str(tmp_path),
+        area_cache=AreaSpecCache(),
+        batch_size=10,
+        writer=None,
+        result_cache=False,
+        checkpoint_dir=None,
+        lane=None,
+        preemptor=None,
+    )
+
+    assert backend.count_queued() == 0
+    assert backend.seconds > 0
+
+    # the item whose area doesn't exist is dropped
+    results = {(r.student_id, r.area_code): r for r in backend.backend.results}
+    assert sorted(results) == [('1', '140'), ('2', '140')]
+    assert results[('1', '140')].ok is True
+    assert results[('2', '140')].ok is False
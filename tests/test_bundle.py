@@ -0,0 +1,57 @@
+import os
+
+import yaml
+
+from dp.bundle import write_bundle, bundle_path_for, get_bundle
+from dp.run import load_areas
+
+
+def make_areas(root):
+    catalog = root / "2019-20"
+    catalog.mkdir()
+    area_file = catalog / "140.yaml"
+    area_file.write_text("name: Studio Art\ntype: major\ncode: '140'\nresult:\n  course: ART 101\n")
+    return area_file
+
+
+def test_load_areas_reads_from_bundle(tmp_path, monkeypatch):
+    area_file = make_areas(tmp_path)
+    spec = {"name": "From the bundle", "code": "140", "result": {"course": "ART 101"}}
+
+    write_bundle(bundle_path_for(str(tmp_path)), iter([("2019-20/140", str(area_file), spec)]))
+
+    def fail(*args, **kwargs):
+        raise AssertionError("expected the area to be read from the bundle")
+
+    monkeypatch.setattr(yaml, 'load', fail)
+
+    assert load_areas(str(area_file)) == [spec]
+
+
+def test_load_areas_ignores_stale_bundle_entries(tmp_path):
+    area_file = make_areas(tmp_path)
+    spec = {"name": "From the bundle", "code": "140", "result": {"course": "ART 101"}}
+
+    write_bundle(bundle_path_for(str(tmp_path)), iter([("2019-20/140", str(area_file), spec)]))
+
+    stat = os.stat(area_file)
+    os.utime(area_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert load_areas(str(area_file))[0]['name'] == 'Studio Art'
+
+
+def test_bundle_index(tmp_path):
+    area_file = make_areas(tmp_path)
+    path = bundle_path_for(str(tmp_path))
+
+    count = write_bundle(path, iter([
+        ("2019-20/140", str(area_file), {"code": "140"}),
+        ("2019-20/141", str(area_file), {"code": "141"}),
+    ]))
+    assert count == 2
+
+    bundle = get_bundle(path)
+    assert bundle is not None
+    assert sorted(bundle.entries.keys()) == ["2019-20/140", "2019-20/141"]
+    assert bundle.get("2019-20/141") == {"code": "141"}
+    assert bundle.get("2019-20/999") is None
@@ -0,0 +1,125 @@
+import os
+
+import pytest
+
+from dp.audit import audit, Arguments, CheckpointMsg, ResultMsg
+from dp.area import AreaOfStudy
+from dp.checkpoint import Checkpoint, checkpoint_key, checkpoint_path, load_checkpoint, save_checkpoint
+from dp.data import Student
+from dp.run import run
+
+from .test_student import course_row
+
+# a pair of A grades among C grades, listed last, so that a search in
+# transcript order has to try most of the pairs before finding them
+specification = {
+    "name": "Test", "type": "concentration", "code": "140",
+    "result": {
+        "from": "courses",
+        "where": {"subject": {"$eq": "DEPT"}},
+        "all": [
+            {"assert": {"count(courses)": {"$gte": 2}}},
+            {"assert": {"average(grades)": {"$gte": 3.5}}},
+        ],
+    },
+}
+
+rows = [
+    *(course_row(f"DEPT {101 + i}", clbid=str(i), grade_code='C', grade_points='2.00') for i in range(6)),
+    course_row("DEPT 301", clbid="a", grade_code='A', grade_points='4.00'),
+    course_row("DEPT 302", clbid="b", grade_code='A', grade_points='4.00'),
+]
+
+
+def start_audit(data, **kwargs):
+    student = Student.load(data)
+    area = AreaOfStudy.load(specification=specification, c=student.constants(), student=student)
+
+    return audit(area=area, student=student, **kwargs)
+
+
+def test_resumed_audit_matches_an_uninterrupted_one():
+    # leave out the first A grade, so that no solution passes and the best is partway through
+    data = {"courses": [rows[0], *rows[2:7], *rows[1:2]]}
+
+    full = next(m for m in start_audit(data) if isinstance(m, ResultMsg))
+
+    messages = start_audit(data, args=Arguments(checkpoint_every=4))
+    checkpoints = [m.checkpoint for m in messages if isinstance(m, CheckpointMsg)]
+    assert [c.iters for c in checkpoints][:2] == [4, 8]
+
+    for checkpoint in checkpoints:
+        resumed = next(m for m in start_audit(data, resume=checkpoint) if isinstance(m, ResultMsg))
+
+        assert resumed.iters == full.iters
+        assert resumed.result.to_dict() == full.result.to_dict()
+
+
+def test_checkpoint_files(tmp_path):
+    directory = str(tmp_path)
+    key = checkpoint_key(student={"courses": rows}, area_spec=specification)
+
+    assert load_checkpoint(directory, key) is None
+
+    checkpoint = Checkpoint(iters=10, best_iter=3, elapsed_ms=5.0)
+    save_checkpoint(directory, key, checkpoint)
+    assert load_checkpoint(directory, key) == checkpoint
+
+    with open(checkpoint_path(directory, key), 'w') as outfile:
+        outfile.write('{')
+    assert load_checkpoint(directory, key) is None
+
+
+def test_run_resumes_and_then_discards_the_checkpoint(tmp_path):
+    directory = str(tmp_path)
+    data = {"stnum": "1", "courses": rows}
+    args = Arguments(checkpoint_dir=directory, checkpoint_every=4)
+    key = checkpoint_key(student=data, area_spec=specification)
+
+    # interrupt the audit after its first checkpoint
+    for msg in run(args, student=data, area_spec=specification):
+        if isinstance(msg, CheckpointMsg):
+            break
+
+    assert load_checkpoint(directory, key) == msg.checkpoint
+
+    result = next(m for m in run(args, student=data, area_spec=specification) if isinstance(m, ResultMsg))
+    assert result.result.ok() is True
+    assert not os.path.exists(checkpoint_path(directory, key))
+
+
+def test_run_with_print_all_keeps_the_checkpoint_until_the_end(tmp_path):
+    directory = str(tmp_path)
+    data = {"stnum": "1", "courses": rows}
+    args = Arguments(checkpoint_dir=directory, checkpoint_every=4, print_all=True)
+    key = checkpoint_key(student=data, area_spec=specification)
+
+    # interrupt the audit after a checkpoint, and a later solution's result
+    seen_checkpoint = None
+    for msg in run(args, student=data, area_spec=specification):
+        if isinstance(msg, CheckpointMsg):
+            seen_checkpoint = msg.checkpoint
+        elif isinstance(msg, ResultMsg) and seen_checkpoint is not None:
+            break
+
+    assert load_checkpoint(directory, key) == seen_checkpoint
+
+    messages = list(run(args, student=data, area_spec=specification))
+    assert messages[-1].result.ok() is True
+    assert not os.path.exists(checkpoint_path(directory, key))
+
+
+def test_server_finds_the_checkpoint_of_an_interrupted_audit(tmp_path):
+    pytest.importorskip('psycopg2')
+    pytest.importorskip('sentry_sdk')
+    from dp.server.audit import has_checkpoint
+
+    student = {"stnum": "0", "courses": rows}
+    directory = str(tmp_path)
+
+    assert has_checkpoint(student=student, area_spec=specification, checkpoint_dir=directory) is False
+
+    key = checkpoint_key(student=student, area_spec=specification)
+    save_checkpoint(directory, key, Checkpoint(iters=5, best_iter=2, elapsed_ms=10.0))
+
+    assert has_checkpoint(student=student, area_spec=specification, checkpoint_dir=directory) is True
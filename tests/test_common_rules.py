@@ -0,0 +1,99 @@
+from dp.area import prepare_common_rules
+from dp.data import AreaPointer
+
+
+def test_common_rules_are_shared_between_calls():
+    a = prepare_common_rules(degree='B.A.', dept_code='ART', area_code='140')
+    b = prepare_common_rules(degree='B.A.', dept_code='ART', area_code='140')
+
+    assert len(a) == 3
+    assert a is b
+
+
+def test_common_rules_depend_on_art_pairing():
+    unpaired = prepare_common_rules(degree='B.A.', dept_code='ART', area_code='140')
+    paired = prepare_common_rules(degree='B.A.', dept_code='ART', area_code='140', other_areas=(AreaPointer.with_code('135'),))
+
+    assert paired is not unpaired
+    assert paired[2] != unpaired[2]
+    assert paired[:2] == unpaired[:2]
+
+
+def test_bm_majors_have_no_outside_the_major_rule():
+    assert len(prepare_common_rules(degree='B.M.', dept_code='MUSIC', area_code='400')) == 2
+
+
+def test_common_requirements_are_memoized_by_claimed_courses():
+    import attr
+    from dp.area import AreaOfStudy, CommonRequirementsCache
+    from dp.constants import Constants
+    from dp.data import course_from_str, Student
+
+    spec = {
+        "type": "major",
+        "degree": "B.A.",
+        "result": {"all": [{"requirement": "A"}, {"requirement": "B"}]},
+        "requirements": {
+            "A": {"result": {"from": "courses", "where": {"subject": {"$eq": "DEPT"}}, "assert": {"count(courses)": {"$gte": 1}}}},
+            "B": {"result": {"from": "courses", "where": {"subject": {"$eq": "DEPT"}}, "assert": {"count(courses)": {"$gte": 1}}}},
+        },
+    }
+
+    transcript = [course_from_str("DEPT 123"), course_from_str("DEPT 234"), course_from_str("OTHER 101")]
+    student = Student.load(dict(courses=transcript))
+    area = AreaOfStudy.load(specification=spec, c=Constants(matriculation_year=2000), student=student)
+
+    # audit the solutions in sequence, as audit() does, once with the shared
+    # cache and once with a fresh cache for every solution
+    memoized = []
+    caches = set()
+    for solution in area.solutions(student=student, exceptions=[]):
+        memoized.append(solution.audit().to_dict())
+        caches.add(id(solution.common_requirements))
+        cache = solution.common_requirements
+
+    fresh = [
+        attr.evolve(solution, common_requirements=CommonRequirementsCache()).audit().to_dict()
+        for solution in area.solutions(student=student, exceptions=[])
+    ]
+
+    assert len(memoized) > 1
+    assert memoized == fresh
+    assert len(caches) == 1
+
+    # several solutions claim the same set of courses
+    assert len(cache.by_claimed) < len(memoized)
+    assert cache.outside_the_major is not None
+
+
+def test_common_requirements_see_force_inserted_claims_outside_the_limit():
+    from dp.area import AreaOfStudy
+    from dp.clause import get_resolved_clbids
+    from dp.constants import Constants
+    from dp.data import Student
+    from dp.exception import load_exception
+
+    from .test_student import course_row
+
+    spec = {
+        "type": "major",
+        "degree": "B.A.",
+        "limit": [{"at most": 1, "where": {"subject": {"$eq": "BIO"}}}],
+        "result": {"all": [{"requirement": "A"}, {"requirement": "B"}]},
+        "requirements": {
+            "A": {"result": {"course": "BIO 101"}},
+            "B": {"result": {"from": "courses", "where": {"subject": {"$eq": "NONE"}}, "assert": {"count(courses)": {"$gte": 1}}}},
+        },
+    }
+
+    student = Student.load({"courses": [course_row("BIO 101", clbid="1"), course_row("BIO 202", clbid="2")]})
+    exceptions = [load_exception({"type": "force-insert", "path": ["$", ".count", "[1]", "%B", ".query"], "clbid": "2"})]
+    area = AreaOfStudy.load(specification=spec, c=Constants(matriculation_year=2000), student=student, exceptions=exceptions)
+
+    # the limit leaves BIO 202 out of the transcript that claims BIO 101,
+    # but the forced insertion claims it anyway
+    results = [solution.audit() for solution in area.solutions(student=student, exceptions=exceptions)]
+    both = next(r for r in results if set(r.keyed_claims()) == {'1', '2'})
+
+    c_or_better = both.to_dict()['result']['items'][-1]['result']['items'][0]['result']
+    assert [get_resolved_clbids(a['assertion']) for a in c_or_better['assertions']] == [['1', '2']]
@@ -0,0 +1,73 @@
+import json
+
+from dp import AreaOfStudy
+from dp.audit import audit, ResultMsg
+from dp.compact import compact_result, expand_result, is_compact
+from dp.data import course_from_str, Student
+
+spec = {
+    "name": "Test",
+    "type": "major",
+    "code": "140",
+    "degree": "B.A.",
+    "result": {"all": [{"requirement": "Dept"}, {"course": "DEPT 345"}, {"course": "DEPT 101"}]},
+    "requirements": {
+        "Dept": {
+            "result": {
+                "from": "courses",
+                "where": {"subject": {"$eq": "DEPT"}},
+                "assert": {"count(courses)": {"$gte": 2}},
+            },
+        },
+    },
+}
+
+
+def audit_result():
+    courses = [course_from_str(f"DEPT {n}") for n in [101, 123, 234]] + [course_from_str("OTHER 101", credits='0.25')]
+    student = Student.load(dict(courses=courses), code='140')
+    area = AreaOfStudy.load(specification=spec, c=student.constants(), student=student)
+
+    results = [msg.result for msg in audit(area=area, student=student) if isinstance(msg, ResultMsg)]
+    return json.loads(json.dumps(results[0].to_dict()))
+
+
+def roundtrip(data):
+    # the compact form has to survive being stored as JSON
+    return expand_result(json.loads(json.dumps(compact_result(data))))
+
+
+def test_compact_result_roundtrips():
+    data = audit_result()
+    compact = compact_result(data)
+
+    assert is_compact(compact)
+    assert roundtrip(data) == data
+    assert len(json.dumps(compact)) < len(json.dumps(data))
+
+    # each claimed course is stored once
+    assert len(compact["courses"]) == len(set(compact["courses"]))
+    assert len(compact["courses"]) >= 2
+
+
+def test_compact_keeps_value_types():
+    data = {
+        "path": ["$"],
+        "rank": "2",
+        "padded": "02",
+        "decimal": "2.50",
+        "count": 2,
+        "float": 2.0,
+        "flag": True,
+        "nothing": None,
+        "clbid": "0000012345",
+        "items": ["0000012345", 1, None, ["a", "0000012345"], {"path": ["$", "[0]"]}],
+        "mixed": ["0000012345", "other"],
+        "empty": [],
+        "children": [{"path": ["elsewhere"], "claimant_path": ["$"], "inner": {"path": ["$", ".x"]}}],
+    }
+
+    result = roundtrip(data)
+
+    assert result == data
+    assert [type(v) for v in result.values()] == [type(v) for v in data.values()]
@@ -0,0 +1,71 @@
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from dp.server.cost import AreaHistory, estimate_cost, estimate_solutions, worker_lane  # noqa: E402
+from dp.server.queue import dequeue_one, lease_batch  # noqa: E402
+
+from .test_checkpoint import specification, rows  # noqa: E402
+
+
+class Cursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, query, params=None):
+        self.statements.append(' '.join(query.split()))
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+
+def test_estimate_cost():
+    history = AreaHistory(per_iteration_ms=0.5, duration_ms=40.0)
+
+    assert estimate_cost(solutions=200, history=history) == 100.0
+    assert estimate_cost(solutions=None, history=history) == 40.0
+    assert estimate_cost(solutions=200, history=None) == 200.0
+    assert estimate_cost(solutions=None, history=None) is None
+
+
+def test_estimate_solutions():
+    # every set of two or more of the eight courses
+    assert estimate_solutions(student={"stnum": "1", "courses": rows}, area_spec=specification) == 247
+    assert estimate_solutions(student={"stnum": "1", "courses": rows}, area_spec={"code": "140", "result": {"bogus": []}}) is None
+
+
+def test_lanes_order_the_queue_by_cost():
+    assert [worker_lane(i, long_lanes=1) for i in range(3)] == ['long', 'short', 'short']
+    assert worker_lane(0, long_lanes=0) is None
+
+    curs = Cursor()
+    dequeue_one(curs)
+    dequeue_one(curs, lane='short')
+    lease_batch(curs, size=10, lane='long')
+
+    assert 'ORDER BY priority DESC, ts' in curs.statements[0]
+    assert 'ORDER BY priority DESC, cost ASC NULLS LAST, ts' in curs.statements[1]
+    assert 'ORDER BY priority DESC, cost DESC NULLS LAST, ts' in curs.statements[2]
+
+
+def test_lease_batch_skips_students_being_leased():
+    curs = Cursor()
+    lease_batch(curs, size=10)
+
+    # the students are picked with their rows locked, not just the rows leased
+    picked, leased = curs.statements[0].split(') UPDATE public.queue')
+    assert 'FOR UPDATE SKIP LOCKED LIMIT %(size)s' in picked
+    assert 'FOR UPDATE SKIP LOCKED' in leased
+
+
+def test_dequeue_one_only_checks_leases_when_asked():
+    curs = Cursor()
+    dequeue_one(curs)
+    dequeue_one(curs, leases=True)
+
+    # the lease columns may not exist unless the server was told about them
+    assert 'leased_by' not in curs.statements[0]
+    assert 'WHERE leased_by IS NULL' in curs.statements[1]
@@ -0,0 +1,62 @@
+from dp.dependencies import AreaDependencies, find_dependencies, plan_reaudits
+
+from .test_student import course_row
+
+concentration = {
+    "name": "Test",
+    "type": "concentration",
+    "code": "140",
+    "result": {
+        "all": [
+            {"course": "DEPT 123"},
+            {
+                "from": "courses",
+                "where": {"$and": [{"gereqs": {"$in": ["WRI", "SPM"]}}, {"level": {"$gte": 200}}]},
+                "assert": {"count(courses)": {"$gte": 1}},
+            },
+        ],
+    },
+}
+
+
+def test_dependencies_are_found_from_rules_and_clauses():
+    deps = find_dependencies(concentration)
+
+    assert deps == AreaDependencies(tokens=frozenset(['course:DEPT 123', 'gereq:WRI', 'gereq:SPM']))
+    assert AreaDependencies.from_dict(deps.to_dict()) == deps
+
+
+def test_unrestricted_areas_depend_on_every_course():
+    by_level = {**concentration, "result": {"from": "courses", "where": {"level": {"$gte": 300}}, "assert": {"count(courses)": {"$gte": 1}}}}
+    assert find_dependencies(by_level).all_courses is True
+
+    degree = {**concentration, "type": "degree"}
+    assert find_dependencies(degree).all_courses is True
+
+
+def test_planner_only_requeues_areas_that_a_change_could_affect():
+    index = {
+        '2019-20/140': find_dependencies(concentration),
+        '2019-20/150': AreaDependencies(tokens=frozenset(['subject:DEPT']), transcript_totals=True),
+    }
+    areas = [('2019-20', '140'), ('2019-20', '150'), ('2019-20', '160')]
+
+    old = {"stnum": "1", "courses": [course_row("DEPT 123", clbid="1"), course_row("OTHER 101", clbid="2", grade_code="IP")]}
+    previous = {'140': old, '150': old, '160': old}
+
+    # a grade posted for an unrelated course only matters to the area that
+    # isn't in the index
+    graded = {**old, "courses": [course_row("DEPT 123", clbid="1"), course_row("OTHER 101", clbid="2", grade_code="A")]}
+    assert list(plan_reaudits(new=graded, areas=areas, previous=previous, index=index)) == [('2019-20', '160')]
+
+    # a new course counts towards a major's credits outside the major
+    added = {**old, "courses": [*old["courses"], course_row("OTHER 102", clbid="3")]}
+    assert list(plan_reaudits(new=added, areas=areas, previous=previous, index=index)) == [('2019-20', '150'), ('2019-20', '160')]
+
+    # changes to a course that an area names are always relevant
+    regraded = {**old, "courses": [course_row("DEPT 123", clbid="1", grade_code="C"), old["courses"][1]]}
+    assert list(plan_reaudits(new=regraded, areas=areas, previous=previous, index=index)) == areas
+
+    # areas with no previous audit are always queued
+    assert list(plan_reaudits(new=old, areas=areas, previous={}, index=index)) == areas
+    assert list(plan_reaudits(new=old, areas=areas, previous=previous, index=index)) == [('2019-20', '160')]
@@ -0,0 +1,111 @@
+import multiprocessing
+import threading
+import time
+import os
+
+import pytest
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('sentry_sdk')
+
+from dp.server.audit import ResultRow  # noqa: E402
+from dp.server.backend import QueueItem, MemoryBackend  # noqa: E402
+from dp.server.dispatch import Dispatcher, DispatchedBackend  # noqa: E402
+from dp.server.supervisor import Supervisor  # noqa: E402
+
+
+def make_item(student_id, area_code='140'):
+    return QueueItem(student_id=student_id, area_catalog='2019-20', area_code=area_code, input_data='{}', run=1)
+
+
+def lease_and_save(*, slot, channel):
+    backend = DispatchedBackend(channel)
+    while True:
+        rows = backend.lease(size=1)
+        results = [ResultRow(student_id=row[2], area_code=row[4], catalog=row[3], run=row[1], input_data=row[5]) for row in rows]
+        backend.save(rows=results, queue_ids=[row[0] for row in rows])
+
+
+def lease_and_crash(channel):
+    DispatchedBackend(channel).lease(size=1)
+    os._exit(3)
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_dispatcher_hands_out_the_queue():
+    backend = MemoryBackend()
+    backend.enqueue([make_item('1'), make_item('1', '150'), make_item('2'), make_item('3')])
+
+    dispatcher = Dispatcher(poll_interval=0.05).start(backend=backend)
+    supervisor = Supervisor(target=lease_and_save, kwargs={}, worker_count=2, on_failure=lambda *args: None, dispatcher=dispatcher)
+    supervisor.start()
+
+    try:
+        wait_for(lambda: len(backend.results) == 4)
+        assert backend.count_queued() == 0
+
+        # idle workers wait on the dispatcher, which hands over anything queued later
+        backend.enqueue([make_item('4')])
+        wait_for(lambda: len(backend.results) == 5)
+
+        assert sorted((r.student_id, r.area_code) for r in backend.results) == [
+            ('1', '140'), ('1', '150'), ('2', '140'), ('3', '140'), ('4', '140'),
+        ]
+        assert not any(dispatcher.outstanding.values())
+    finally:
+        supervisor.stop()
+        dispatcher.close()
+
+
+def test_dispatcher_releases_a_dead_workers_batch():
+    backend = MemoryBackend()
+    backend.enqueue([make_item('1'), make_item('1', '150'), make_item('2')])
+
+    dispatcher = Dispatcher(poll_interval=0.05).start(backend=backend)
+
+    try:
+        channel = dispatcher.open_channel(0)
+        p = multiprocessing.Process(target=lease_and_crash, args=(channel,))
+        p.start()
+        p.join()
+
+        assert len(backend.leases) == 2
+
+        dispatcher.worker_exited(0)
+        wait_for(lambda: not backend.leases)
+
+        assert backend.count_queued() == 3
+    finally:
+        dispatcher.close()
+
+
+def test_dispatcher_offers_released_items_to_waiting_workers():
+    backend = MemoryBackend()
+    backend.enqueue([make_item('1')])
+
+    # long enough that only the release itself could hand the item over
+    dispatcher = Dispatcher(poll_interval=60.0).start(backend=backend)
+
+    try:
+        first = DispatchedBackend(dispatcher.open_channel(0))
+        second = DispatchedBackend(dispatcher.open_channel(1))
+
+        [row] = first.lease(size=1)
+
+        leased = []
+        waiter = threading.Thread(target=lambda: leased.extend(second.lease(size=1)), daemon=True)
+        waiter.start()
+        wait_for(lambda: 1 in dispatcher.waiting)
+
+        first.release(queue_ids=[row[0]])
+        waiter.join(timeout=10.0)
+
+        assert [r[0] for r in leased] == [row[0]]
+    finally:
+        dispatcher.close()
@@ -70,3 +70,29 @@ def test_limit__at_most_1_credit():
         frozenset((course_3,)),
         frozenset(()),
     ])
+
+
+def test_limit__at_most_credits_with_inexact_credits():
+    test_data = io.StringIO("""
+        limit:
+          - at_most: 1 credit
+            where: {number: {$eq: 201}}
+
+        result:
+          from: courses
+          assert: {count(courses): {$gte: 1}}
+    """)
+
+    area = AreaOfStudy.load(specification=yaml.load(stream=test_data, Loader=yaml.SafeLoader), c=c)
+
+    course_1 = course_from_str("ABC 201", credits='0.125')
+    course_2 = course_from_str("BCD 201", credits='0.875')
+    course_3 = course_from_str("CDE 201", credits='0.5')
+    transcript = [course_1, course_2, course_3]
+
+    solutions = list(area.solutions(student=Student.load(dict(courses=transcript)), exceptions=[]))
+    course_sets = set(frozenset(s.solution.output) for s in solutions)
+
+    assert frozenset((course_1, course_2)) in course_sets
+    assert frozenset((course_1, course_3)) in course_sets
+    assert frozenset((course_2, course_3)) not in course_sets
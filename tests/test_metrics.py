@@ -0,0 +1,100 @@
+import multiprocessing
+import urllib.request
+import queue
+import stat
+import time
+
+import pytest
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('sentry_sdk')
+
+from dp.server import metrics  # noqa: E402
+from dp.server.audit import audit_to_row  # noqa: E402
+from dp.server.metrics import Metrics, MetricsCollector  # noqa: E402
+
+from .test_checkpoint import specification, rows  # noqa: E402
+
+
+def report_audits(events):
+    metrics.configure(events)
+    metrics.inc('dp_audits_total', area='2019-20/140', ok='true')
+    metrics.observe('dp_queue_wait_seconds', 2.0)
+
+
+def wait_for(predicate):
+    deadline = time.time() + 10
+    while not predicate():
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+
+def test_render():
+    m = Metrics()
+    m.apply(('inc', 'dp_audits_total', (('area', '2019-20/140'), ('ok', 'true')), 1.0))
+    m.apply(('inc', 'dp_audits_total', (('area', '2019-20/140'), ('ok', 'true')), 1.0))
+    m.apply(('inc', 'dp_audit_errors_total', (('area', 'a "quoted" area'),), 1.0))
+    m.apply(('observe', 'dp_db_write_seconds', (('operation', 'batch'),), 0.02))
+    m.apply(('observe', 'dp_db_write_seconds', (('operation', 'batch'),), 0.2))
+
+    text = m.render()
+
+    assert '# TYPE dp_audits_total counter' in text
+    assert 'dp_audits_total{area="2019-20/140",ok="true"} 2\n' in text
+    assert 'dp_audit_errors_total{area="a \\"quoted\\" area"} 1\n' in text
+
+    # buckets are cumulative
+    assert 'dp_db_write_seconds_bucket{operation="batch",le="0.01"} 0\n' in text
+    assert 'dp_db_write_seconds_bucket{operation="batch",le="0.05"} 1\n' in text
+    assert 'dp_db_write_seconds_bucket{operation="batch",le="0.5"} 2\n' in text
+    assert 'dp_db_write_seconds_bucket{operation="batch",le="+Inf"} 2\n' in text
+    assert 'dp_db_write_seconds_count{operation="batch"} 2\n' in text
+
+
+def test_audits_report_metrics():
+    events = queue.Queue()
+    metrics.configure(events)
+    try:
+        audit_to_row(area_spec=specification, area_code='140', area_catalog='2019-20', student={"stnum": "1", "courses": rows}, run_id=1)
+    finally:
+        metrics.configure(None)
+
+    reported = {}
+    while not events.empty():
+        kind, name, labels, value = events.get()
+        reported[name] = (labels, value)
+
+    assert reported['dp_audits_total'] == ((('area', '2019-20/140'), ('ok', 'true')), 1.0)
+    assert reported['dp_audit_iterations'] == ((('area', '2019-20/140'),), 28.0)
+    assert 0 < reported['dp_audit_estimate_ratio'][1] <= 1
+
+
+def test_collector_adds_up_every_worker(tmp_path):
+    textfile = tmp_path / 'dp.prom'
+    collector = MetricsCollector(port=0, textfile=str(textfile)).start()
+    try:
+        workers = [multiprocessing.Process(target=report_audits, args=(collector.events,)) for _ in range(2)]
+        for p in workers:
+            p.start()
+        for p in workers:
+            p.join()
+
+        wait_for(lambda: collector.metrics.counters.get(('dp_audits_total', (('area', '2019-20/140'), ('ok', 'true')))) == 2)
+
+        port = collector.server.server_address[1]
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics') as response:
+            text = response.read().decode('utf-8')
+
+        assert 'dp_audits_total{area="2019-20/140",ok="true"} 2\n' in text
+        assert 'dp_queue_wait_seconds_count 2\n' in text
+    finally:
+        collector.close()
+
+    assert textfile.read_text() == text
+
+
+def test_textfile_is_readable_by_the_collector(tmp_path):
+    textfile = tmp_path / 'dp.prom'
+    MetricsCollector(textfile=str(textfile)).write()
+
+    assert stat.S_IMODE(textfile.stat().st_mode) == 0o644
@@ -0,0 +1,97 @@
+import multiprocessing.sharedctypes
+
+import pytest
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('sentry_sdk')
+
+from dp.server.preempt import Preemptor  # noqa: E402
+from dp.server.supervisor import WorkerSlot  # noqa: E402
+
+
+class Cursor:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.statements = []
+        self.last = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        self.statements.append(' '.join(query.split()))
+        self.last = self.rows.pop(0) if 'DELETE' in query and self.rows else None
+
+    def fetchone(self):
+        return self.last
+
+
+class Connection:
+    def __init__(self, curs):
+        self.curs = curs
+        self.closed = False
+
+    def cursor(self):
+        return self.curs
+
+    def close(self):
+        self.closed = True
+
+
+def make_slot():
+    queue_ids = multiprocessing.sharedctypes.RawArray('q', 1)
+    started_at = multiprocessing.sharedctypes.RawArray('d', 1)
+    return WorkerSlot(index=0, queue_ids=queue_ids, started_at=started_at)
+
+
+def test_preemptor_serves_urgent_items_then_resumes():
+    curs = Cursor(rows=[
+        (2, -1, '1', '2019-20', '140', '{}', 100, 0.0),
+        (3, -1, '2', '2019-20', '140', '{}', 100, 0.0),
+    ])
+    conn = Connection(curs)
+    slot = make_slot()
+    served = []
+
+    def serve(curs, row):
+        served.append((row[0], slot.current()[0]))
+        # an urgent item is never preempted in turn
+        preemptor.check()
+
+    preemptor = Preemptor(connect=lambda: conn, priority=100, slot=slot, serve=serve)
+
+    assert preemptor.hook(100) is None
+    check = preemptor.hook(1)
+    assert check is not None
+
+    slot.begin(1, started_at=1000.0)
+    check()
+
+    assert served == [(2, 2), (3, 3)]
+    assert preemptor.served == 2
+    assert curs.statements.count('COMMIT;') == 3
+
+    # the paused audit is back in the slot, and the pause doesn't count against it
+    queue_id, started_at = slot.current()
+    assert queue_id == 1
+    assert started_at >= 1000.0
+
+    preemptor.close()
+    assert conn.closed is True
+
+
+def test_preemptor_commits_failed_items():
+    curs = Cursor(rows=[(2, -1, '1', '2019-20', '140', '{}', 100, 0.0)])
+    slot = make_slot()
+
+    def serve(curs, row):
+        raise ValueError('bad area')
+
+    preemptor = Preemptor(connect=lambda: Connection(curs), priority=100, slot=slot, serve=serve)
+    preemptor.check()
+
+    assert curs.statements.count('COMMIT;') == 2
+    assert slot.current() is None
@@ -0,0 +1,111 @@
+import pytest
+
+from dp.audit import ProgressClock
+
+
+def test_progress_clock__by_iterations():
+    clock = ProgressClock(every=3)
+    clock.start(0.0)
+
+    assert [i for i in range(1, 10) if clock.is_due(i, now=100.0)] == [3, 6, 9]
+
+
+def test_progress_clock__by_time():
+    clock = ProgressClock(interval=1.0)
+    clock.start(0.0)
+
+    # at 1ms per iteration, the next look at the clock is ~500 iterations away
+    assert clock.is_due(1, now=0.001) is False
+    assert 400 < clock.next_check < 600
+
+    # nothing is due before then, whatever the time
+    assert clock.is_due(clock.next_check - 1, now=5.0) is False
+
+    assert clock.is_due(clock.next_check, now=1.01) is True
+    assert clock.next_report_at == 2.01
+
+
+def test_progress_clock__slow_iterations_check_every_time():
+    clock = ProgressClock(interval=1.0)
+    clock.start(0.0)
+
+    assert clock.is_due(1, now=0.6) is False
+    assert clock.next_check == 2
+    assert clock.is_due(2, now=1.2) is True
+    assert clock.next_check == 3
+
+
+def test_progress_buffer_coalesces_reports():
+    pytest.importorskip('psycopg2')
+    from dp.server.progress import ProgressBuffer
+
+    class Cursor:
+        connection = type('Connection', (), {'encoding': 'UTF8'})
+        statements = []
+
+        def mogrify(self, template, args):
+            return repr(args).encode('utf-8')
+
+        def execute(self, query, params=None):
+            self.statements.append(query)
+
+    curs = Cursor()
+    progress = ProgressBuffer(interval=60.0)
+
+    progress.report(1, iters=100, elapsed_ms=10.0)
+    progress.report(2, iters=50, elapsed_ms=10.0)
+    progress.report(1, iters=200, elapsed_ms=20.0)
+    progress.report(3, iters=10, elapsed_ms=1.0)
+    progress.discard(3)
+
+    assert progress.flush(curs) == 2
+    assert len(curs.statements) == 1
+    assert b"(1, 200, '20.0ms')" in curs.statements[0]
+
+    # nothing more is written until the interval has passed
+    progress.report(1, iters=300, elapsed_ms=30.0)
+    assert progress.flush(curs) == 0
+    assert progress.flush(curs, force=True) == 1
+
+
+def test_progress_buffer_flushes_on_a_timer():
+    pytest.importorskip('psycopg2')
+    from dp.server.progress import ProgressBuffer
+    import threading
+
+    written = threading.Event()
+
+    class Cursor:
+        connection = type('Connection', (), {'encoding': 'UTF8'})
+        statements = []
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+        def mogrify(self, template, args):
+            return repr(args).encode('utf-8')
+
+        def execute(self, query, params=None):
+            self.statements.append(query)
+            written.set()
+
+    class Connection:
+        def cursor(self):
+            return Cursor()
+
+    progress = ProgressBuffer(interval=0.05)
+    assert progress.report_interval < progress.interval
+
+    progress.report(1, iters=100, elapsed_ms=10.0)
+    progress.start(Connection())
+    try:
+        # the report is written without any further reports arriving
+        assert written.wait(timeout=5.0)
+    finally:
+        progress.close()
+
+    assert progress.pending == {}
+    assert b"AND result.in_progress" in Cursor.statements[0]
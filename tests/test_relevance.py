@@ -0,0 +1,72 @@
+from dp.audit import Arguments, ResultMsg
+from dp.relevance import relevant_projection
+from dp.run import run
+
+from .test_student import course_row
+
+
+def make_student(*courses):
+    return {"stnum": "123456", "courses": list(courses), "exceptions": []}
+
+
+spec = {
+    "name": "Test",
+    "type": "concentration",
+    "code": "140",
+    "result": {
+        "all": [
+            {"course": "DEPT 123"},
+            {
+                "from": "courses",
+                "where": {"subject": {"$eq": "DEPT"}},
+                "assert": {"count(courses)": {"$gte": 2}},
+            },
+        ],
+    },
+    "limit": [{"at most": 1, "where": {"subject": {"$eq": "LIMIT"}}}],
+}
+
+
+def audit(student):
+    return [m.result.to_dict() for m in run(Arguments(), student=student, area_spec=spec) if isinstance(m, ResultMsg)][0]
+
+
+def test_projection_drops_courses_the_area_cannot_see():
+    student = make_student(
+        course_row("DEPT 123", clbid="1"),
+        course_row("DEPT 234", clbid="2"),
+        course_row("LIMIT 101", clbid="3"),
+        course_row("OTHER 101", clbid="4"),
+    )
+
+    projected = relevant_projection(student, area_spec=spec)
+    assert [c['clbid'] for c in projected['courses']] == ['1', '2', '3']
+
+    assert audit(projected) == audit(student)
+
+
+def test_projection_ignores_changes_to_unrelated_courses():
+    before = make_student(course_row("DEPT 123", clbid="1"), course_row("OTHER 101", clbid="4", grade_code="IP"))
+    after = make_student(course_row("DEPT 123", clbid="1"), course_row("OTHER 101", clbid="4"), course_row("GENED 101", clbid="5"))
+
+    assert relevant_projection(before, area_spec=spec) == relevant_projection(after, area_spec=spec)
+
+    changed = make_student(course_row("DEPT 123", clbid="1", grade_code="A"), course_row("OTHER 101", clbid="4"))
+    assert relevant_projection(before, area_spec=spec) != relevant_projection(changed, area_spec=spec)
+
+
+def test_conditional_areas_keep_every_course():
+    conditional = {
+        **spec,
+        "result": {"all": [{"requirement": "Req"}]},
+        "requirements": {
+            "Req": {
+                "if": {"from": "courses", "where": {"subject": {"$eq": "OTHER"}}, "assert": {"count(courses)": {"$gte": 1}}},
+                "then": {"course": "DEPT 123"},
+                "else": {"course": "DEPT 234"},
+            },
+        },
+    }
+    student = make_student(course_row("DEPT 123", clbid="1"), course_row("OTHER 101", clbid="4"))
+
+    assert relevant_projection(student, area_spec=conditional)['courses'] == student['courses']
@@ -0,0 +1,65 @@
+import datetime
+
+import pytest
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('sentry_sdk')
+
+from dp.server.audit import ResultRow, insert_results  # noqa: E402
+from dp.server.result_cache import find_cached_results, result_cache_key  # noqa: E402
+
+
+class Cursor:
+    connection = type('Connection', (), {'encoding': 'UTF8'})
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.statements = []
+
+    def mogrify(self, template, args):
+        return repr(args).encode('utf-8')
+
+    def execute(self, query, params=None):
+        query = query.decode('utf-8') if isinstance(query, bytes) else query
+        self.statements.append((' '.join(query.split()), params))
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_result_cache_key_covers_the_student_and_the_area():
+    spec = {"name": "Test", "type": "concentration", "code": "140", "result": {"course": "DEPT 123"}}
+
+    key = result_cache_key(student={'stnum': '1', 'courses': []}, area_spec=spec, area_fingerprint='abc')
+
+    assert key == result_cache_key(student={'courses': [], 'stnum': '1'}, area_spec=spec, area_fingerprint='abc')
+    assert key != result_cache_key(student={'stnum': '2', 'courses': []}, area_spec=spec, area_fingerprint='abc')
+    assert key != result_cache_key(student={'stnum': '1', 'courses': []}, area_spec=spec, area_fingerprint='abd')
+
+
+def test_cached_results_are_copied():
+    curs = Cursor(rows=[
+        ('key-1', '1', '140', '2019-20', 4, '{}', 10, '00:00:01', '00:00:00.1', '1', '2', '{}', '{}', True, '3.00'),
+    ])
+
+    found = find_cached_results(curs, cache_keys=['key-1', 'key-2', 'key-1'])
+
+    assert list(found.keys()) == ['key-1']
+    assert sorted(curs.statements[0][1]['keys']) == ['key-1', 'key-2']
+
+    copy = found['key-1']
+    assert (copy.run, copy.iterations, copy.ok, copy.cache_key) == (4, 10, True, 'key-1')
+    assert isinstance(copy.ts, datetime.datetime)
+
+    assert find_cached_results(Cursor(), cache_keys=[]) == {}
+
+
+def test_cache_key_is_only_written_when_set():
+    curs = Cursor()
+    row = dict(student_id='1', area_code='140', catalog='2019-20', run=1, input_data='{}')
+
+    insert_results(curs, [ResultRow(**row), ResultRow(**row, cache_key='key')])
+
+    inserts = [statement for statement, params in curs.statements]
+    assert len(inserts) == 2
+    assert sum('claimed_courses, cache_key)' in statement for statement in inserts) == 1
@@ -0,0 +1,92 @@
+import pytest
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('sentry_sdk')
+
+from dp.server.audit import ResultRow  # noqa: E402
+from dp.server.writer import ResultWriter, WriteJob, save_results  # noqa: E402
+
+
+class RecordingConnection:
+    encoding = 'UTF8'
+
+    def __init__(self, fail_on=None, lost=()):
+        self.statements = []
+        self.fail_on = fail_on
+        # queue ids whose lease has been taken over by another worker
+        self.lost = set(lost)
+
+    def cursor(self):
+        return RecordingCursor(self)
+
+
+class RecordingCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def mogrify(self, template, args):
+        return repr(args).encode('utf-8')
+
+    def execute(self, query, params=None):
+        query = query.decode('utf-8') if isinstance(query, bytes) else query
+        statement = ' '.join(query.split())
+        self.connection.statements.append((statement, params))
+
+        if self.connection.fail_on and self.connection.fail_on in statement:
+            raise RuntimeError(statement)
+
+        if statement.startswith('DELETE'):
+            self.rowcount = len([i for i in params['ids'] if i not in self.connection.lost])
+
+
+def make_job(*ids):
+    rows = [ResultRow(student_id=str(i), area_code='140', catalog='2019-20', run=1, input_data='{}') for i in ids]
+    return WriteJob(rows=rows, queue_ids=list(ids), leased_by=42)
+
+
+def test_writer_saves_every_submitted_job():
+    conn = RecordingConnection()
+
+    writer = ResultWriter(connect=lambda: conn, max_pending=2).start()
+    for i in range(5):
+        writer.submit(make_job(i * 2, i * 2 + 1))
+    writer.close()
+
+    assert writer.error is None
+    assert writer.jobs_written == 5
+    assert writer.rows_written == 10
+
+    deleted = [params['ids'] for statement, params in conn.statements if statement.startswith('DELETE')]
+    assert sorted(i for ids in deleted for i in ids) == list(range(10))
+    assert all(params['leased_by'] == 42 for statement, params in conn.statements if statement.startswith('DELETE'))
+
+
+def test_failed_save_returns_items_to_the_queue():
+    conn = RecordingConnection(fail_on='INSERT INTO result')
+
+    assert save_results(conn.cursor(), [make_job(1, 2)]) is False
+
+    statements = [statement for statement, params in conn.statements]
+    assert 'ROLLBACK;' in statements
+    assert not any(s.startswith('DELETE') for s in statements)
+    assert conn.statements[-1][0].startswith('UPDATE public.queue SET leased_by = NULL')
+    assert conn.statements[-1][1] == {'ids': [1, 2], 'leased_by': 42}
+
+
+def test_lost_lease_discards_only_that_jobs_results():
+    conn = RecordingConnection(lost=[3])
+
+    assert save_results(conn.cursor(), [make_job(1, 2), make_job(3, 4)]) is False
+
+    statements = [statement for statement, params in conn.statements]
+    assert statements.count('ROLLBACK TO SAVEPOINT job;') == 1
+    assert statements.index('ROLLBACK TO SAVEPOINT job;') > max(i for i, s in enumerate(statements) if s.startswith('INSERT INTO result'))
+    assert statements[-1].startswith('UPDATE public.queue SET leased_by = NULL')
+    assert conn.statements[-1][1] == {'ids': [3, 4], 'leased_by': 42}
@@ -0,0 +1,152 @@
+import multiprocessing.sharedctypes
+import multiprocessing
+import time
+
+import pytest
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('sentry_sdk')
+
+from dp.server.scaling import PoolLoad, ScalingPolicy  # noqa: E402
+from dp.server.supervisor import Supervisor, WorkerSlot, WAITING  # noqa: E402
+
+
+def make_load(**changes):
+    load = dict(workers=2, busy=2, queued=0, cpu_per_audit=None, cpu_share=1.0, load_average=2.0, cpus=8)
+    load.update(changes)
+    return PoolLoad(**load)
+
+
+def idle(*, slot):
+    with slot.waiting():
+        time.sleep(60)
+
+
+def busy(*, slot):
+    time.sleep(60)
+
+
+def test_queue_depth_and_cpu_time_set_the_demand():
+    policy = ScalingPolicy(min_workers=1, max_workers=12, drain_seconds=60.0)
+
+    # without a measurement, one worker per queued item, up to one per core
+    assert policy.wanted(make_load(queued=3)) == 3
+    assert policy.wanted(make_load(queued=100)) == 8
+
+    # 100 audits of 3s each take 5 workers a minute
+    assert policy.wanted(make_load(queued=100, cpu_per_audit=3.0)) == 5
+    # or twice as many, if each worker only keeps half a core busy
+    assert policy.wanted(make_load(queued=100, cpu_per_audit=3.0, cpu_share=0.5)) == 10
+
+    assert policy.wanted(make_load(queued=0)) == 1
+
+
+def test_the_host_load_caps_the_pool():
+    policy = ScalingPolicy(min_workers=1, max_workers=8)
+
+    # two of our workers, and four cores' worth of something else
+    assert policy.wanted(make_load(queued=100, load_average=6.0)) == 4
+    # never fewer than the minimum
+    assert policy.wanted(make_load(queued=100, load_average=20.0)) == 1
+
+
+def test_scaling_down_waits_for_the_cool_off():
+    policy = ScalingPolicy(min_workers=1, max_workers=8, cool_off=300.0)
+
+    assert policy.decide(make_load(workers=4, queued=0), now=1000.0) == 4
+    assert policy.decide(make_load(workers=4, queued=0), now=1200.0) == 4
+
+    # wanting more workers restarts the cool-off
+    assert policy.decide(make_load(workers=4, queued=6), now=1250.0) == 6
+    assert policy.decide(make_load(workers=6, queued=0), now=1300.0) == 6
+    assert policy.decide(make_load(workers=6, queued=0), now=1599.0) == 6
+    assert policy.decide(make_load(workers=6, queued=0), now=1600.0) == 1
+
+
+def test_slots_add_up_audit_time():
+    usage = multiprocessing.sharedctypes.RawArray('d', 6)
+    queue_ids = multiprocessing.sharedctypes.RawArray('q', 2)
+    started_at = multiprocessing.sharedctypes.RawArray('d', 2)
+    slot = WorkerSlot(index=1, queue_ids=queue_ids, started_at=started_at, usage=usage)
+
+    slot.begin(1)
+    sum(range(100_000))
+    slot.begin(2)
+    slot.finish()
+    slot.finish()
+
+    assert list(usage[:3]) == [0, 0, 0]
+    assert usage[3] > 0
+    assert usage[4] >= usage[3] * 0.5
+    assert usage[5] == 2
+
+
+def make_slot():
+    states = multiprocessing.sharedctypes.RawArray('b', 1)
+    queue_ids = multiprocessing.sharedctypes.RawArray('q', 1)
+    started_at = multiprocessing.sharedctypes.RawArray('d', 1)
+    return WorkerSlot(index=0, queue_ids=queue_ids, started_at=started_at, states=states, lock=multiprocessing.Lock())
+
+
+def test_only_waiting_workers_can_be_retired():
+    slot = make_slot()
+    assert slot.retire() is False
+
+    with slot.waiting():
+        pass
+    assert slot.retire() is False
+
+    with slot.waiting(idle=False):
+        assert slot.retire() is False
+
+
+def test_a_retired_worker_stops_instead_of_working():
+    slot = make_slot()
+
+    with pytest.raises(SystemExit):
+        with slot.waiting():
+            assert slot.retire() is True
+            # the work arrives before the supervisor stops the worker
+
+    slot.reset()
+    assert slot.retire() is False
+
+
+def test_supervisor_resizes_the_pool():
+    policy = ScalingPolicy(min_workers=1, max_workers=3, cool_off=0.0)
+    supervisor = Supervisor(target=idle, kwargs={}, worker_count=1, on_failure=lambda *args: None, scaling=policy)
+    supervisor.start()
+
+    try:
+        supervisor.measure = lambda: make_load(workers=sum(p is not None for p in supervisor.processes), busy=0, queued=5, load_average=0.0)
+        supervisor.scale()
+        assert [p is not None and p.is_alive() for p in supervisor.processes] == [True, True, True]
+
+        deadline = time.time() + 10
+        while list(supervisor.states) != [WAITING] * 3:
+            assert time.time() < deadline
+            time.sleep(0.01)
+
+        supervisor.measure = lambda: make_load(workers=sum(p is not None for p in supervisor.processes), busy=0, queued=0, load_average=0.0)
+        supervisor.scale()
+        assert [p is not None for p in supervisor.processes] == [True, False, False]
+
+        # the stopped workers aren't replaced
+        supervisor.check()
+        assert [p is not None for p in supervisor.processes] == [True, False, False]
+    finally:
+        supervisor.stop()
+
+
+def test_supervisor_leaves_working_workers_alone():
+    policy = ScalingPolicy(min_workers=1, max_workers=2, cool_off=0.0)
+    supervisor = Supervisor(target=busy, kwargs={}, worker_count=2, on_failure=lambda *args: None, scaling=policy)
+    supervisor.start()
+
+    try:
+        # between audits, but not waiting for work: it may have a batch to save
+        supervisor.measure = lambda: make_load(workers=2, busy=0, queued=0, load_average=0.0)
+        supervisor.scale()
+        assert [p is not None and p.is_alive() for p in supervisor.processes] == [True, True]
+    finally:
+        supervisor.stop()
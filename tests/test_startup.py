@@ -0,0 +1,29 @@
+import subprocess
+import sys
+
+import pytest
+
+# Modules that the entry points should only import once they are needed.
+LAZY_MODULES = ['yaml', 'dotenv', 'markdown2', 'tqdm', 'readline', 'psycopg2', 'sentry_sdk']
+
+
+def modules_imported_by(module):
+    proc = subprocess.run(
+        [sys.executable, '-c', f'import sys, {module}; print("\\n".join(sys.modules))'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True,
+    )
+    return set(proc.stdout.splitlines())
+
+
+@pytest.mark.parametrize("module", ["dp.__main__", "dp.bin.batch", "dp.testbed.__main__"])
+def test_entry_points_defer_optional_imports(module):
+    imported = modules_imported_by(module)
+
+    assert [m for m in LAZY_MODULES if m in imported] == []
+
+
+def test_cli_defers_output_formatting():
+    imported = modules_imported_by('dp.__main__')
+
+    assert 'csv' not in imported
+    assert 'dp.stringify' not in imported
@@ -0,0 +1,105 @@
+from dp.data import Student, GradeCode
+from dp.data.student_cache import load_student
+
+
+def course_row(course, *, clbid, grade_code='B', grade_points='3.00'):
+    subject, number = course.split(' ')
+
+    return {
+        "attributes": [],
+        "clbid": clbid,
+        "course": course,
+        "course_type": "SE",
+        "credits": '1.00',
+        "crsid": f"<crsid={course}>",
+        "flag_gpa": True,
+        "flag_in_progress": False,
+        "flag_incomplete": False,
+        "flag_repeat": False,
+        "flag_stolaf": True,
+        "gereqs": [],
+        "grade_code": grade_code,
+        "grade_option": "grade",
+        "grade_points": grade_points,
+        "grade_points_gpa": grade_points,
+        "institution_short": "STOLAF",
+        "level": int(number) // 100 * 100,
+        "name": course,
+        "number": number,
+        "section": "",
+        "sub_type": "",
+        "subject": subject,
+        "term": "1",
+        "transcript_code": "",
+        "year": 2000,
+    }
+
+
+student_data = {
+    "stnum": "123456",
+    "courses": [
+        course_row("DEPT 234", clbid="2"),
+        course_row("DEPT 123", clbid="1", grade_code="F", grade_points="0.00"),
+        course_row("DEPT 345", clbid="3"),
+    ],
+}
+
+
+def test_transcript_views_share_instances():
+    student = Student.load(student_data)
+
+    assert [c.clbid for c in student.courses_with_failed] == ["1", "2", "3"]
+    assert [c.clbid for c in student.courses] == ["2", "3"]
+    assert all(c.grade_code is not GradeCode.F for c in student.courses)
+
+    with_failed = {c.clbid: c for c in student.courses_with_failed}
+    assert all(c is with_failed[c.clbid] for c in student.courses)
+
+
+def test_student_cache_roundtrip(tmp_path, monkeypatch):
+    first = load_student(student_data, code='140', cache_dir=str(tmp_path))
+    assert first == Student.load(student_data, code='140')
+
+    def fail(*args, **kwargs):
+        raise AssertionError("expected the student to be loaded from the cache")
+
+    monkeypatch.setattr(Student, 'load', fail)
+
+    second = load_student(student_data, code='140', cache_dir=str(tmp_path))
+    assert second == first
+    assert hash(second) == hash(first)
+
+
+def test_student_cache_is_keyed_by_area_code(tmp_path):
+    a = load_student(student_data, code='140', cache_dir=str(tmp_path))
+    b = load_student(student_data, code='150', cache_dir=str(tmp_path))
+
+    assert a.current_area_code == '140'
+    assert b.current_area_code == '150'
+
+
+def test_areas_audited_from_one_loaded_student_match_separate_loads():
+    from dp.audit import Arguments, ResultMsg
+    from dp.run import run
+
+    def area(code, course):
+        return {
+            "name": code, "type": "major", "code": code, "degree": "B.A.",
+            "result": {"all": [{"requirement": "Req"}]},
+            "requirements": {"Req": {"result": {"course": course}}},
+        }
+
+    areas = [area('140', 'DEPT 234'), area('150', 'DEPT 345')]
+
+    shared = Student.load(student_data)
+    results = {}
+    for spec in areas:
+        for mode, loaded in (('separate', None), ('shared', shared)):
+            msgs = [m for m in run(Arguments(), student=student_data, area_spec=spec, loaded=loaded) if isinstance(m, ResultMsg)]
+            results[spec['code'], mode] = msgs[0].result.to_dict()
+
+    for spec in areas:
+        assert results[spec['code'], 'shared'] == results[spec['code'], 'separate']
+
+    assert shared.for_area('150').current_area_code == '150'
+    assert shared.for_area('150').courses is shared.courses
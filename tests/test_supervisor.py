@@ -0,0 +1,65 @@
+import time
+import os
+
+import pytest
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('sentry_sdk')
+
+from dp.server.supervisor import Supervisor  # noqa: E402
+
+
+def hang(*, slot, queue_id):
+    slot.begin(queue_id)
+    time.sleep(60)
+
+
+def crash(*, slot, queue_id):
+    slot.begin(queue_id)
+    os._exit(3)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_supervisor_restarts_a_worker_that_overruns_the_time_limit():
+    failures = []
+    supervisor = Supervisor(target=hang, kwargs=dict(queue_id=7), worker_count=2, timeout=30.0, on_failure=lambda *args: failures.append(args))
+    supervisor.start()
+
+    try:
+        wait_for(lambda: all(slot.current() is not None for slot in supervisor.slots))
+        first = list(supervisor.processes)
+
+        supervisor.check()
+        assert failures == []
+
+        supervisor.check(now=time.time() + 60)
+        assert failures == [(7, 'audit exceeded the time limit of 30.0s')] * 2
+        assert supervisor.timeouts == 2
+        assert supervisor.restarts == 2
+
+        assert all(not p.is_alive() for p in first)
+        assert all(p.is_alive() for p in supervisor.processes)
+    finally:
+        supervisor.stop()
+
+
+def test_supervisor_replaces_a_crashed_worker():
+    failures = []
+    supervisor = Supervisor(target=crash, kwargs=dict(queue_id=9), worker_count=1, on_failure=lambda *args: failures.append(args))
+    supervisor.start()
+
+    try:
+        wait_for(lambda: not supervisor.processes[0].is_alive())
+
+        supervisor.check()
+        assert failures == [(9, 'worker exited with code 3 while auditing this item')]
+        assert supervisor.restarts == 1
+        assert len(supervisor.processes) == 1
+    finally:
+        supervisor.stop()